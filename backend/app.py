@@ -1,18 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from database import SessionLocal, SubwayOutlet
-from schemas import ChatbotRequest, SubwayOutletSchema
+from database import init_db
+from schemas import ChatbotRequest, ChatbotBatchRequest, ChatbotResponse, SubwayOutletSchema, OutletMarkerSchema, NearbyOutletSchema, OutletOverlapsSchema
+from spatial_index import SpatialIndex, DEFAULT_RADIUS_M
+from outlet_snapshot import OutletSnapshotStore, DEFAULT_REFRESH_SECONDS, DEFAULT_POLL_SECONDS
+from outlet_changes import OutletChangeConsumer, DEFAULT_POLL_SECONDS as DEFAULT_CHANGES_POLL_SECONDS, DEFAULT_BATCH_SIZE as DEFAULT_CHANGES_BATCH_SIZE
+from llm_client import OpenRouterClient, LLMError, parse_models, DEFAULT_MODEL, OPENROUTER_URL as DEFAULT_OPENROUTER_URL, DEFAULT_HEDGE_PERCENTILE, DEFAULT_FAILURE_THRESHOLD, DEFAULT_COOLDOWN_SECONDS
+from response_cache import create_response_cache, normalize_cache_query
+from single_flight import SingleFlight
+from compression import CompressionMiddleware, DEFAULT_MINIMUM_SIZE, negotiate
+from retrievers import RetrievedOutlet, create_retriever
+from session_store import SessionStore, is_follow_up, DEFAULT_TTL_SECONDS as DEFAULT_SESSION_TTL, DEFAULT_MAX_SESSIONS, DEFAULT_MAX_OUTLETS as DEFAULT_SESSION_OUTLETS, DEFAULT_SUMMARY_CHARS
+from prompt_context import build_prompt_context, DEFAULT_TOKEN_BUDGET, DEFAULT_MAX_OUTLETS
+from resources import LazyResource, DEFAULT_RETRIES, DEFAULT_BACKOFF_SECONDS
+from metrics import start_request, span, mark, count_error, render_metrics, CACHE_LOOKUPS, COALESCED_REQUESTS, PROMPT_TOKENS, RESPONSE_CHARS, RETRIEVED_OUTLETS
+from contextlib import asynccontextmanager
 import weaviate
 import weaviate.classes as wvc
 import os
 from dotenv import load_dotenv
-import requests
 import logging
-from typing import List
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import orjson
+import hashlib
+import asyncio
 import re
-from datetime import datetime
+import time
+from urllib.parse import urlparse
+from operating_hours import WEEKDAY_LABELS, format_minutes, parse_time_query
 
 # ✅ Load environment variables
 load_dotenv()
@@ -20,10 +36,90 @@ load_dotenv()
 # ✅ Weaviate Configuration
 WEAVIATE_URL = os.getenv("WEAVIATE_URL")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY")
+WEAVIATE_GRPC_PORT = int(os.getenv("WEAVIATE_GRPC_PORT", 50051))  # Only used for self-hosted (http://) Weaviate
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")  # OpenRouter API key for Llama-3
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", DEFAULT_OPENROUTER_URL)
+
+# ✅ Outlet Snapshot Configuration
+OUTLET_REFRESH_SECONDS = float(os.getenv("OUTLET_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS))  # 0 disables background reloads
+OUTLET_RELOAD_TOKEN = os.getenv("OUTLET_RELOAD_TOKEN")  # Optional shared secret for POST /outlets/reload
+OUTLET_SNAPSHOT_FILE = os.getenv("OUTLET_SNAPSHOT_FILE")  # e.g. /dev/shm/subway_outlets.snap: one memory-mapped copy shared by all workers
+OUTLET_SNAPSHOT_POLL_SECONDS = float(os.getenv("OUTLET_SNAPSHOT_POLL_SECONDS", DEFAULT_POLL_SECONDS))  # workers check the file for new data
+OUTLET_CHANGES_POLL_SECONDS = float(os.getenv("OUTLET_CHANGES_POLL_SECONDS", DEFAULT_CHANGES_POLL_SECONDS))  # 0 disables the outbox consumer
+OUTLET_CHANGES_BATCH_SIZE = int(os.getenv("OUTLET_CHANGES_BATCH_SIZE", DEFAULT_CHANGES_BATCH_SIZE))  # outbox rows applied per step
+
+# ✅ Retriever Configuration
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "weaviate").lower()  # weaviate | local
+RETRIEVER_VECTORS_DIR = os.getenv("RETRIEVER_VECTORS_DIR", "vector_index")  # memory-mapped vectors (local backend)
+RETRIEVAL_ALPHA = float(os.getenv("RETRIEVAL_ALPHA", 0.7))  # vector weight in hybrid search (tune with benchmark.retrieval_eval)
+RETRIEVAL_LIMIT = int(os.getenv("RETRIEVAL_LIMIT", 100))  # outlets retrieved per query before reranking
+
+# ✅ Prompt Context Configuration
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))  # estimated tokens of outlet data
+PROMPT_MAX_OUTLETS = int(os.getenv("PROMPT_MAX_OUTLETS", DEFAULT_MAX_OUTLETS))
+
+# ✅ Structured Answer Configuration
+COUNT_LIST_MAX_OUTLETS = int(os.getenv("COUNT_LIST_MAX_OUTLETS", 20))  # a count without a location lists names only up to this many
+
+# ✅ Upstream Timeouts & Concurrency
+WEAVIATE_QUERY_TIMEOUT = int(os.getenv("WEAVIATE_QUERY_TIMEOUT", 10))  # seconds
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))  # seconds to wait for a completion
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))  # seconds to open a connection
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 64))  # LLM calls in flight per worker
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))  # pooled keep-alive connections
+
+# ✅ LLM Model Routing (hedged requests, fallback models, circuit breakers)
+LLM_MODELS = parse_models(os.getenv("LLM_MODELS", DEFAULT_MODEL), LLM_TIMEOUT)  # "model@budget_seconds,..." in preference order
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", DEFAULT_HEDGE_PERCENTILE))  # hedge calls slower than this
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", DEFAULT_FAILURE_THRESHOLD))  # consecutive failures → skip model
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", DEFAULT_COOLDOWN_SECONDS))  # seconds a model is skipped
+
+# ✅ Chatbot Response Cache Configuration
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory | sqlite | none
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.db")  # shared by workers (sqlite backend)
+
+# ✅ Conversation Session Configuration (per worker)
+SESSION_TTL = float(os.getenv("SESSION_TTL", DEFAULT_SESSION_TTL))  # seconds of inactivity before a session is dropped
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", DEFAULT_MAX_SESSIONS))  # LRU bound
+SESSION_MAX_OUTLETS = int(os.getenv("SESSION_MAX_OUTLETS", DEFAULT_SESSION_OUTLETS))  # outlet ids kept per session
+SESSION_SUMMARY_CHARS = int(os.getenv("SESSION_SUMMARY_CHARS", DEFAULT_SUMMARY_CHARS))  # rolling summary per session
+
+# ✅ Batch Chatbot Configuration
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 5000))  # queries per /chatbot/batch request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 16))  # default Llama-3 calls in flight per batch
+
+# ✅ Response Compression Configuration
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", DEFAULT_MINIMUM_SIZE))  # bytes; smaller bodies go out as-is
+
+# ✅ Startup Configuration
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() == "true"  # preload data + connections in the background
+INIT_RETRIES = int(os.getenv("INIT_RETRIES", DEFAULT_RETRIES))  # attempts per upstream initialization
+INIT_RETRY_BACKOFF = float(os.getenv("INIT_RETRY_BACKOFF", DEFAULT_BACKOFF_SECONDS))  # seconds, doubled per attempt
+INIT_RETRY_INTERVAL = float(os.getenv("INIT_RETRY_INTERVAL", 10))  # seconds between background reconnects after warm-up
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", 1.0))  # seconds allowed for the readiness probe's upstream ping
+
+# ✅ Lifespan: nothing connects at import; upstreams are initialized lazily (or by the warm-up task)
+@asynccontextmanager
+async def lifespan(app):
+    outlet_store.start_background_refresh()
+    outlet_changes.start()
+    app.state.warmup = asyncio.create_task(warm_up()) if WARMUP_ON_START else None
+    app.state.reconnect = asyncio.create_task(reconnect(app.state.warmup))
+    yield
+    for task in (app.state.warmup, app.state.reconnect):
+        if task is not None:
+            task.cancel()
+    await outlet_changes.stop()
+    outlet_store.stop_background_refresh()
+    if weaviate_connection is not None:
+        await weaviate_connection.close()
+    await llm.close()
+    logging.info("✅ Weaviate & OpenRouter clients closed.")
 
 # ✅ Initialize FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # ✅ Allow frontend requests (Fix CORS policy)
 app.add_middleware(
@@ -32,339 +128,838 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing"],  # ✅ Readable by the frontend's fetch()
 )
 
+# ✅ Negotiated brotli/gzip compression for large outlet lists and chatbot answers (SSE streams are left alone)
+app.add_middleware(CompressionMiddleware, paths=("/outlets", "/chatbot"), minimum_size=COMPRESSION_MIN_SIZE)
+
 # ✅ Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# ✅ Database Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# ✅ Subway Outlet API Endpoints
-@app.get("/outlets", response_model=List[SubwayOutletSchema])
-def get_all_outlets(db: Session = Depends(get_db)):
-    outlets = db.query(SubwayOutlet).all()
-    if not outlets:
-        raise HTTPException(status_code=404, detail="No Subway outlets found")
-    return outlets
-
-# @app.get("/outlets/{outlet_id}", response_model=SubwayOutletSchema)
-# def get_outlet(outlet_id: int, db: Session = Depends(get_db)):
-#     outlet = db.query(SubwayOutlet).filter(SubwayOutlet.id == outlet_id).first()
-#     if not outlet:
-#         raise HTTPException(status_code=404, detail="Outlet not found")
-#     return outlet
-
-# ✅ Initialize Weaviate Client with Authentication
-client = weaviate.connect_to_weaviate_cloud(
-    cluster_url=WEAVIATE_URL,
-    auth_credentials=wvc.init.Auth.api_key(WEAVIATE_API_KEY),
+# ✅ Outlet Snapshot (the outlet table, pre-serialized and shared by every request)
+outlet_store = OutletSnapshotStore(
+    refresh_seconds=OUTLET_REFRESH_SECONDS,
+    snapshot_path=OUTLET_SNAPSHOT_FILE,
+    poll_seconds=OUTLET_SNAPSHOT_POLL_SECONDS,
 )
 
-# ✅ Check if Weaviate is accessible
-try:
-    client.is_ready()
-    logging.info("✅ Successfully connected to Weaviate!")
-except Exception as e:
-    logging.error(f"❌ Weaviate connection failed: {str(e)}", exc_info=True)
-    raise RuntimeError("Weaviate is not reachable. Ensure it's running and API key is correct.")
+async def load_outlet_data():
+    await asyncio.to_thread(init_db)
+    return await asyncio.to_thread(outlet_store.load)
 
-# ✅ Convert Time to 24-Hour Format for Proper Sorting
-def convert_to_24_hour(time_str):
-    try:
-        return datetime.strptime(time_str, "%I:%M %p").time()
-    except ValueError:
-        return None  # Return None if conversion fails
-# Mapping short-form days to full names for better interpretation
-day_mapping = {
-    "Mon": "Monday", "Tue": "Tuesday", "Wed": "Wednesday", "Thu": "Thursday",
-    "Fri": "Friday", "Sat": "Saturday", "Sun": "Sunday", "PH": "Public Holiday"
-}
-
-def extract_closing_time(hours_text):
-    """
-    Extracts the latest closing time from Subway operating hours.
-    Handles:
-    - Short-form days (e.g., "Mon - Sun")
-    - Full-form days (e.g., "Monday - Sunday")
-    - Multiple closing times
-    - Public holiday closing times
+outlet_data = LazyResource("Outlet data", load_outlet_data, retries=INIT_RETRIES, backoff=INIT_RETRY_BACKOFF)
+
+# ✅ Subway Outlet API Endpoints
+OUTLET_FIELDS = {"full": SubwayOutletSchema, "marker": OutletMarkerSchema}
+
+@app.get("/outlets", response_model=List[SubwayOutletSchema] | List[OutletMarkerSchema])
+def get_all_outlets(
+    request: Request,
+    fields: str = Query("full", pattern="^(full|marker)$"),
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    after: Optional[int] = Query(None, description="Keyset cursor: last outlet id of the previous page"),
+    limit: Optional[int] = Query(None, gt=0, le=5000),
+    if_none_match: Optional[str] = Header(None),
+):
     """
-    try:
-        # Normalize text (replace en-dash with hyphen, fix spaces)
-        hours_text = re.sub(r"–", "-", hours_text)  # Convert en-dash to hyphen
-        hours_text = re.sub(r"\s+", " ", hours_text).strip()  # Normalize spaces
-        
-        # Convert short-form days (Mon-Sun) to full names
-        for short, full in day_mapping.items():
-            hours_text = re.sub(rf"\b{short}\b", full, hours_text)  # Replace short day names
-        
-        # Extract time entries (e.g., "8:00 AM", "10:30 PM")
-        time_patterns = re.findall(r"(\d{1,2}:\d{2}\s?[APMapm]{2})", hours_text)
-
-        if not time_patterns:
-            return None, None  # No valid time format found
-
-        closing_times = []
-        public_holiday_times = []
-
-        # Identify public holiday times separately
-        is_public_holiday = "public holiday" in hours_text.lower()
-
-        for time_str in time_patterns:
-            try:
-                closing_time = datetime.strptime(time_str.strip(), "%I:%M %p").time()
+    Outlets ordered by id. Optional viewport filter (`south`, `west`, `north`, `east`),
+    `fields=marker` projection and keyset pagination (`after` + `limit`, next cursor in `X-Next-Cursor`).
+    """
+    snapshot = outlet_store.current()
+    if not snapshot.outlets:
+        raise HTTPException(status_code=404, detail="No Subway outlets found")
 
-                if is_public_holiday:
-                    public_holiday_times.append(closing_time)
-                else:
-                    closing_times.append(closing_time)
-            except ValueError:
-                continue  # Skip invalid formats
+    bbox = (south, west, north, east)
+    if any(edge is not None for edge in bbox):
+        if any(edge is None for edge in bbox):
+            raise HTTPException(status_code=422, detail="Bounding box needs south, west, north and east")
+        if south > north or west > east:
+            raise HTTPException(status_code=422, detail="Bounding box must have south <= north and west <= east")
+    else:
+        bbox = None
+
+    # ✅ Plain `GET /outlets`: the pre-serialized (and pre-compressed) snapshot body
+    if fields == "full" and bbox is None and after is None and limit is None:
+        encoding = negotiate(request.headers.get("accept-encoding")) if len(snapshot.body) >= COMPRESSION_MIN_SIZE else None
+        etag = f"W/{snapshot.etag}" if encoding else snapshot.etag
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if snapshot.matches(if_none_match):
+            return Response(status_code=304, headers=headers)  # ✅ Client copy is still current
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(content=snapshot.encoded_body(encoding), media_type="application/json", headers=headers)
+        return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+    # ✅ Same snapshot + same query = same page, so the ETag derives from both
+    query_key = f"{fields}|{bbox}|{after}|{limit}"
+    etag = f'"{snapshot.version}-{hashlib.sha1(query_key.encode()).hexdigest()[:8]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if snapshot.matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    outlets, next_after = snapshot.page(bbox, after, limit)
+    if next_after is not None:
+        headers["X-Next-Cursor"] = str(next_after)
+
+    schema = OUTLET_FIELDS[fields]
+    rows = [outlet.model_dump(include=schema.model_fields.keys()) for outlet in outlets]
+    return Response(content=orjson.dumps(rows), media_type="application/json", headers=headers)
+
+@app.post("/outlets/reload")
+def reload_outlets(x_reload_token: Optional[str] = Header(None)):
+    """Reloads the outlet snapshot from MySQL right away (e.g. after a scrape)."""
+    if OUTLET_RELOAD_TOKEN and x_reload_token != OUTLET_RELOAD_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid reload token")
+    snapshot = outlet_store.reload()
+    return {"version": snapshot.version, "count": len(snapshot.outlets), "data_version": outlet_store.data_version}
+
+async def get_outlet_snapshot():
+    """Current snapshot without blocking the event loop (loads from MySQL in a thread if needed)."""
+    return outlet_store.loaded or await asyncio.to_thread(outlet_store.current)
+
+# ✅ Spatial Index (rebuilt with every new outlet snapshot)
+def get_spatial_index():
+    return outlet_store.current().spatial_index
+
+def to_nearby(results):
+    return [NearbyOutletSchema(**outlet.model_dump(), distance_m=round(distance, 1)) for outlet, distance in results]
+
+@app.get("/outlets/nearby", response_model=List[NearbyOutletSchema])
+def get_nearby_outlets(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(DEFAULT_RADIUS_M, gt=0, le=500000),
+    limit: int = Query(100, gt=0, le=1000),
+    index: SpatialIndex = Depends(get_spatial_index),
+):
+    """Outlets within `radius` meters of (lat, lng), nearest first."""
+    return to_nearby(index.within_radius(lat, lng, radius, limit=limit))
+
+@app.get("/outlets/nearest", response_model=List[NearbyOutletSchema])
+def get_nearest_outlets(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, gt=0, le=100),
+    index: SpatialIndex = Depends(get_spatial_index),
+):
+    """The `k` outlets closest to (lat, lng)."""
+    return to_nearby(index.nearest(lat, lng, k))
+
+@app.get("/outlets/overlaps", response_model=OutletOverlapsSchema)
+def get_outlet_overlaps(
+    radius: float = Query(DEFAULT_RADIUS_M, gt=0, le=50000),
+    index: SpatialIndex = Depends(get_spatial_index),
+):
+    """Outlet pairs within `radius` meters of each other (the map's highlighted circles)."""
+    pairs = index.overlap_pairs(radius)
+    highlighted_ids = sorted({outlet_id for a, b, _ in pairs for outlet_id in (a, b)})
+    return {"radius_m": radius, "pairs": [(a, b, round(d, 1)) for a, b, d in pairs], "highlighted_ids": highlighted_ids}
+
+@app.get("/outlets/{outlet_id}", response_model=SubwayOutletSchema)
+def get_outlet(outlet_id: int):
+    """One outlet's full details (the map loads these when a marker's popup opens)."""
+    outlet = outlet_store.current().by_id.get(outlet_id)
+    if not outlet:
+        raise HTTPException(status_code=404, detail="Outlet not found")
+    return outlet
+
+# ✅ Initialize async Weaviate Client with Authentication (connected on startup, only for the Weaviate retriever)
+def create_weaviate_client():
+    additional_config = wvc.init.AdditionalConfig(
+        timeout=wvc.init.Timeout(init=10, query=WEAVIATE_QUERY_TIMEOUT, insert=60)
+    )
+    # ✅ Plain http:// URLs point at a self-hosted Weaviate (local Docker, benchmark stand-in)
+    if WEAVIATE_URL and WEAVIATE_URL.startswith("http://"):
+        parsed = urlparse(WEAVIATE_URL)
+        return weaviate.use_async_with_local(
+            host=parsed.hostname,
+            port=parsed.port or 8080,
+            grpc_port=WEAVIATE_GRPC_PORT,
+            auth_credentials=wvc.init.Auth.api_key(WEAVIATE_API_KEY) if WEAVIATE_API_KEY else None,
+            additional_config=additional_config,
+        )
+    return weaviate.use_async_with_weaviate_cloud(
+        cluster_url=WEAVIATE_URL,
+        auth_credentials=wvc.init.Auth.api_key(WEAVIATE_API_KEY),
+        additional_config=additional_config,
+    )
+
+client = create_weaviate_client() if RETRIEVER_BACKEND == "weaviate" else None
+
+# ✅ Retriever (Weaviate Cloud hybrid search, or in-process BM25 + dense vectors)
+retriever = create_retriever(
+    RETRIEVER_BACKEND,
+    weaviate_client=client,
+    snapshot_provider=get_outlet_snapshot,
+    vectors_dir=RETRIEVER_VECTORS_DIR,
+)
 
-        normal_latest = max(closing_times) if closing_times else None
-        holiday_latest = max(public_holiday_times) if public_holiday_times else None
-        
-        return normal_latest, holiday_latest
+# ✅ Shared OpenRouter Client (pooled keep-alive connections, bounded concurrency, hedged model routing)
+llm = OpenRouterClient(
+    OPENROUTER_API_KEY,
+    timeout=LLM_TIMEOUT,
+    connect_timeout=LLM_CONNECT_TIMEOUT,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_connections=LLM_MAX_CONNECTIONS,
+    url=OPENROUTER_URL,
+    models=LLM_MODELS,
+    hedge_percentile=LLM_HEDGE_PERCENTILE,
+    failure_threshold=LLM_CIRCUIT_FAILURES,
+    cooldown=LLM_CIRCUIT_COOLDOWN,
+)
 
-    except Exception as e:
-        print(f"❌ Error parsing operating hours: {str(e)}")
-        return None, None  # Return None on error
+# ✅ Chatbot Response Cache (keyed on normalized query + outlet data version)
+response_cache = create_response_cache(
+    RESPONSE_CACHE_BACKEND,
+    ttl=RESPONSE_CACHE_TTL,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    path=RESPONSE_CACHE_PATH,
+)
 
+# ✅ Connect to Weaviate on first use (retried; an outage no longer crashes the worker)
+async def connect_weaviate():
+    await client.connect()
+    if not await client.is_ready():
+        raise RuntimeError("Weaviate is not reachable. Ensure it's running and API key is correct.")
+    return client
+
+async def close_weaviate(connected_client):
+    await connected_client.close()
+
+weaviate_connection = LazyResource(
+    "Weaviate", connect_weaviate, close=close_weaviate, check=lambda connected_client: connected_client.is_ready(),
+    retries=INIT_RETRIES, backoff=INIT_RETRY_BACKOFF,
+) if client is not None else None
+
+# ✅ Change Outbox Consumer: applies scraped changes to the snapshot and Weaviate within seconds
+outlet_changes = OutletChangeConsumer(
+    outlet_store,
+    weaviate_connection=weaviate_connection,
+    poll_seconds=OUTLET_CHANGES_POLL_SECONDS,
+    batch_size=OUTLET_CHANGES_BATCH_SIZE,
+)
+
+def required_resources():
+    return [outlet_data] + ([weaviate_connection] if weaviate_connection is not None else [])
+
+def held(resource):
+    """True if the request path already has `resource` (requests read `outlet_store` directly, not `outlet_data`)."""
+    return outlet_store.loaded is not None if resource is outlet_data else resource.ready
+
+# ✅ Warm-up: load outlet data, connect upstreams and run one search before reporting ready
+async def warm_up():
+    started = time.perf_counter()
+    results = await asyncio.gather(*(resource.get() for resource in required_resources()), llm.warm_up(), return_exceptions=True)
+    if all(resource.ready for resource in required_resources()):
+        await retrieve_relevant_outlets("subway", limit=1)  # ✅ Builds the local index / opens the gRPC channel
+    failed = [result for result in results if isinstance(result, Exception)]
+    logging.info(f"✅ Warm-up finished in {time.perf_counter() - started:.2f}s ({len(failed)} upstream(s) unavailable)")
+
+# ✅ Reconnect: initializes upstreams the warm-up skipped or couldn't reach, so readiness turns green without a probe doing the work
+async def reconnect(warmup):
+    if warmup is not None:
+        await asyncio.gather(warmup, return_exceptions=True)
+    while True:
+        await asyncio.sleep(INIT_RETRY_INTERVAL)
+        pending = [resource for resource in required_resources() if not held(resource)]
+        await asyncio.gather(*(resource.get() for resource in pending), return_exceptions=True)
+
+# ✅ Health Endpoints
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving requests (no upstream checks)."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Ready once outlet data is loaded and the retriever's upstream is connected (503 until then).
+    Only reports state the worker already holds (plus a `READINESS_TIMEOUT` ping); it never connects or loads anything.
+    """
+    warmup = getattr(app.state, "warmup", None)
+    if warmup is not None and not warmup.done():
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+
+    resources = required_resources()
+    alive = await asyncio.gather(*(
+        resource.probe(READINESS_TIMEOUT) if resource is not outlet_data else asyncio.sleep(0, held(resource))
+        for resource in resources
+    ))
+    ready = all(alive)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "unavailable",
+            "resources": {r.name: {**r.status(), "ready": ok} for r, ok in zip(resources, alive)},
+        },
+    )
 
 # ✅ Hybrid Search Function (Vector + Keyword Search + Filtering)
-def retrieve_relevant_outlets(query_text, alpha=0.7, limit=100):
+async def retrieve_relevant_outlets(query_text, alpha=None, limit=None):
     """
-    Performs Hybrid Search in Weaviate.
-    - `alpha=0.7` → 70% Vector Search, 30% Keyword Search
+    Performs Hybrid Search with the configured retriever (`RETRIEVER_BACKEND`).
+    - `alpha=0.7` (`RETRIEVAL_ALPHA`) → 70% Vector Search, 30% Keyword Search
+    - `limit` defaults to `RETRIEVAL_LIMIT`
     """
+    alpha = RETRIEVAL_ALPHA if alpha is None else alpha
+    limit = RETRIEVAL_LIMIT if limit is None else limit
     try:
-        subway_outlets = client.collections.get("SubwayOutlet")
-
-        response = subway_outlets.query.hybrid(
-            query=query_text,
-            alpha=alpha,
-            return_metadata=wvc.query.MetadataQuery(score=False),  # ✅ Score removed
-            limit=limit
-        )
-
-        return response.objects if response.objects else []  # Return relevant objects
+        if weaviate_connection is not None:
+            await weaviate_connection.get()  # ✅ Connects on first use
+        return await retriever.search(query_text, alpha=alpha, limit=limit)  # Return relevant objects
 
     except Exception as e:
-        logging.error(f"❌ Error querying Weaviate: {str(e)}", exc_info=True)
+        logging.error(f"❌ Error querying {RETRIEVER_BACKEND} retriever: {str(e)}", exc_info=True)
+        count_error("retrieval")
         return []
 
 # ✅ Chatbot Endpoint using Llama 3 (OpenRouter API)
-def query_openrouter_llama(prompt):
+async def query_openrouter_llama(prompt):
     """
     Calls OpenRouter API with Llama 3.3 70B Instruct.
     """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "meta-llama/llama-3.3-70b-instruct:free",
-        "prompt": prompt,
-        "max_tokens": 1000,
-        "temperature": 0.1,
-        "stop": ["User Query:"]
-    }
+    return await llm.complete(prompt)
 
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 200:
-            return response.json().get("choices", [{}])[0].get("text", "No response received.")
-
-        logging.error(f"❌ OpenRouter API Error: {response.status_code}, {response.text}")
-        return f"Error: {response.status_code}, {response.text}"
+def extract_location(query):
+    location_match = re.search(r"in ([\w\s]+)", query, re.IGNORECASE)
+    return location_match.group(1).strip().lower() if location_match else None
 
-    except Exception as e:
-        logging.error(f"❌ Failed to connect to OpenRouter API: {str(e)}", exc_info=True)
-        return f"Error: {str(e)}"
+def location_scope(query, snapshot):
+    """
+    (label, outlet ids) for the place named in the query, or (None, None) if it names none.
+    """
+    location_filter = extract_location(query)
+    terms, outlet_ids = snapshot.gazetteer.lookup(location_filter) if location_filter else ([], None)
+    if not terms:
+        return None, None
+    return snapshot.gazetteer.describe(terms), outlet_ids
 
-def handle_count_query(query, relevant_outlets):
+def handle_count_query(query, snapshot, candidates=None):
     """
     Handles queries that ask for a count of Subway outlets.
-    Dynamically filters locations based on exact phrase matching in addresses.
+    Answered from the snapshot's gazetteer (areas, postcodes, malls, states → outlet ids),
+    so every matching outlet is counted and Weaviate is never called.
+    `candidates` limits the count to a follow-up's previous result set.
+    Without a location, only the count is returned unless at most `COUNT_LIST_MAX_OUTLETS` outlets match.
     """
-    location_match = re.search(r"in ([\w\s]+)", query, re.IGNORECASE)
-    location_filter = location_match.group(1).strip().lower() if location_match else None
-
-    def is_exact_location_match(address, location_filter):
-        """
-        Returns True if the full location phrase matches anywhere in the address.
-        Fixes the issue with multi-word locations like 'Kuala Lumpur'.
-        """
-        if not address:
-            return False
-
-        address = address.lower()
-        location_filter = location_filter.lower()
-
-        # ✅ Direct phrase matching instead of word splitting
-        return location_filter in address  
+    location_filter = extract_location(query)
 
     if location_filter:
-        filtered_outlets = [
-            outlet for outlet in relevant_outlets
-            if is_exact_location_match(outlet.properties.get('address', ''), location_filter)
-        ]
+        terms, outlet_ids = snapshot.gazetteer.lookup(location_filter)
+        if terms:
+            location_label = snapshot.gazetteer.describe(terms)
+        else:
+            # ✅ Unknown phrase: fall back to exact phrase matching in addresses
+            outlet_ids = snapshot.gazetteer.substring_lookup(location_filter)
+            location_label = location_filter.title()
     else:
-        filtered_outlets = relevant_outlets  # No specific location in query
-
+        outlet_ids = snapshot.by_id.keys()  # No specific location in query
+        location_label = "total"
+    if candidates is not None:
+        outlet_ids = candidates & set(outlet_ids)
+
+    if location_label == "total" and len(outlet_ids) > COUNT_LIST_MAX_OUTLETS:
+        # ✅ Count only: listing every outlet nationwide would be a wall of names (and decode every row)
+        return {
+            "response": f"<p>There are <b>{len(outlet_ids)}</b> Subway outlets in total. "
+                        f"Ask about an area, mall or postcode to see which ones.</p>",
+            "outlet_ids": sorted(outlet_ids),
+        }
+
+    filtered_outlets = sorted((snapshot.by_id[outlet_id] for outlet_id in outlet_ids), key=lambda outlet: outlet.name)
     total_count = len(filtered_outlets)
 
     if total_count == 0:
-        return {"response": f"<p>❌ There are no Subway outlets matching your search.</p>"}
+        return {"response": f"<p>❌ There are no Subway outlets matching your search.</p>", "outlet_ids": []}
 
     # ✅ Only return outlet names and count
-    outlet_names = [outlet.properties.get('name', 'Unknown') for outlet in filtered_outlets]
+    location_text = "" if location_label == "total" else f" in <b>{location_label}</b>"
 
     # ✅ Handle singular/plural wording
     if total_count == 1:
         response_text = f"""
-        <p>There is <b>1</b> Subway outlet in <b>{location_filter.title()}</b>, 
-        located at <b>{outlet_names[0]}</b>.</p>
+        <p>There is <b>1</b> Subway outlet{location_text}, 
+        located at <b>{filtered_outlets[0].name}</b>.</p>
         """
     else:
         response_text = f"""
-        <p>There are <b>{total_count}</b> Subway outlets in <b>{location_filter.title()}</b>, located at:</p>
+        <p>There are <b>{total_count}</b> Subway outlets{location_text}, located at:</p>
         <ul>
-            {''.join(f'<li>🏪 <b>{name}</b></li>' for name in outlet_names)}
+            {''.join(snapshot.fragments[outlet.id].list_item for outlet in filtered_outlets)}
         </ul>
         """
-    return {"response": response_text}
+    return {"response": response_text, "outlet_ids": [outlet.id for outlet in filtered_outlets]}
 
-@app.post("/chatbot")
-def chatbot_query(request: ChatbotRequest):
+def scope_to_candidates(outlet_ids, candidates):
+    """Narrows a place's outlet ids (None = anywhere) to a follow-up's previous result set."""
+    if candidates is None:
+        return outlet_ids
+    return candidates if outlet_ids is None else outlet_ids & candidates
+
+def handle_latest_closing_query(query, snapshot, candidates=None):
     """
-    Process user queries using Hybrid Search & OpenRouter's Llama-3.
+    Handles "closes the latest" queries from the snapshot's opening-hours index.
+    Scoped to the place named in the query (if any) and to a weekday if one is named.
+    Returns None if no outlet has a parseable closing time (falls back to Llama-3).
     """
-    try:
-        query = request.query.strip().lower()
-        if not query:
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
+    location_label, outlet_ids = location_scope(query, snapshot)
+    outlet_ids = scope_to_candidates(outlet_ids, candidates)
+    weekday = next((i for i, day in enumerate(WEEKDAY_LABELS) if day.lower() in query), None)
+
+    latest_closing_time, latest_ids = snapshot.hours_index.closes_latest(weekday, candidates=outlet_ids)
+    if not latest_ids:
+        return None
+
+    response_list = [snapshot.fragments[i].card(weekday) for i in latest_ids]
+    scope = f" in <b>{location_label}</b>" if location_label else ""
+    day = f" on {WEEKDAY_LABELS[weekday]}" if weekday is not None else ""
+    return {
+        "response": f"The latest closing Subway outlet(s){scope}{day} (until {format_minutes(latest_closing_time)}): "
+                    f"<br>{'<br>'.join(response_list)}",
+        "outlet_ids": latest_ids,
+    }
 
-        logging.info(f"🔍 Received query: {query}")
+def handle_open_at_query(query, snapshot, candidates=None):
+    """
+    Handles "open now" / "open at 11pm on sunday" queries from the opening-hours index.
+    Returns None if the query names no time (falls back to Llama-3).
+    """
+    moment = parse_time_query(query)
+    if moment is None:
+        return None
+    weekday, minute, public_holiday = moment
+
+    location_label, outlet_ids = location_scope(query, snapshot)
+    outlet_ids = scope_to_candidates(outlet_ids, candidates)
+    open_ids = snapshot.hours_index.open_at(weekday, minute, public_holiday)
+    if outlet_ids is not None:
+        open_ids = open_ids & outlet_ids
+
+    when = f"{WEEKDAY_LABELS[weekday]}{' (public holiday)' if public_holiday else ''} at {format_minutes(minute)}"
+    scope = f" in <b>{location_label}</b>" if location_label else ""
+    if not open_ids:
+        return {"response": f"<p>❌ No Subway outlets{scope} are open on {when}.</p>", "outlet_ids": []}
+
+    open_outlets = sorted((snapshot.by_id[i] for i in open_ids), key=lambda outlet: outlet.name)
+    response_list = [snapshot.fragments[outlet.id].card(weekday) for outlet in open_outlets]
+    return {
+        "response": f"<b>{len(open_outlets)}</b> Subway outlet(s){scope} open on {when}: <br>{'<br>'.join(response_list)}",
+        "outlet_ids": [outlet.id for outlet in open_outlets],
+    }
 
+def build_llm_prompt(query, relevant_outlets, snapshot=None, history=None):
+    """
+    Builds the Llama-3 prompt for general queries from the retrieved outlets.
+    Only the outlets most relevant to the query are kept, as compact text lines
+    (precompiled on the snapshot when available), within `PROMPT_TOKEN_BUDGET` estimated tokens.
+    `history` is a session's compact conversation summary (follow-up questions only).
+    Returns (prompt, ids of the outlets in the prompt).
+    """
+    context = build_prompt_context(
+        query, relevant_outlets, token_budget=PROMPT_TOKEN_BUDGET, max_outlets=PROMPT_MAX_OUTLETS,
+        lines_by_key=snapshot.prompt_lines if snapshot is not None else None,
+    )
+    logging.info(f"📝 Prompt context: {len(context.outlets)}/{len(relevant_outlets)} outlets, ~{context.tokens} tokens")
+    PROMPT_TOKENS.observe(context.tokens)
+
+    outlet_ids = []
+    if snapshot is not None:
+        keys = ((outlet.properties.get("name"), outlet.properties.get("address")) for outlet in context.outlets)
+        outlet_ids = [snapshot.ids_by_key[key] for key in keys if key in snapshot.ids_by_key]
+    conversation = f"\n### Conversation so far:\n{history}\n" if history else ""
+
+    # ✅ Construct the final prompt dynamically
+    return f"""### Context:
+You are an AI assistant helping users find Subway outlets with specific queries.
+Each outlet below is listed as: name | address | operating hours.
+{conversation}
+### Query:
+The user wants to know about Subway outlets that {query}.
+
+### Retrieved Data:
+{context.text}
+
+### Final Answer:
+""", outlet_ids
+
+def classify_intent(query):
+    """
+    Decides whether a query gets a structured answer or goes to Llama-3.
+    Returns "count", "latest_closing", "open_at" or "general".
+    """
+    if "count" in query or "many" in query:
+        return "count"
+    if "closes the latest" in query or "open the longest" in query:
+        return "latest_closing"
+    if re.search(r"\bopen\b", query) and re.search(r"\b(now|currently|at|tonight|tomorrow)\b", query):
+        return "open_at"
+    return "general"
+
+def normalize_query(raw_query):
+    query = raw_query.strip().lower()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    return query
+
+def answer_structured(query, intent, snapshot, candidates=None):
+    """Structured answer for a count / latest-closing / open-at query, or None if Llama-3 must answer."""
+    # ✅ Handle count-based queries FIRST (gazetteer lookup, no vector search needed)
+    if intent == "count":
+        logging.info(f"🔍 Handling count query: {query}")
+        response = handle_count_query(query, snapshot, candidates)
+        logging.info(f"📝 Count query answered: {len(response['outlet_ids'])} outlets")
+        return response
+
+    # ✅ Handle "closes the latest" / "open at" queries (opening-hours index, no vector search needed)
+    if intent == "latest_closing":
+        logging.info("🔍 Handling latest closing time query")
+        return handle_latest_closing_query(query, snapshot, candidates)
+
+    if intent == "open_at":
+        logging.info("🔍 Handling open-at-time query")
+        return handle_open_at_query(query, snapshot, candidates)
+    return None
+
+def follow_up_session(query, session):
+    """The session if `query` refers back to its previous answer ("which of those..."), else None."""
+    if session is not None and len(session.outlet_ids) and is_follow_up(query):
+        return session
+    return None
+
+async def prepare_chat_reply(query, session=None):
+    """
+    Runs retrieval and the structured handlers for a normalized query.
+    Returns (response, None, None) for structured answers, or (None, prompt, prompt outlet ids) when Llama-3 must answer.
+    Follow-ups (`session` given) are answered from the session's previous outlets: no vector search,
+    and the prompt only carries those outlets plus the compact conversation summary.
+    """
+    logging.info(f"🔍 Received query: {query}")
+    intent = classify_intent(query)
+    candidates = frozenset(session.outlet_ids) if session is not None else None
+
+    if intent != "general" or session is not None:
+        with span("snapshot"):
+            snapshot = await get_outlet_snapshot()
+
+    if intent != "general":
+        with span("structured"):
+            response = answer_structured(query, intent, snapshot, candidates)
+        if response:
+            return response, None, None
+
+    if session is not None:
+        # ✅ Follow-up: filter the previous result set locally instead of a new search
+        with span("session"):
+            relevant_outlets = [
+                RetrievedOutlet(snapshot.by_id[i].model_dump(exclude={"id"}), id=i)
+                for i in session.outlet_ids if i in snapshot.by_id
+            ]
+        history = session.summary
+    else:
         # ✅ Retrieve hybrid search results
-        relevant_outlets = retrieve_relevant_outlets(query) # determines whether to return structured data or call Llama-3 for a natural language response
-
-        # ✅ Handle count-based queries FIRST
-        if "count" in query or "many" in query:
-            logging.info(f"🔍 Handling count query: {query}")
-            response = handle_count_query(query, relevant_outlets)
-            logging.info(f"📝 Response from handle_count_query: {response}")
-            return handle_count_query(query, relevant_outlets)
-
-        # ✅ Handle "closes the latest" queries
-        if "closes the latest" in query or "open the longest" in query:
-            logging.info("🔍 Handling latest closing time query")
-            closing_times = []
-
-            for outlet in relevant_outlets:
-                operating_hours = outlet.properties.get("operating_hours", "")
-                normal_closing, holiday_closing = extract_closing_time(operating_hours)
-
-                if normal_closing:
-                    closing_times.append((outlet, normal_closing, holiday_closing))
-
-            if closing_times:
-                # ✅ Find the latest closing outlet
-                latest_closing_time = max(closing_times, key=lambda x: x[1])[1]
-                latest_outlets = [
-                    (outlet, normal_closing, holiday_closing)
-                    for outlet, normal_closing, holiday_closing in closing_times
-                    if normal_closing == latest_closing_time
-                ]
-
-                response_list = []
-                for outlet, normal_closing, holiday_closing in latest_outlets:
-                    name = outlet.properties.get('name', 'Unknown')
-                    address = outlet.properties.get('address', 'Not available')
-                    operating_hours = outlet.properties.get('operating_hours', 'N/A')
-                    latitude = outlet.properties.get('latitude', 'N/A')
-                    longitude = outlet.properties.get('longitude', 'N/A')
-                    waze_link = outlet.properties.get('waze_link', '').strip()
-
-                    # ✅ Ensure Waze link is correctly formatted
-                    waze_text = (
-                        f'<a href="{waze_link}" target="_blank" rel="noopener noreferrer" '
-                        f'style="color: #007bff; text-decoration: none;">🚗 Navigate Here</a>'
-                    ) if waze_link and waze_link not in ['#', '', None, 'None'] else "No Waze link available"
-
-                    response_list.append(
-                        f"<b>{name}</b><br>"
-                        f"📍 Address: {address}<br>"
-                        f"🕒 Operating Hours: {operating_hours}<br>"
-                        f"🚦 Public Holiday Status: {'Closed' if holiday_closing else 'Open'}<br>"
-                        f"🌍 Location: Latitude {latitude}, Longitude {longitude}<br>"
-                        f"{waze_text}<br>"
-                    )
-
-                return {"response": f"The latest closing Subway outlet(s): <br>{'<br>'.join(response_list)}"}
-
-        # ✅ General Responses (For queries that do not match count/latest closing queries)
-        formatted_outlets = []
-        outlet_names = []
-
-        for outlet in relevant_outlets:
-            name = outlet.properties.get('name', 'Unknown')
-            address = outlet.properties.get('address', 'Not available')
-            operating_hours = outlet.properties.get('operating_hours', 'Not available')
-            latitude = outlet.properties.get('latitude', 'N/A')
-            longitude = outlet.properties.get('longitude', 'N/A')
-            waze_link = outlet.properties.get('waze_link', '')
-
-            # ✅ Ensure Waze link is properly formatted and clickable
-            waze_text = (
-                f'<a href="{waze_link.strip()}" target="_blank" rel="noopener noreferrer" '
-                f'style="color: #007bff; text-decoration: none;">🚗 Navigate Here</a>'
-            ) if waze_link and waze_link.strip() not in ["#", "", None, "None"] else "No Waze link available"
-
-            outlet_names.append(name)
-            formatted_outlets.append(
-                f"<b>{name}</b><br>"
-                f"📍 Address: {address}<br>"
-                f"🕒 Operating Hours: {operating_hours}<br>"
-                f"🌍 Latitude: {latitude}, Longitude: {longitude}<br>"
-                f"{waze_text}<br>"
-            )
-
-        response_context = "".join(formatted_outlets)
-
-        # ✅ Construct the final prompt dynamically
-        full_prompt = f"""
-        ### Context:
-        You are an AI assistant helping users find Subway outlets with specific queries.
-
-        ### Query:
-        The user wants to know about Subway outlets that {query}. 
-
-        ### Retrieved Data:
-        {response_context}
-        
-        ### Final Answer:
-        """
+        with span("retrieval"):
+            relevant_outlets = await retrieve_relevant_outlets(query) # determines whether to return structured data or call Llama-3 for a natural language response
+        snapshot, history = outlet_store.loaded, None
+    RETRIEVED_OUTLETS.observe(len(relevant_outlets))
+
+    # ✅ General Responses (For queries that do not match count/latest closing queries)
+    with span("prompt"):
+        prompt, outlet_ids = build_llm_prompt(query, relevant_outlets, snapshot, history)
+    return None, prompt, outlet_ids
+
+# ✅ Intents whose answer depends on the current time are never cached
+UNCACHED_INTENTS = {"open_at"}
+
+def current_data_version():
+    snapshot = outlet_store.loaded  # ✅ Never block a request on a DB reload just to build a cache key
+    return snapshot.version if snapshot is not None else None
+
+async def get_cached_reply(query):
+    version = current_data_version()
+    if response_cache is None or version is None or classify_intent(query) in UNCACHED_INTENTS:
+        return None
+    with span("cache"):
+        cached_response = await response_cache.get(query, version)
+    CACHE_LOOKUPS.labels("hit" if cached_response else "miss").inc()
+    return cached_response
+
+async def cache_reply(query, response):
+    """Caches a reply unless it is an LLM/upstream error."""
+    version = current_data_version()
+    if response_cache is None or version is None or classify_intent(query) in UNCACHED_INTENTS:
+        return
+    if response["response"].startswith("Error:"):
+        return
+    await response_cache.set(query, version, response)
+
+# ✅ Single-flight: identical queries in flight at the same time share one retrieval + LLM call
+single_flight = SingleFlight()
+
+def flight_key(query):
+    return f"{current_data_version()}|{normalize_cache_query(query)}"
+
+# ✅ Conversation Sessions (last answer's outlets + compact summary, for follow-up questions)
+session_store = SessionStore(
+    ttl=SESSION_TTL, max_sessions=SESSION_MAX_SESSIONS, max_outlets=SESSION_MAX_OUTLETS, summary_chars=SESSION_SUMMARY_CHARS
+)
 
-        response = query_openrouter_llama(full_prompt)
-        logging.info(f"🔍 Received response from Llama 3: {response}")
+def remember_turn(session, query, outlet_ids):
+    snapshot = outlet_store.loaded
+    names = [snapshot.by_id[i].name for i in (outlet_ids or [])[:3] if i in snapshot.by_id] if snapshot else []
+    session.record(query, outlet_ids, names)
 
-        return {"response": response.strip()}
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters for the chatbot response cache."""
+    if response_cache is None:
+        return {"backend": None, "single_flight": single_flight.stats(), "sessions": session_store.stats()}
+    return {**response_cache.stats(), "single_flight": single_flight.stats(), "sessions": session_store.stats()}
 
+@app.post("/chatbot", response_model=ChatbotResponse)
+async def chatbot_query(request: ChatbotRequest, http_response: Response):
+    """
+    Process user queries using Hybrid Search & OpenRouter's Llama-3.
+    Stage timings are returned in the `Server-Timing` header.
+    Send back the returned `session_id` to ask follow-up questions about the previous answer.
+    """
+    timings = start_request("chatbot")
+    try:
+        query = normalize_query(request.query)
+        timings.intent = classify_intent(query)
+        session = session_store.get_or_create(request.session_id)
+        follow_up = follow_up_session(query, session)
+        if follow_up is not None:
+            reply = await answer_query(query, follow_up)  # ✅ Session-specific: not cached or coalesced
+        else:
+            key = flight_key(query)
+            if single_flight.in_flight(key):
+                COALESCED_REQUESTS.labels("chatbot").inc()
+            reply = await single_flight.do(key, lambda: answer_query(query))
+        remember_turn(session, query, reply.get("outlet_ids"))
+        RESPONSE_CHARS.observe(len(reply["response"]))
+        http_response.headers["Server-Timing"] = timings.server_timing()
+        return {"response": reply["response"], "session_id": session.id}
+
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"❌ ERROR: {str(e)}", exc_info=True)
+        count_error("request")
         return JSONResponse(status_code=500, content={"error": "Internal Server Error", "message": str(e)})
+    finally:
+        timings.finish()
+
+async def answer_query(query, session=None):
+    """
+    Cached answer, structured answer, or a Llama-3 completion for a normalized query.
+    Replies carry the ids of the outlets they are about (`outlet_ids`) for the conversation session.
+    """
+    cached_response = await get_cached_reply(query) if session is None else None
+    if cached_response:
+        return cached_response
+
+    structured_response, full_prompt, outlet_ids = await prepare_chat_reply(query, session)
+    if structured_response:
+        if session is None:
+            await cache_reply(query, structured_response)
+        return structured_response
+
+    with span("llm"):
+        response = await query_openrouter_llama(full_prompt)
+    if response.startswith("Error:"):
+        count_error("llm")
+    logging.info(f"🔍 Received response from Llama 3 ({len(response)} chars)")
+
+    reply = {"response": response.strip(), "outlet_ids": outlet_ids}
+    if session is None:
+        await cache_reply(query, reply)
+    return reply
+
+async def answer_batch(queries, concurrency=BATCH_CONCURRENCY):
+    """
+    Answers many queries; yields `{"index", "query", "response"}` (or `"error"`) in completion order.
+    - Duplicate queries (after normalization) are answered once and reported for every index
+    - Cached and structured answers (count / latest closing / open at) come first, from one snapshot
+    - The rest run as concurrent Llama-3 calls, at most `concurrency` at a time
+    """
+    positions = {}  # normalized query → indexes in `queries`
+    for index, raw_query in enumerate(queries):
+        positions.setdefault(raw_query.strip().lower(), []).append(index)
+
+    def results(query, reply=None, error=None):
+        outcome = {"response": reply["response"]} if reply is not None else {"error": error}
+        return [{"index": index, "query": queries[index], **outcome} for index in positions[query]]
+
+    if "" in positions:
+        for result in results("", error="Query cannot be empty"):
+            yield result
+
+    snapshot = await get_outlet_snapshot()
+    pending = []
+    for query in positions:
+        if not query:
+            continue
+        reply = await get_cached_reply(query)
+        intent = classify_intent(query)
+        if reply is None and intent != "general":
+            reply = answer_structured(query, intent, snapshot)
+            if reply is not None:
+                await cache_reply(query, reply)
+        if reply is not None:
+            for result in results(query, reply):
+                yield result
+        else:
+            pending.append(query)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(query):
+        async with semaphore:
+            try:
+                return query, await single_flight.do(flight_key(query), lambda: answer_query(query)), None
+            except Exception as e:
+                logging.error(f"❌ Batch query failed: {str(e)}")
+                count_error("request")
+                return query, None, str(e)
 
-# ✅ Close Weaviate Client on Shutdown
-@app.on_event("shutdown")
-def shutdown():
-    client.close()
-    logging.info("✅ Weaviate client connection closed.")
+    tasks = [asyncio.create_task(run(query)) for query in pending]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            query, reply, error = await next_done
+            for result in results(query, reply, error):
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()  # ✅ Client went away: stop queued queries
+
+@app.post("/chatbot/batch")
+async def chatbot_batch(request: ChatbotBatchRequest):
+    """
+    Answers a batch of queries, streamed back as NDJSON (one `{"index", "query", "response"}` line per query)
+    in completion order. See `answer_batch()`; `batch_chatbot.py` runs the same batches from the command line.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, LLM_MAX_CONCURRENCY)
+
+    async def lines():
+        async for result in answer_batch(request.queries, concurrency):
+            yield orjson.dumps(result) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/llm/stats")
+def get_llm_stats():
+    """Per-model latency history (p50/p95), circuit breaker state and budget, in routing order."""
+    return {"models": llm.stats()}
+
+@app.get("/outlets/changes/stats")
+def get_outlet_change_stats():
+    """How far the outbox has been applied to the snapshot and Weaviate."""
+    return outlet_changes.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, error and cache counters, result sizes."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+def sse_event(data, event=None):
+    """Formats one Server-Sent Event; `data` is JSON-encoded so newlines survive."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {orjson.dumps(data).decode()}\n\n"
+
+async def answer_stream(query, session=None):
+    """
+    Streaming counterpart of `answer_query`: cached/structured answers as one chunk, else Llama-3 tokens.
+    The last item is a dict with the answer's `outlet_ids` (not sent to the browser),
+    or `{"error": message}` if the LLM failed (partway or before the first token).
+    """
+    cached_response = await get_cached_reply(query) if session is None else None
+    if cached_response:
+        yield cached_response["response"]
+        yield {"outlet_ids": cached_response.get("outlet_ids")}
+        return
+
+    structured_response, full_prompt, outlet_ids = await prepare_chat_reply(query, session)
+    if structured_response:
+        yield structured_response["response"]
+        yield {"outlet_ids": structured_response["outlet_ids"]}
+        if session is None:
+            await cache_reply(query, structured_response)
+        return
+
+    chunks = []
+    with span("llm"):
+        try:
+            async for chunk in llm.stream(full_prompt):
+                if not chunks:
+                    mark("llm_first_token")
+                chunks.append(chunk)
+                yield chunk
+        except LLMError as e:
+            count_error("llm")
+            yield {"error": str(e)}
+            return  # ✅ Failed or cut-off answers are never cached
+    yield {"outlet_ids": outlet_ids}
+    if session is None:
+        await cache_reply(query, {"response": "".join(chunks).strip(), "outlet_ids": outlet_ids})
+
+@app.post("/chatbot/stream")
+async def chatbot_stream(request: ChatbotRequest):
+    """
+    Streaming variant of `/chatbot`: relays Llama-3 tokens as Server-Sent Events.
+    - `data: {"delta": "..."}` for every chunk of the answer
+    - `event: done` once the answer is complete, `event: error` if it failed
+    Structured answers (count / latest closing) arrive as a single delta.
+    Headers go out before any stage runs, so stage timings are sent in the `done` event instead of `Server-Timing`.
+    Identical streams in flight share one upstream call; later subscribers replay the chunks so far.
+    The `done` event carries the `session_id` to send with follow-up questions.
+    """
+    query = normalize_query(request.query)
+    session = session_store.get_or_create(request.session_id)
+    follow_up = follow_up_session(query, session)
+
+    async def event_stream():
+        timings = start_request("chatbot_stream")
+        timings.intent = classify_intent(query)
+        if follow_up is not None:
+            source = answer_stream(query, follow_up)  # ✅ Session-specific: not cached or coalesced
+        else:
+            key = flight_key(query)
+            if single_flight.in_flight(key):
+                COALESCED_REQUESTS.labels("chatbot_stream").inc()
+            source = single_flight.stream(key, lambda: answer_stream(query))
+        try:
+            chunks, outlet_ids = [], None
+            async for chunk in source:
+                if isinstance(chunk, dict) and "error" in chunk:
+                    # ✅ A distinct event, so the client doesn't show the failure as part of the answer
+                    yield sse_event({"error": "Language model error", "message": chunk["error"]}, event="error")
+                    return
+                if isinstance(chunk, dict):
+                    outlet_ids = chunk["outlet_ids"]
+                    continue
+                chunks.append(chunk)
+                yield sse_event({"delta": chunk})
+            remember_turn(session, query, outlet_ids)
+            RESPONSE_CHARS.observe(len("".join(chunks)))
+            yield sse_event({"timings": timings.as_dict(), "session_id": session.id}, event="done")
+        except Exception as e:
+            logging.error(f"❌ ERROR: {str(e)}", exc_info=True)
+            count_error("request")
+            yield sse_event({"error": "Internal Server Error", "message": str(e)}, event="error")
+        finally:
+            timings.finish()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # ✅ Stop proxies from buffering chunks
+    )
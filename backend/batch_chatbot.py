@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+import httpx
+
+# ✅ Batch Chatbot Runner
+# Pushes a file of questions through the chatbot and writes one NDJSON line per answer (completion order).
+# - In-process (default): runs `app.answer_batch()` directly, no server needed
+# - `--url http://127.0.0.1:8000`: streams the batch through a running server's `POST /chatbot/batch`
+
+
+def read_queries(path):
+    """One question per line, or JSONL objects with a "query" field."""
+    with (sys.stdin if path == "-" else open(path, "r", encoding="utf-8")) as file:
+        lines = [line.strip() for line in file if line.strip()]
+    return [json.loads(line)["query"] if line.startswith("{") else line for line in lines]
+
+
+async def run_in_process(queries, concurrency):
+    import app  # ✅ Imported lazily: upstreams connect on first use
+
+    try:
+        async for result in app.answer_batch(queries, concurrency):
+            yield result
+    finally:
+        if app.weaviate_connection is not None:
+            await app.weaviate_connection.close()
+        await app.llm.close()
+
+
+async def run_remote(queries, concurrency, url):
+    async with httpx.AsyncClient(timeout=httpx.Timeout(None, connect=10.0)) as http:
+        payload = {"queries": queries, "concurrency": concurrency}
+        async with http.stream("POST", f"{url.rstrip('/')}/chatbot/batch", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+
+async def run_batch(queries, concurrency=16, url=None, output=sys.stdout):
+    """Writes every answer to `output` as soon as it completes; returns (answered, failed)."""
+    results = run_remote(queries, concurrency, url) if url else run_in_process(queries, concurrency)
+    answered = failed = 0
+    async for result in results:
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+        if "error" in result:
+            failed += 1
+        else:
+            answered += 1
+    return answered, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a file of chatbot questions as NDJSON")
+    parser.add_argument("queries", help="Text file with one question per line (or JSONL with a 'query' field); '-' for stdin")
+    parser.add_argument("--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Llama-3 calls in flight")
+    parser.add_argument("--url", help="Send the batch to a running API instead of answering in-process")
+    args = parser.parse_args()
+
+    queries = read_queries(args.queries)
+    started = time.perf_counter()
+    with (sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")) as output:
+        answered, failed = asyncio.run(run_batch(queries, args.concurrency, args.url, output))
+    print(
+        f"✅ {answered} answered, ❌ {failed} failed ({len(queries)} queries) in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
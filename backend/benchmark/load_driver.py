@@ -0,0 +1,190 @@
+"""
+Closed-loop load driver for the API: N concurrent virtual users for a fixed duration.
+Reports requests/second and p50/p95/p99 latency per endpoint and query intent.
+
+    python -m benchmark.load_driver --url http://127.0.0.1:8000 --concurrency 50 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import httpx
+
+# ✅ Query mix per intent (phrased like real users)
+QUERIES = {
+    "count": [
+        "how many outlets in bangsar", "how many subway outlets are in kuala lumpur", "count outlets in penang",
+        "how many outlets in petaling jaya", "how many subway in johor bahru", "how many outlets in shah alam",
+    ],
+    "latest_closing": [
+        "which outlet closes the latest", "which outlet in kuala lumpur closes the latest",
+        "which subway is open the longest", "which outlet closes the latest on sunday",
+    ],
+    "open_at": [
+        "which outlets are open now", "which outlets are open at 11pm on sunday",
+        "which outlets in bangsar are open at 9am tomorrow",
+    ],
+    "general": [
+        "subway near mid valley megamall", "is there a subway in mont kiara", "subway outlets near gurney plaza",
+        "where can i get subway in cheras", "any subway in setia alam with late hours", "subway near kota kinabalu",
+    ],
+}
+
+# ✅ Scenario mix: (weight, label, method, path, intent)
+SCENARIOS = [
+    (0.30, "outlets", "GET", "/outlets", None),
+    (0.15, "chatbot:count", "POST", "/chatbot", "count"),
+    (0.10, "chatbot:latest_closing", "POST", "/chatbot", "latest_closing"),
+    (0.05, "chatbot:open_at", "POST", "/chatbot", "open_at"),
+    (0.25, "chatbot:general", "POST", "/chatbot", "general"),
+    (0.15, "stream:general", "POST", "/chatbot/stream", "general"),
+]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an unsorted list (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+async def run_request(http, method, path, intent, rng):
+    """Returns (ok, seconds, seconds to first streamed byte or None)."""
+    started = time.perf_counter()
+    first_chunk = None
+    if method == "GET":
+        response = await http.get(path)
+        return response.status_code == 200, time.perf_counter() - started, None
+
+    body = {"query": rng.choice(QUERIES[intent])}
+    if path.endswith("/stream"):
+        async with http.stream("POST", path, json=body) as response:
+            ok = response.status_code == 200
+            async for chunk in response.aiter_text():
+                if first_chunk is None and "data:" in chunk:
+                    first_chunk = time.perf_counter() - started
+                if "event: error" in chunk:
+                    ok = False
+        return ok, time.perf_counter() - started, first_chunk
+
+    response = await http.post(path, json=body)
+    ok = response.status_code == 200 and not response.json().get("response", "").startswith("Error:")
+    return ok, time.perf_counter() - started, None
+
+
+async def virtual_user(http, deadline, results, seed, scenarios):
+    rng = random.Random(seed)
+    weights = [s[0] for s in scenarios]
+    while time.perf_counter() < deadline:
+        _, label, method, path, intent = rng.choices(scenarios, weights)[0]
+        try:
+            ok, seconds, ttft = await run_request(http, method, path, intent, rng)
+        except httpx.HTTPError:
+            ok, seconds, ttft = False, 0.0, None
+        results.setdefault(label, []).append((ok, seconds, ttft))
+
+
+async def run_load(url, concurrency, duration, warmup=2.0, scenarios=SCENARIOS, timeout=120.0):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as http:
+        if warmup:
+            await asyncio.gather(*(virtual_user(http, time.perf_counter() + warmup, {}, -i, scenarios) for i in range(min(concurrency, 8))))
+
+        results = {}
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(virtual_user(http, deadline, results, i, scenarios) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(results, elapsed)
+
+
+def summarize(results, elapsed):
+    report = {}
+    for label, samples in sorted(results.items()):
+        latencies = [s for ok, s, _ in samples if ok]
+        first_chunks = [t for ok, _, t in samples if ok and t is not None]
+        report[label] = {
+            "requests": len(samples),
+            "errors": sum(1 for ok, _, _ in samples if not ok),
+            "rps": round(len(samples) / elapsed, 2),
+            "p50_ms": _ms(percentile(latencies, 50)),
+            "p95_ms": _ms(percentile(latencies, 95)),
+            "p99_ms": _ms(percentile(latencies, 99)),
+            "ttft_p50_ms": _ms(percentile(first_chunks, 50)),
+            "ttft_p95_ms": _ms(percentile(first_chunks, 95)),
+        }
+    total = sum(len(samples) for samples in results.values())
+    report["total"] = {"requests": total, "errors": sum(r["errors"] for r in report.values()), "rps": round(total / elapsed, 2)}
+    return report
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def print_report(report):
+    header = f"{'scenario':<24}{'reqs':>8}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft p50':>10}"
+    print(header)
+    print("-" * len(header))
+    for label, row in report.items():
+        if label == "total":
+            continue
+        cells = [row["p50_ms"], row["p95_ms"], row["p99_ms"], row["ttft_p50_ms"]]
+        print(f"{label:<24}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9}"
+              + "".join(f"{'-' if c is None else c:>10}" for c in cells))
+    total = report["total"]
+    print(f"{'total':<24}{total['requests']:>8}{total['errors']:>6}{total['rps']:>9}")
+
+
+def compare_to_baseline(report, baseline, max_regression):
+    """
+    Lists scenarios whose p95 grew (or rps dropped) by more than `max_regression` (0.2 = 20%).
+    """
+    regressions = []
+    for label, row in report.items():
+        base = baseline.get(label)
+        if not base or label == "total":
+            continue
+        if base.get("p95_ms") and row.get("p95_ms") and row["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{label}: p95 {base['p95_ms']} → {row['p95_ms']} ms")
+        if base.get("rps") and row["rps"] < base["rps"] * (1 - max_regression):
+            regressions.append(f"{label}: rps {base['rps']} → {row['rps']}")
+    return regressions
+
+
+def add_driver_arguments(parser):
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds (after warm-up)")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured warm-up seconds")
+    parser.add_argument("--json", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95/rps regression vs baseline")
+
+
+def finish(report, args):
+    """Prints/saves the report; returns the process exit code (1 on regression)."""
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_to_baseline(report, json.load(file), args.max_regression)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    add_driver_arguments(parser)
+    args = parser.parse_args()
+    sys.exit(finish(asyncio.run(run_load(args.url, args.concurrency, args.duration, args.warmup)), args))
@@ -0,0 +1,265 @@
+"""
+Retrieval tuning harness: sweeps hybrid-search `alpha` and `limit` over a labeled query set
+(query → expected outlet ids) and reports recall@k, MRR, retrieval latency and the size of the
+prompt context each setting leads to, and recommends one `RETRIEVAL_ALPHA` / `RETRIEVAL_LIMIT` pair. Run from `backend/`:
+
+    python -m benchmark.retrieval_eval --outlets 2000 --json retrieval_report.json
+    python -m benchmark.retrieval_eval --queries labeled.jsonl --retriever weaviate   # current DB_URL / Weaviate
+    python -m benchmark.retrieval_eval --repeat 1 --check   # smoke check: the default sweep finishes
+
+Labeled query files are JSONL: {"query": "...", "intent": "area", "expected_ids": [1, 2, 3]}.
+Without `--queries`, a labeled set is derived from the synthetic outlets (`--write-queries` saves it).
+
+The recommendation is global because the API applies one setting to every query it retrieves for: only
+"general" questions reach retrieval, and nothing classifies them into these labels at request time.
+Per-intent results are still reported, to show which kinds of query a setting trades away.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from benchmark.load_driver import percentile
+
+DEFAULT_ALPHAS = "0,0.25,0.5,0.7,0.85,1"
+DEFAULT_LIMITS = "5,10,20,50,100"
+DEFAULT_KS = "1,5,10,20"
+
+
+def labeled_queries(outlets, per_intent=15, seed=7):
+    """
+    Derives labeled queries from outlet rows (exact answers are known from the address/hours text):
+    area, mall, postcode, city, opening hours and outlet name lookups.
+    """
+    rng = random.Random(seed)
+    by_fragment = {}
+
+    def add(intent, query, predicate):
+        expected = [o.id for o in outlets if predicate(o)]
+        if expected:
+            by_fragment.setdefault(intent, {})[query] = expected
+
+    for outlet in rng.sample(outlets, min(len(outlets), per_intent * 4)):
+        parts = [part.strip() for part in outlet.address.split(",")]
+        place, postcode_city = parts[1], parts[-2]
+        postcode, city = postcode_city.split(" ", 1)
+        area = place.split(" ")[0] if len(place.split(" ")) > 1 else place
+
+        add("mall", f"subway at {place.lower()}", lambda o, p=place: f", {p}," in o.address)
+        add("area", f"subway outlets in {area.lower()}", lambda o, a=area: re.search(rf", {re.escape(a)}\b", o.address))
+        add("postcode", f"subway near {postcode}", lambda o, p=postcode: f" {p} " in o.address)
+        add("city", f"subway in {city.lower()}", lambda o, c=city: f" {c}," in o.address)
+        add("name", outlet.name.lower(), lambda o, n=outlet.name: o.name == n)
+    for hours, query in [("Open 24 Hours", "subway open 24 hours"), ("2am", "subway open until 2am")]:
+        add("hours", query, lambda o, h=hours: h in (o.operating_hours or ""))
+
+    queries = []
+    for intent, items in by_fragment.items():
+        for query, expected in list(items.items())[:per_intent]:
+            queries.append({"query": query, "intent": intent, "expected_ids": expected})
+    return queries
+
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def rank_metrics(ranked_ids, expected, ks):
+    """recall@k (relative to what k results could hold), reciprocal rank of the first relevant hit."""
+    recall = {k: len(set(ranked_ids[:k]) & expected) / min(k, len(expected)) for k in ks}
+    first = next((rank for rank, outlet_id in enumerate(ranked_ids, start=1) if outlet_id in expected), None)
+    return recall, (1.0 / first if first else 0.0)
+
+
+def mean(values):
+    return round(sum(values) / len(values), 4) if values else None
+
+
+async def evaluate(app, snapshot, queries, alpha, limit, ks, repeat):
+    """Runs every query at one (alpha, limit) setting; returns one row of measurements per query."""
+    rows = []
+    for item in queries:
+        latencies, results = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = await app.retriever.search(item["query"], alpha=alpha, limit=limit)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        key_of = lambda outlet: (outlet.properties.get("name"), outlet.properties.get("address"))
+        ranked_ids = [snapshot.ids_by_key.get(key_of(outlet)) for outlet in results]
+        expected = set(item["expected_ids"])
+        recall, reciprocal_rank = rank_metrics(ranked_ids, expected, ks)
+
+        # ✅ Downstream: what the LLM would actually see after reranking + token budget
+        context = app.build_prompt_context(
+            item["query"], results, token_budget=app.PROMPT_TOKEN_BUDGET, max_outlets=app.PROMPT_MAX_OUTLETS,
+            lines_by_key=snapshot.prompt_lines,
+        )
+        context_ids = {snapshot.ids_by_key.get(key_of(outlet)) for outlet in context.outlets}
+        context_recall = len(context_ids & expected) / min(app.PROMPT_MAX_OUTLETS, len(expected))
+
+        rows.append({
+            "intent": item.get("intent", "general"),
+            "recall": recall,
+            "mrr": reciprocal_rank,
+            "latency_ms": sorted(latencies)[len(latencies) // 2],
+            "prompt_tokens": context.tokens,
+            "prompt_outlets": len(context.outlets),
+            "context_recall": context_recall,
+        })
+    return rows
+
+
+def summarize(rows, ks):
+    latencies = sorted(row["latency_ms"] for row in rows)
+    return {
+        "queries": len(rows),
+        **{f"recall@{k}": mean([row["recall"][k] for row in rows]) for k in ks},
+        "mrr": mean([row["mrr"] for row in rows]),
+        "context_recall": mean([row["context_recall"] for row in rows]),
+        "latency_p50_ms": round(percentile(latencies, 50), 2),
+        "latency_p95_ms": round(percentile(latencies, 95), 2),
+        "prompt_tokens": round(mean([row["prompt_tokens"] for row in rows]), 1),
+        "prompt_outlets": round(mean([row["prompt_outlets"] for row in rows]), 1),
+    }
+
+
+def best_setting(candidates, tolerance):
+    """
+    From (alpha, limit, summary) candidates: the smallest `limit` (then lowest latency) whose combined
+    accuracy (context recall + MRR) is within `tolerance` of the best candidate's. The best candidate
+    always qualifies, even when the best recall and the best MRR come from different settings.
+    """
+    accuracy = lambda c: c[2]["context_recall"] + c[2]["mrr"]
+    best = max(accuracy(c) for c in candidates)
+    good = [c for c in candidates if accuracy(c) >= best - tolerance]
+    alpha, limit, summary = min(good, key=lambda c: (c[1], c[2]["latency_p50_ms"], -accuracy(c)))
+    return {"alpha": alpha, "limit": limit, **summary}
+
+
+def recommend(results, tolerance):
+    """The setting to deploy (over all queries), plus the best setting per intent for comparison."""
+    by_intent = {}
+    for intent in sorted({intent for result in results for intent in result["by_intent"]}):
+        candidates = [(r["alpha"], r["limit"], r["by_intent"][intent]) for r in results if intent in r["by_intent"]]
+        by_intent[intent] = best_setting(candidates, tolerance)
+    overall = best_setting([(r["alpha"], r["limit"], r["overall"]) for r in results], tolerance)
+    return overall, by_intent
+
+
+def print_report(report, ks):
+    header = (f"{'alpha':>6}{'limit':>6}" + "".join(f"{f'R@{k}':>8}" for k in ks)
+              + f"{'MRR':>8}{'ctxR':>8}{'p50 ms':>9}{'p95 ms':>9}{'tokens':>9}")
+    print(header)
+    print("-" * len(header))
+    for result in report["results"]:
+        row = result["overall"]
+        print(f"{result['alpha']:>6}{result['limit']:>6}" + "".join(f"{row[f'recall@{k}']:>8}" for k in ks)
+              + f"{row['mrr']:>8}{row['context_recall']:>8}{row['latency_p50_ms']:>9}{row['latency_p95_ms']:>9}"
+              + f"{row['prompt_tokens']:>9}")
+    describe = lambda rec: (f"alpha={rec['alpha']:<5} limit={rec['limit']:<4} context recall {rec['context_recall']}, "
+                            f"MRR {rec['mrr']}, p50 {rec['latency_p50_ms']} ms, ~{rec['prompt_tokens']} prompt tokens")
+    rec = report["recommended"]
+    print(f"\nRecommended: RETRIEVAL_ALPHA={rec['alpha']} RETRIEVAL_LIMIT={rec['limit']}  ({describe(rec)})")
+    print("Best per intent (for comparison; the API uses one setting for every query):")
+    for intent, rec in report["best_by_intent"].items():
+        print(f"  {intent:<10} {describe(rec)}")
+
+
+async def sweep(args):
+    import app  # ✅ After DB_URL / RETRIEVER_BACKEND are set: evaluates the API's own retriever and prompt builder
+
+    snapshot = await app.get_outlet_snapshot()
+    if app.weaviate_connection is not None:
+        await app.weaviate_connection.get()
+
+    queries = load_queries(args.queries) if args.queries else labeled_queries(snapshot.outlets, seed=args.seed)
+    if args.write_queries:
+        with open(args.write_queries, "w", encoding="utf-8") as file:
+            file.writelines(json.dumps(item) + "\n" for item in queries)
+    print(f"🔍 {len(queries)} labeled queries, {len(snapshot.outlets)} outlets, retriever={app.RETRIEVER_BACKEND}", flush=True)
+
+    ks = [int(k) for k in args.ks.split(",")]
+    await app.retriever.search(queries[0]["query"], limit=1)  # ✅ Build the index / open connections before timing
+
+    results = []
+    try:
+        for alpha in [float(a) for a in args.alphas.split(",")]:
+            for limit in [int(n) for n in args.limits.split(",")]:
+                rows = await evaluate(app, snapshot, queries, alpha, limit, ks, args.repeat)
+                intents = sorted({row["intent"] for row in rows})
+                results.append({
+                    "alpha": alpha,
+                    "limit": limit,
+                    "overall": summarize(rows, ks),
+                    "by_intent": {intent: summarize([r for r in rows if r["intent"] == intent], ks) for intent in intents},
+                })
+    finally:
+        if app.weaviate_connection is not None:
+            await app.weaviate_connection.close()
+
+    recommended, best_by_intent = recommend(results, args.tolerance)
+    return {"results": results, "recommended": recommended, "best_by_intent": best_by_intent}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outlets", type=int, default=2000, help="Synthetic outlets to seed (ignored with --queries)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", help="Labeled JSONL query set, evaluated against the current DB_URL")
+    parser.add_argument("--write-queries", help="Save the labeled query set used to this JSONL file")
+    parser.add_argument("--retriever", choices=["weaviate", "local"], help="Defaults to RETRIEVER_BACKEND (local for synthetic data)")
+    parser.add_argument("--alphas", default=DEFAULT_ALPHAS, help="Comma-separated vector weights to sweep")
+    parser.add_argument("--limits", default=DEFAULT_LIMITS, help="Comma-separated result limits to sweep")
+    parser.add_argument("--ks", default=DEFAULT_KS, help="Comma-separated k values for recall@k")
+    parser.add_argument("--repeat", type=int, default=3, help="Searches per query per setting (median latency is kept)")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Accuracy loss accepted for a smaller limit")
+    parser.add_argument("--json", help="Write the full report to this file")
+    parser.add_argument("--check", action="store_true", help="Exit 1 unless every setting ran and a recommendation was made (CI smoke check)")
+    args = parser.parse_args()
+
+    if not args.queries:
+        from benchmark.run import prepare_database
+
+        workdir = tempfile.mkdtemp(prefix="subway-retrieval-")
+        os.environ["DB_URL"] = f"sqlite:///{os.path.join(workdir, 'outlets.db')}"
+        os.environ["RETRIEVER_VECTORS_DIR"] = os.path.join(workdir, "vector_index")
+        os.environ.setdefault("RETRIEVER_BACKEND", "local")
+        prepare_database(os.environ["DB_URL"], args.outlets, args.seed)
+        print(f"✅ Seeded {args.outlets} synthetic outlets into {os.environ['DB_URL']}", flush=True)
+    if args.retriever:
+        os.environ["RETRIEVER_BACKEND"] = args.retriever
+    os.environ.setdefault("RESPONSE_CACHE_BACKEND", "none")
+    os.environ.setdefault("OUTLET_REFRESH_SECONDS", "0")
+
+    report = asyncio.run(sweep(args))
+    ks = [int(k) for k in args.ks.split(",")]
+    print_report(report, ks)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"✅ Report written to {args.json}")
+    if args.check:
+        return check_report(report, args)
+    return 0
+
+
+def check_report(report, args):
+    """Smoke check: the whole alpha × limit grid was evaluated and produced a setting that is part of it."""
+    grid = {(float(a), int(n)) for a in args.alphas.split(",") for n in args.limits.split(",")}
+    swept = {(result["alpha"], result["limit"]) for result in report["results"]}
+    recommended = (report["recommended"]["alpha"], report["recommended"]["limit"])
+    if swept != grid or recommended not in grid or not report["best_by_intent"]:
+        print(f"❌ Check failed: swept {len(swept)}/{len(grid)} settings, recommended {recommended}")
+        return 1
+    print(f"✅ Check passed: {len(grid)} settings swept")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
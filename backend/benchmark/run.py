@@ -0,0 +1,111 @@
+"""
+One-command offline benchmark: synthetic dataset → SQLite, stub Weaviate/OpenRouter,
+the real API under uvicorn, then the load driver. Run from `backend/`:
+
+    python -m benchmark.run --outlets 2000 --concurrency 50 --duration 30 --json report.json
+    python -m benchmark.run --baseline report.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmark.load_driver import add_driver_arguments, finish, run_load
+from benchmark.stub_servers import add_stub_arguments
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_database(db_url, count, seed):
+    """Seeds the benchmark database in a child process, so this process never binds DB_URL."""
+    code = (
+        "import sys; from database import SessionLocal, SubwayOutlet, init_db; init_db(); "
+        "from benchmark.synthetic_data import generate_outlets, seed_database; "
+        "seed_database(SessionLocal, SubwayOutlet, generate_outlets(int(sys.argv[1]), seed=int(sys.argv[2])))"
+    )
+    subprocess.run([sys.executable, "-c", code, str(count), str(seed)],
+                   cwd=BACKEND_DIR, env={**os.environ, "DB_URL": db_url}, check=True)
+
+
+def wait_for(url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def app_environment(args, db_url):
+    return {
+        **os.environ,
+        "DB_URL": db_url,
+        "WEAVIATE_URL": f"http://127.0.0.1:{args.weaviate_port}",
+        "WEAVIATE_GRPC_PORT": str(args.weaviate_grpc_port),
+        "WEAVIATE_API_KEY": "",
+        "OPENROUTER_URL": f"http://127.0.0.1:{args.openrouter_port}/api/v1/chat/completions",
+        "OPENROUTER_API_KEY": "benchmark",
+        "RETRIEVER_BACKEND": args.retriever,
+        "RETRIEVER_VECTORS_DIR": os.path.join(os.path.dirname(db_url.removeprefix("sqlite:///")), "vector_index"),
+        "RESPONSE_CACHE_BACKEND": args.cache,
+        "OUTLET_REFRESH_SECONDS": "0",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_arguments(parser)
+    add_driver_arguments(parser)
+    parser.add_argument("--app-port", type=int, default=18000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API")
+    parser.add_argument("--retriever", default="weaviate", choices=["weaviate", "local"])
+    parser.add_argument("--cache", default="none", choices=["none", "memory", "sqlite"], help="Response cache backend")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="subway-bench-")
+    db_url = f"sqlite:///{os.path.join(workdir, 'outlets.db')}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+
+    prepare_database(db_url, args.outlets, args.seed)
+    print(f"✅ Seeded {args.outlets} synthetic outlets into {db_url}", flush=True)
+
+    stub_args = [
+        "--outlets", str(args.outlets), "--seed", str(args.seed),
+        "--weaviate-port", str(args.weaviate_port), "--weaviate-grpc-port", str(args.weaviate_grpc_port),
+        "--weaviate-latency", str(args.weaviate_latency), "--openrouter-port", str(args.openrouter_port),
+        "--llm-ttft", str(args.llm_ttft), "--llm-token-delay", str(args.llm_token_delay),
+        "--llm-tokens", str(args.llm_tokens),
+    ]
+    processes = []
+    try:
+        processes.append(subprocess.Popen([sys.executable, "-m", "benchmark.stub_servers", *stub_args], cwd=BACKEND_DIR))
+        wait_for(f"http://127.0.0.1:{args.weaviate_port}/v1/meta")
+        wait_for(f"http://127.0.0.1:{args.openrouter_port}/docs")
+
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(args.app_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=app_environment(args, db_url),
+        ))
+        wait_for(f"{app_url}/outlets")
+
+        print(f"🔍 Load: {args.concurrency} users for {args.duration}s against {app_url} "
+              f"(retriever={args.retriever}, cache={args.cache})", flush=True)
+        report = asyncio.run(run_load(app_url, args.concurrency, args.duration, args.warmup))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    sys.exit(finish(report, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Writes synthetic "Find a Subway" result pages in the layout `scraping.py` parses,
+so the scraping pipeline can be replayed and benchmarked offline.
+
+    python -m benchmark.scrape_fixtures --out scrape_fixtures --outlets 2000
+    python scraping.py --replay scrape_fixtures --no-geocode --workers 8 --replay-latency 0.5
+"""
+import argparse
+import os
+import re
+from html import escape
+from benchmark.synthetic_data import generate_outlets
+
+PAGE_SIZE = 20
+
+
+def render_page(outlets, next_href=None):
+    lefts, boxes, buttons = [], [], []
+    for outlet in outlets:
+        lefts.append(f'<div class="location_left"><h4>{escape(outlet["name"])}</h4><p>{escape(outlet["address"])}</p></div>')
+        boxes.append(
+            f'<div class="infoboxcontent"><p>{escape(outlet["address"])}</p>'
+            f'<p>{escape(outlet["operating_hours"])}</p><p></p><p>Find out more...</p></div>'
+        )
+        buttons.append(f'<div class="directionButton"><a href="{escape(outlet["waze_link"])}">Waze</a></div>')
+    pagination = f'<a class="next-page" href="{escape(next_href)}">Next</a>' if next_href else ""
+    return f"<html><body>{''.join(lefts)}{''.join(boxes)}{''.join(buttons)}{pagination}</body></html>"
+
+
+def write_fixtures(outlets, out_dir, page_size=PAGE_SIZE):
+    """One region per city, paginated like the live site. Returns {region: pages}."""
+    by_city = {}
+    for outlet in outlets:
+        city = outlet["address"].rsplit(",", 2)[-2].strip().split(" ", 1)[1]  # "59000 Kuala Lumpur" → city
+        by_city.setdefault(re.sub(r"[^a-z0-9]+", "-", city.lower()), []).append(outlet)
+
+    written = {}
+    for region, rows in sorted(by_city.items()):
+        pages = [rows[i:i + page_size] for i in range(0, len(rows), page_size)]
+        for page_no, page in enumerate(pages, start=1):
+            path = os.path.join(out_dir, region, f"page-{page_no}.html")  # ✅ Layout of scraping.fixture_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            next_href = f"{region}?page={page_no + 1}" if page_no < len(pages) else None
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(render_page(page, next_href))
+        written[region] = len(pages)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="scrape_fixtures")
+    parser.add_argument("--outlets", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    args = parser.parse_args()
+
+    written = write_fixtures(generate_outlets(args.outlets, seed=args.seed), args.out, args.page_size)
+    print(f"✅ Wrote {sum(written.values())} pages for {len(written)} regions to {args.out}")
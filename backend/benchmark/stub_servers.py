@@ -0,0 +1,163 @@
+"""
+Local stand-ins for Weaviate and OpenRouter, so the API can be load-tested offline.
+
+    python -m benchmark.stub_servers --outlets 2000 --weaviate-latency 0.05 --llm-ttft 0.4
+
+- Weaviate: REST `/v1/meta` + readiness, and the gRPC `Search` / health services the v4 client uses
+- OpenRouter: `/api/v1/chat/completions`, plain or streamed (SSE), with configurable latency
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+import grpc
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from weaviate.proto.v1 import health_weaviate_pb2, properties_pb2, search_get_pb2, weaviate_pb2_grpc
+from benchmark.synthetic_data import generate_outlets
+
+WEAVIATE_VERSION = "1.30.0"
+
+
+# ✅ Weaviate stand-in
+class StubWeaviateSearch(weaviate_pb2_grpc.WeaviateServicer):
+    """Answers hybrid queries with a keyword-overlap ranking of the synthetic outlets."""
+
+    def __init__(self, outlets, latency):
+        self.latency = latency
+        self.outlets = outlets
+        self.tokens = [set(re.findall(r"[a-z0-9]+", f"{o['name']} {o['address']}".lower())) for o in outlets]
+        self.ids = [uuid.uuid5(uuid.NAMESPACE_URL, f"outlet/{i}").bytes for i in range(len(outlets))]
+
+    def _result(self, row):
+        fields = {}
+        for name, value in self.outlets[row].items():
+            if isinstance(value, float):
+                fields[name] = properties_pb2.Value(number_value=value)
+            else:
+                fields[name] = properties_pb2.Value(text_value=str(value))
+        return search_get_pb2.SearchResult(
+            properties=search_get_pb2.PropertiesResult(
+                non_ref_props=properties_pb2.Properties(fields=fields),
+                target_collection="SubwayOutlet",
+            ),
+            metadata=search_get_pb2.MetadataResult(id_as_bytes=self.ids[row]),
+        )
+
+    async def Search(self, request, context):
+        started = time.perf_counter()
+        await asyncio.sleep(self.latency)
+
+        query = set(re.findall(r"[a-z0-9]+", request.hybrid_search.query.lower()))
+        ranked = sorted(range(len(self.outlets)), key=lambda row: len(query & self.tokens[row]), reverse=True)
+        results = [self._result(row) for row in ranked[: request.limit or 10]]
+        return search_get_pb2.SearchReply(took=time.perf_counter() - started, results=results)
+
+
+async def grpc_health_check(request, context):
+    return health_weaviate_pb2.WeaviateHealthCheckResponse(status=health_weaviate_pb2.WeaviateHealthCheckResponse.SERVING)
+
+
+def create_weaviate_rest_app():
+    rest = FastAPI()
+
+    @rest.get("/v1/meta")
+    def meta():
+        return {"version": WEAVIATE_VERSION, "hostname": "http://[::]:8080", "modules": {}, "grpcMaxMessageSize": 104858000}
+
+    @rest.get("/v1/.well-known/ready")
+    @rest.get("/v1/.well-known/live")
+    def ready():
+        return {}
+
+    return rest
+
+
+async def start_weaviate_grpc(outlets, port, latency):
+    server = grpc.aio.server()
+    weaviate_pb2_grpc.add_WeaviateServicer_to_server(StubWeaviateSearch(outlets, latency), server)
+    server.add_generic_rpc_handlers([
+        grpc.method_handlers_generic_handler("grpc.health.v1.Health", {
+            "Check": grpc.unary_unary_rpc_method_handler(
+                grpc_health_check,
+                request_deserializer=health_weaviate_pb2.WeaviateHealthCheckRequest.FromString,
+                response_serializer=health_weaviate_pb2.WeaviateHealthCheckResponse.SerializeToString,
+            )
+        })
+    ])
+    server.add_insecure_port(f"127.0.0.1:{port}")
+    await server.start()
+    return server
+
+
+# ✅ OpenRouter stand-in
+def create_openrouter_app(ttft, token_delay, tokens):
+    """
+    Completions API stand-in: waits `ttft` seconds, then produces `tokens` tokens `token_delay` apart.
+    """
+    router = FastAPI()
+    words = ("Here are the Subway outlets that match your question, with their addresses and hours. " * 50).split()
+
+    @router.post("/api/v1/chat/completions")
+    async def completions(request: Request):
+        payload = await request.json()
+        n_tokens = min(tokens, payload.get("max_tokens", tokens))
+
+        if not payload.get("stream"):
+            await asyncio.sleep(ttft + n_tokens * token_delay)
+            text = " ".join(words[:n_tokens])
+            return {"id": "stub", "model": payload.get("model"), "choices": [{"text": text, "finish_reason": "stop"}]}
+
+        async def stream():
+            yield ": OPENROUTER PROCESSING\n\n"
+            await asyncio.sleep(ttft)
+            for i in range(n_tokens):
+                chunk = {"id": "stub", "choices": [{"text": words[i % len(words)] + " "}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return router
+
+
+async def serve(args):
+    outlets = generate_outlets(args.outlets, seed=args.seed)
+    grpc_server = await start_weaviate_grpc(outlets, args.weaviate_grpc_port, args.weaviate_latency)
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(create_weaviate_rest_app(), host="127.0.0.1", port=args.weaviate_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(
+            create_openrouter_app(args.llm_ttft, args.llm_token_delay, args.llm_tokens),
+            host="127.0.0.1", port=args.openrouter_port, log_level="warning", backlog=4096,
+        )),
+    ]
+    print(f"✅ Stub Weaviate on :{args.weaviate_port} (gRPC :{args.weaviate_grpc_port}), "
+          f"stub OpenRouter on :{args.openrouter_port}", flush=True)
+    try:
+        await asyncio.gather(*(server.serve() for server in servers))
+    finally:
+        await grpc_server.stop(grace=None)
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--outlets", type=int, default=2000, help="Synthetic outlets served by the stub Weaviate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--weaviate-port", type=int, default=18080)
+    parser.add_argument("--weaviate-grpc-port", type=int, default=15051)
+    parser.add_argument("--weaviate-latency", type=float, default=0.05, help="Seconds per hybrid query")
+    parser.add_argument("--openrouter-port", type=int, default=18090)
+    parser.add_argument("--llm-ttft", type=float, default=0.4, help="Seconds until the first token")
+    parser.add_argument("--llm-token-delay", type=float, default=0.005, help="Seconds between tokens")
+    parser.add_argument("--llm-tokens", type=int, default=150, help="Tokens per completion")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_arguments(parser)
+    asyncio.run(serve(parser.parse_args()))
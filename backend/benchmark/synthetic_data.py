@@ -0,0 +1,63 @@
+import random
+
+# ✅ Realistic building blocks for Malaysian outlet records
+CITIES = [
+    # (city, state, latitude, longitude, postcode prefix, areas)
+    ("Kuala Lumpur", "Wilayah Persekutuan", 3.1390, 101.6869, "5", ["Bangsar", "Mont Kiara", "Cheras", "Bukit Bintang", "Setapak", "Kepong", "Sri Petaling", "Brickfields"]),
+    ("Petaling Jaya", "Selangor", 3.1073, 101.6067, "46", ["SS2", "Damansara Utama", "Kelana Jaya", "Ara Damansara", "Section 14"]),
+    ("Shah Alam", "Selangor", 3.0733, 101.5185, "40", ["Seksyen 7", "Seksyen 13", "Kota Kemuning", "Setia Alam"]),
+    ("Subang Jaya", "Selangor", 3.0565, 101.5851, "47", ["SS15", "USJ 9", "Puchong", "Bandar Sunway"]),
+    ("Johor Bahru", "Johor", 1.4927, 103.7414, "80", ["Taman Molek", "Mount Austin", "Skudai", "Tebrau"]),
+    ("George Town", "Penang", 5.4141, 100.3288, "10", ["Gurney", "Jelutong", "Bayan Lepas", "Tanjung Tokong"]),
+    ("Ipoh", "Perak", 4.5975, 101.0901, "30", ["Greentown", "Bercham", "Tasek"]),
+    ("Kota Kinabalu", "Sabah", 5.9804, 116.0735, "88", ["Likas", "Luyang", "Inanam"]),
+    ("Kuching", "Sarawak", 1.5533, 110.3592, "93", ["Padungan", "Tabuan Jaya", "Petra Jaya"]),
+    ("Melaka", "Melaka", 2.1896, 102.2501, "75", ["Bandar Hilir", "Ayer Keroh", "Batu Berendam"]),
+]
+MALLS = ["Mall", "Plaza", "Square", "Sentral", "Galleria", "City Centre", "Avenue", "Megamall"]
+STREETS = ["Jalan", "Jalan Bukit", "Lorong", "Persiaran", "Jalan Tun"]
+HOURS = [
+    "Monday - Sunday, 8:00 AM - 10:00 PM",
+    "Monday - Sunday, 10:00 AM - 10:00 PM",
+    "Mon - Fri, 7:30 AM - 9:00 PM Sat - Sun, 8:00 AM - 9:00 PM",
+    "Monday - Friday, 8:00 AM - 8:00 PM Saturday & Sunday, Closed Public Holiday, Closed",
+    "Sunday – Thursday: 10am-10pm, Friday & Saturday: 10am-2am",
+    "Monday - Sunday, 7:00 AM - 11:30 PM",
+    "Open 24 Hours",
+    "Monday - Sunday 10:00 AM - 10:00 PM Public Holiday 10:00 AM - 8:00 PM",
+]
+
+
+def generate_outlets(count=2000, seed=42):
+    """
+    Synthetic outlet rows shaped like the scraped data: names, multi-part addresses
+    with area/postcode/state, free-text hours, coordinates clustered around cities.
+    """
+    rng = random.Random(seed)
+    outlets = []
+    for i in range(count):
+        city, state, lat, lng, postcode_prefix, areas = rng.choice(CITIES)
+        area = rng.choice(areas)
+        in_mall = rng.random() < 0.6
+        place = f"{area} {rng.choice(MALLS)}" if in_mall else area
+        unit = f"Lot {rng.choice(['G', 'LG', 'F1', 'F2'])}-{rng.randint(1, 99)}" if in_mall else f"No. {rng.randint(1, 200)}"
+        street = f"{rng.choice(STREETS)} {area.split()[0]} {rng.randint(1, 30)}"
+        postcode = postcode_prefix + "".join(str(rng.randint(0, 9)) for _ in range(5 - len(postcode_prefix)))
+
+        outlets.append({
+            "name": f"Subway {place}" + (f" {i}" if rng.random() < 0.5 else ""),
+            "address": f"{unit}, {place}, {street}, {postcode} {city}, {state}",
+            "operating_hours": rng.choice(HOURS),
+            "latitude": round(lat + rng.gauss(0, 0.05), 6),
+            "longitude": round(lng + rng.gauss(0, 0.05), 6),
+            "waze_link": f"https://www.waze.com/live-map/directions?to=ll.{lat:.5f}%2C{lng:.5f}",
+        })
+    return outlets
+
+
+def seed_database(session_factory, outlet_model, outlets):
+    """Replaces the outlet table's contents with `outlets`."""
+    with session_factory() as db:
+        db.query(outlet_model).delete()
+        db.bulk_insert_mappings(outlet_model, outlets)
+        db.commit()
@@ -0,0 +1,89 @@
+import gzip
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli  # ✅ Optional: without it, clients get gzip
+except ImportError:
+    brotli = None
+
+# ✅ Response Compression Defaults
+DEFAULT_MINIMUM_SIZE = 1024  # Smaller bodies aren't worth the CPU (and may grow)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Per-request bodies; precompressed snapshots use the maximum
+
+
+def negotiate(accept_encoding):
+    """Picks "br" or "gzip" from an `Accept-Encoding` header (None = send uncompressed)."""
+    offered = {}
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[coding.strip()] = q
+
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if offered.get(coding, offered.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(body, encoding, best=False):
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Negotiated brotli/gzip compression for complete (non-streaming) responses on the given path prefixes.
+    - Streamed bodies (SSE) and responses that are already encoded pass through untouched
+    - Compressed responses get a weak ETag, since the bytes differ from the identity body
+    """
+
+    def __init__(self, app, paths=("/",), minimum_size=DEFAULT_MINIMUM_SIZE):
+        self.app = app
+        self.paths = tuple(paths)
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message  # ✅ Held back until we know the body
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            body = message.get("body", b"")
+            if (
+                encoding is not None
+                and not message.get("more_body", False)
+                and "content-encoding" not in headers
+                and len(body) >= self.minimum_size
+            ):
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                if "etag" in headers and not headers["etag"].startswith("W/"):
+                    headers["ETag"] = f"W/{headers['etag']}"
+                message = {**message, "body": body}
+
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
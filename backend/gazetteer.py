@@ -0,0 +1,214 @@
+import re
+from collections import defaultdict, deque
+
+# ✅ Malaysian states & federal territories (tagged as "state" terms)
+STATES = {
+    "johor", "kedah", "kelantan", "melaka", "malacca", "negeri sembilan", "pahang", "penang", "pulau pinang",
+    "perak", "perlis", "sabah", "sarawak", "selangor", "terengganu", "kuala lumpur", "putrajaya", "labuan",
+    "wilayah persekutuan",
+}
+
+# ✅ Words that mark a mall / building name (tagged as "mall" terms)
+MALL_WORDS = {
+    "mall", "plaza", "centre", "center", "sentral", "square", "galleria", "megamall", "avenue", "complex",
+    "kompleks", "menara", "wisma", "tower", "hospital", "airport", "klia", "lrt", "mrt", "station", "stesen",
+}
+
+# ✅ Common shorthand users type for well-known places
+ALIASES = {
+    "kl": "kuala lumpur",
+    "pj": "petaling jaya",
+    "jb": "johor bahru",
+    "kk": "kota kinabalu",
+    "klcc": "kuala lumpur city centre",
+}
+
+# ✅ Address words that never identify a place on their own
+GENERIC_WORDS = {
+    "jalan", "jln", "lorong", "lot", "unit", "no", "level", "floor", "ground", "lower", "upper", "block", "blok",
+    "lg", "ug", "g", "the", "of", "and", "at", "taman", "persiaran", "lebuh", "lebuhraya", "bandar", "kampung",
+    "shop", "suite", "first", "second", "third", "off", "road", "street", "concourse", "parcel", "b", "a", "c",
+}
+
+MAX_TERM_WORDS = 4
+POSTCODE = re.compile(r"^\d{5}$")
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+(?:[-'][a-z0-9]+)*", text.lower())
+
+
+def _is_noise(token):
+    """Unit numbers, street numbers and generic address words."""
+    return token in GENERIC_WORDS or (any(ch.isdigit() for ch in token) and not POSTCODE.match(token))
+
+
+def term_kind(term):
+    if POSTCODE.match(term):
+        return "postcode"
+    if term in STATES:
+        return "state"
+    if MALL_WORDS.intersection(term.split()):
+        return "mall"
+    return "area"
+
+
+def address_terms(address):
+    """
+    Place names in an address: every word n-gram of a comma-separated segment
+    that doesn't start or end with a unit number / generic word.
+    "Jalan Bangsar Utama 1, Kuala Lumpur, 59000" → bangsar, bangsar utama, kuala, lumpur, kuala lumpur, 59000, ...
+    """
+    terms = set()
+    for segment in address.split(","):
+        tokens = tokenize(segment)
+        for start in range(len(tokens)):
+            if _is_noise(tokens[start]):
+                continue
+            for end in range(start + 1, min(start + MAX_TERM_WORDS, len(tokens)) + 1):
+                if not _is_noise(tokens[end - 1]):
+                    terms.add(" ".join(tokens[start:end]))
+    return terms
+
+
+class Gazetteer:
+    """
+    Location index built from outlet addresses.
+    - Terms (areas, postcodes, malls, states) map straight to outlet-id sets
+    - A word-level Aho-Corasick automaton finds every known term in a query in one pass
+    """
+
+    def __init__(self, outlets):
+        self.outlet_ids = {outlet.id for outlet in outlets}
+        self.addresses = {outlet.id: (outlet.address or "").lower() for outlet in outlets}
+
+        postings = defaultdict(set)
+        for outlet in outlets:
+            for term in address_terms(outlet.address or ""):
+                postings[term].add(outlet.id)
+        for alias, term in ALIASES.items():
+            if term in postings:
+                postings[alias] |= postings[term]
+        self.postings = {term: frozenset(ids) for term, ids in postings.items()}
+
+        self._build_automaton()
+
+    def __len__(self):
+        return len(self.postings)
+
+    def with_changes(self, outlets, deleted_ids=()):
+        """
+        New gazetteer with `outlets` ({id: outlet}) added or re-addressed and `deleted_ids` dropped; this one is left untouched.
+        Only the postings of terms in the touched addresses are rewritten. The Aho-Corasick automaton is shared
+        unless a change adds a new place term or retires the last outlet of one (then it is rebuilt).
+        """
+        touched = outlets.keys() | set(deleted_ids)
+        gazetteer = Gazetteer.__new__(Gazetteer)
+        gazetteer.outlet_ids = (self.outlet_ids - touched) | outlets.keys()
+        gazetteer.addresses = dict(self.addresses)
+
+        removed, added = defaultdict(set), defaultdict(set)
+        for outlet_id in touched & self.outlet_ids:
+            for term in address_terms(gazetteer.addresses.pop(outlet_id)):
+                removed[term].add(outlet_id)
+        for outlet_id, outlet in outlets.items():
+            gazetteer.addresses[outlet_id] = (outlet.address or "").lower()
+            for term in address_terms(outlet.address or ""):
+                added[term].add(outlet_id)
+        for changes in (removed, added):
+            for alias, term in ALIASES.items():
+                if term in changes:
+                    changes[alias] |= changes[term]
+
+        gazetteer.postings = dict(self.postings)
+        for term in removed.keys() | added.keys():
+            ids = (gazetteer.postings.get(term, frozenset()) - removed.get(term, set())) | added.get(term, set())
+            if ids:
+                gazetteer.postings[term] = frozenset(ids)
+            else:
+                gazetteer.postings.pop(term, None)
+
+        if gazetteer.postings.keys() == self.postings.keys():
+            gazetteer._goto, gazetteer._term, gazetteer._fail = self._goto, self._term, self._fail
+        else:
+            gazetteer._build_automaton()
+        return gazetteer
+
+    def _build_automaton(self):
+        # ✅ Trie over words: node 0 is the root, `_term[node]` is the term ending there
+        self._goto = [{}]
+        self._term = [None]
+        for term in self.postings:
+            node = 0
+            for word in term.split():
+                if word not in self._goto[node]:
+                    self._goto.append({})
+                    self._term.append(None)
+                    self._goto[node][word] = len(self._goto) - 1
+                node = self._goto[node][word]
+            self._term[node] = term
+
+        # ✅ Failure links, breadth-first (children of the root fail back to the root)
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(word, 0)
+                queue.append(child)
+
+    def find_terms(self, text):
+        """
+        Known place terms in `text`, leftmost-longest and non-overlapping.
+        "outlets in bangsar kuala lumpur" → ["bangsar", "kuala lumpur"]
+        """
+        words = tokenize(text)
+        matches = []  # (start, end, term)
+        node = 0
+        for position, word in enumerate(words):
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+
+            # ✅ Every term ending here: this node's own, then its suffixes' via failure links
+            state = node
+            while state:
+                term = self._term[state]
+                if term is not None:
+                    matches.append((position + 1 - len(term.split()), position + 1, term))
+                state = self._fail[state]
+
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        selected, covered_until = [], 0
+        for start, end, term in matches:
+            if start >= covered_until:
+                selected.append(term)
+                covered_until = end
+        return selected
+
+    def lookup(self, location):
+        """
+        Outlet ids located in `location`.
+        Every matched term must hold (e.g. "bangsar kuala lumpur" → bangsar ∩ kuala lumpur).
+        Returns (terms, ids); `terms` is empty if nothing in the gazetteer matched.
+        """
+        terms = self.find_terms(location)
+        if not terms:
+            return [], frozenset()
+        ids = self.postings[terms[0]]
+        for term in terms[1:]:
+            ids = ids & self.postings[term]
+        return terms, ids
+
+    def describe(self, terms):
+        """Human-readable location label: ["bangsar", "59000"] → "Bangsar, postcode 59000"."""
+        labels = [f"postcode {term}" if term_kind(term) == "postcode" else ALIASES.get(term, term).title() for term in terms]
+        return ", ".join(labels)
+
+    def substring_lookup(self, location):
+        """Fallback for phrases the gazetteer doesn't know: plain substring match on addresses."""
+        location = location.lower()
+        return frozenset(outlet_id for outlet_id, address in self.addresses.items() if location in address)
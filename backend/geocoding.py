@@ -1,55 +1,199 @@
 import os
-import requests
+import re
 import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from dotenv import load_dotenv
 
 # ✅ Load API key from .env
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
 
-# ✅ Local cache file to store API results
-CACHE_FILE = "geocode_cache.json"
+# ✅ Geocoding Cache Configuration
+CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.db")  # SQLite file, indexed by normalized address
+LEGACY_CACHE_FILE = "geocode_cache.json"  # Imported once into the SQLite cache
+NEGATIVE_TTL_SECONDS = float(os.getenv("GEOCODE_NEGATIVE_TTL", 7 * 24 * 3600))  # Re-try "not found" addresses weekly
+NEGATIVE_STATUSES = {"ZERO_RESULTS", "INVALID_REQUEST"}  # Definitive failures worth caching
+GEOCODE_MAX_WORKERS = int(os.getenv("GEOCODE_MAX_WORKERS", 8))
+GEOCODE_RATE_LIMIT = float(os.getenv("GEOCODE_RATE_LIMIT", 40))  # Requests per second (Google allows 50)
+ADDRESS_ABBREVIATIONS = {"jln": "jalan", "tmn": "taman", "lrg": "lorong", "bdr": "bandar", "no.": "no"}
 
-# ✅ Load existing cache
-if os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, "r") as file:
-        geocode_cache = json.load(file)
-else:
-    geocode_cache = {}
 
-def get_coordinates(address):
-    """Fetch latitude and longitude for a given address using Google Maps API, with caching."""
-    
-    # ✅ Check if address is already in cache
-    if address in geocode_cache:
-        print(f"🔹 Using cached data for: {address}")
-        return geocode_cache[address]["lat"], geocode_cache[address]["lng"]
+def normalize_address(address):
+    """
+    Cache key for an address: case, spacing, punctuation and common abbreviations don't matter.
+    "No. 1,  Jln Imbi , Kuala Lumpur." → "no 1, jalan imbi, kuala lumpur"
+    """
+    address = unicodedata.normalize("NFKC", address).lower()
+    address = re.sub(r"\s*,\s*", ", ", address)
+    words = [ADDRESS_ABBREVIATIONS.get(word, word) for word in address.split()]
+    return " ".join(words).strip(" ,.;")
+
+
+class GeocodeCache:
+    """
+    SQLite geocoding cache: one indexed row per normalized address, written in transactions
+    (crash-safe, safe for concurrent writers). Failed lookups are cached with an expiry.
+    """
+
+    def __init__(self, path=CACHE_PATH, legacy_file=LEGACY_CACHE_FILE):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "address_key TEXT PRIMARY KEY, lat REAL, lng REAL, status TEXT NOT NULL, expires_at REAL)"
+        )
+        if legacy_file and os.path.exists(legacy_file) and not len(self):
+            self._import_legacy(legacy_file)
+
+    def _connect(self):
+        # ✅ sqlite3 connections can't be shared across threads: keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy(self, legacy_file):
+        with open(legacy_file, "r") as file:
+            legacy = json.load(file)
+        self.put_many([(normalize_address(address), loc["lat"], loc["lng"], "OK") for address, loc in legacy.items()])
+        print(f"✅ Imported {len(legacy)} cached coordinates from {legacy_file}")
+
+    def get_many(self, keys):
+        """Returns {key: (lat, lng)} for fresh entries; cached failures map to (None, None)."""
+        conn = self._connect()
+        keys, found, now = list(keys), {}, time.time()
+        for i in range(0, len(keys), 500):  # ✅ Stay under SQLite's bound-parameter limit
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT address_key, lat, lng FROM geocode_cache WHERE address_key IN ({','.join('?' * len(chunk))}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (*chunk, now),
+            )
+            found.update((key, (lat, lng)) for key, lat, lng in rows)
+        return found
+
+    def put_many(self, entries):
+        """Stores [(key, lat, lng, status)] atomically; non-"OK" entries expire after `NEGATIVE_TTL_SECONDS`."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO geocode_cache (address_key, lat, lng, status, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, lat, lng, status, None if status == "OK" else now + NEGATIVE_TTL_SECONDS)
+                 for key, lat, lng, status in entries],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_http = threading.local()
 
-    # ✅ If not in cache, make API request
-    base_url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {"address": address, "key": API_KEY}
+
+def get_cache():
+    """The process-wide cache, opened on first use (not at import)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GeocodeCache()
+        return _cache
+
+
+def request_coordinates(address):
+    """One Google Maps API call. Returns (lat, lng, status); status "ERROR" on network failures."""
+    session = getattr(_http, "session", None)
+    if session is None:
+        session = _http.session = requests.Session()  # ✅ Keep-alive connection per thread
 
     try:
-        response = requests.get(base_url, params=params)
+        response = session.get(GEOCODE_URL, params={"address": address, "key": API_KEY}, timeout=10)
         response.raise_for_status()
         data = response.json()
 
         if data["status"] == "OK":
             location = data["results"][0]["geometry"]["location"]
-            
-            # ✅ Store result in cache
-            geocode_cache[address] = location
-            with open(CACHE_FILE, "w") as file:
-                json.dump(geocode_cache, file)
-
-            return location["lat"], location["lng"]
-        else:
-            print(f"❌ API Error: {data['status']}")
-            return None, None
+            return location["lat"], location["lng"], "OK"
+        print(f"❌ API Error: {data['status']} for {address}")
+        return None, None, data["status"]
 
     except requests.exceptions.RequestException as e:
         print(f"❌ Error fetching coordinates: {e}")
-        return None, None
+        return None, None, "ERROR"
+
+
+def get_coordinates_many(addresses, max_workers=GEOCODE_MAX_WORKERS, rate_limit=GEOCODE_RATE_LIMIT):
+    """
+    Geocodes many addresses: one cache query for all of them, then concurrent, rate-limited
+    API calls for the misses (each distinct normalized address is requested once).
+    Returns {address: (lat, lng)}, (None, None) where unknown.
+    """
+    cache = get_cache()
+    keys = {address: normalize_address(address) for address in addresses if address}
+    found = cache.get_many(set(keys.values()))
+
+    misses = {}  # normalized key → one original spelling to send to the API
+    for address, key in keys.items():
+        if key not in found:
+            misses.setdefault(key, address)
+
+    if misses:
+        limiter = RateLimiter(rate_limit)
+
+        def lookup(address):
+            limiter.acquire()
+            return request_coordinates(address)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(misses)))) as pool:
+            fetched = dict(zip(misses, pool.map(lookup, misses.values())))
+
+        # ✅ Cache hits and definitive misses; transient errors are retried next time
+        cache.put_many([
+            (key, lat, lng, status) for key, (lat, lng, status) in fetched.items()
+            if status == "OK" or status in NEGATIVE_STATUSES
+        ])
+        found.update((key, (lat, lng)) for key, (lat, lng, _) in fetched.items())
+
+    return {address: found.get(keys.get(address), (None, None)) for address in addresses}
+
+
+def get_coordinates(address):
+    """Fetch latitude and longitude for a given address using Google Maps API, with caching."""
+    return get_coordinates_many([address])[address]
+
 
 # ✅ Example usage
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
 from sqlalchemy.orm import Session
-from database import SessionLocal, SubwayOutlet  # Import database connection
+from database import SessionLocal, SubwayOutlet, init_db  # Import database connection
+from outlet_changes import (
+    CLASS_NAME, CONTENT_HASH_PROPERTY, CONTENT_HASH_SCHEMA, DELETE_CHUNK_SIZE, VECTORIZER, WEAVIATE_CONSUMER,
+    latest_version, outlet_properties, outlet_uuid, save_offset,
+)
 import weaviate
 from weaviate.auth import AuthApiKey  # ✅ Corrected import
+from weaviate.classes.query import Filter
+import argparse
 import os
 from dotenv import load_dotenv
 
@@ -22,18 +28,15 @@ try:
 except Exception:
     raise RuntimeError("Weaviate is not reachable. Ensure it's running and API key is correct.")
 
-# ✅ Define Collection Name
-CLASS_NAME = "SubwayOutlet"
-
 # ✅ Create Collection (if not exists)
 def create_collection():
     if not client.collections.exists(CLASS_NAME):  # ✅ Changed from `client.schema.exists()`
         schema = {
             "class": CLASS_NAME,
             "description": "Subway Outlet Locations and Details",
-            "vectorizer": "text2vec-weaviate",
+            "vectorizer": VECTORIZER,
             "moduleConfig": {
-                "text2vec-weaviate": {"vectorizeClassName": False}
+                VECTORIZER: {"vectorizeClassName": False}
             },
             "properties": [
                 {"name": "name", "dataType": ["string"], "description": "Outlet name"},
@@ -42,39 +45,93 @@ def create_collection():
                 {"name": "waze_link", "dataType": ["string"], "description": "Navigation link"},
                 {"name": "latitude", "dataType": ["number"], "description": "GPS Latitude"},
                 {"name": "longitude", "dataType": ["number"], "description": "GPS Longitude"},
+                CONTENT_HASH_SCHEMA,  # ✅ Filter-only, not vectorized
             ]
         }
-        client.collections.create(schema)  # ✅ Updated method for v4
+        client.collections.create_from_dict(schema)  # ✅ v4 takes dict schemas through `create_from_dict()`
         print("✅ Collection 'SubwayOutlet' created in Weaviate.")
     else:
         print("✅ Collection 'SubwayOutlet' already exists.")
+        ensure_content_hash_property(client.collections.get(CLASS_NAME))
 
-# ✅ Ingest Data into Weaviate
-def ingest_data():
+def ensure_content_hash_property(collection):
+    """Collections created before content hashing get the property explicitly (not via auto-schema, which would vectorize it)."""
+    if not any(prop.name == CONTENT_HASH_PROPERTY.name for prop in collection.config.get().properties):
+        collection.config.add_property(CONTENT_HASH_PROPERTY)
+        print("✅ Added non-vectorized 'content_hash' property to 'SubwayOutlet'.")
+
+# ✅ Deterministic object identity + content hash: `outlet_uuid()` / `outlet_properties()` (outlet_changes.py)
+
+def fetch_remote_hashes(collection):
+    """UUID → content hash of every object in Weaviate (None for objects ingested before hashing)."""
+    return {
+        str(obj.uuid): obj.properties.get("content_hash")
+        for obj in collection.iterator(return_properties=["content_hash"])
+    }
+
+# ✅ Sync Data into Weaviate
+def sync_data(full=False, dry_run=False):
+    """
+    Incremental sync of MySQL → Weaviate.
+    - Only new or changed rows (by content hash) are upserted, so only they get re-vectorized
+    - Objects whose outlet no longer exists (or with legacy random UUIDs) are deleted
+    - `full=True` re-uploads every row (still under deterministic UUIDs)
+    - Afterwards the API's change consumer only replays outbox entries newer than this sync
+    """
     create_collection()  # Ensure schema exists before ingestion
+    collection = client.collections.get(CLASS_NAME)
 
+    init_db()
+    data_version = latest_version()  # ✅ Read before the rows: later changes are left to the API's consumer
     with SessionLocal() as db:
         outlets = db.query(SubwayOutlet).all()
-        if not outlets:
-            print("⚠️ No Subway outlets found in MySQL database.")
-            return
-        
-        with client.batch.fixed_size(batch_size=10) as batch:  # ✅ Updated for v4
-            for outlet in outlets:
-                obj = {
-                    "name": outlet.name,
-                    "address": outlet.address,
-                    "operating_hours": outlet.operating_hours,
-                    "waze_link": outlet.waze_link,
-                    "latitude": outlet.latitude,
-                    "longitude": outlet.longitude
-                }
-                batch.add_object(collection=CLASS_NAME, properties=obj)  # ✅ Updated method
-                print(f"✅ Added: {outlet.name}")
-
-        print(f"✅ Successfully uploaded {len(outlets)} Subway outlets to Weaviate.")
-
-# ✅ Run the ingestion script
+    if not outlets:
+        print("⚠️ No Subway outlets found in MySQL database.")
+        return {"upserted": 0, "deleted": 0, "unchanged": 0}
+
+    local = {outlet_uuid(outlet.id): outlet_properties(outlet) for outlet in outlets}
+    remote = fetch_remote_hashes(collection)
+
+    to_upsert = [uuid for uuid, obj in local.items() if full or remote.get(uuid) != obj["content_hash"]]
+    to_delete = [uuid for uuid in remote if uuid not in local]
+    stats = {"upserted": len(to_upsert), "deleted": len(to_delete), "unchanged": len(local) - len(to_upsert)}
+
+    if dry_run:
+        print(f"🔍 Dry run: {stats}")
+        return stats
+
+    if to_upsert:
+        # ✅ Dynamic batching: the client sizes batches and parallel requests from server feedback
+        with client.batch.dynamic() as batch:
+            for uuid in to_upsert:
+                batch.add_object(collection=CLASS_NAME, properties=local[uuid], uuid=uuid)
+        failed = client.batch.failed_objects
+        if failed:
+            print(f"❌ {len(failed)} objects failed to upload, e.g. {failed[0].message}")
+            stats["upserted"] -= len(failed)
+            stats["failed"] = len(failed)
+
+    for i in range(0, len(to_delete), DELETE_CHUNK_SIZE):
+        collection.data.delete_many(where=Filter.by_id().contains_any(to_delete[i:i + DELETE_CHUNK_SIZE]))
+
+    if not stats.get("failed"):
+        save_offset(SessionLocal, WEAVIATE_CONSUMER, data_version)
+
+    print(f"✅ Weaviate sync complete: {stats['upserted']} upserted, {stats['deleted']} deleted, "
+          f"{stats['unchanged']} unchanged.")
+    return stats
+
+# ✅ Ingest Data into Weaviate (full re-upload)
+def ingest_data():
+    return sync_data(full=True)
+
+# ✅ Run the sync script
 if __name__ == "__main__":
-    ingest_data()
-    client.close()  # ✅ Close connection to avoid memory leaks
+    parser = argparse.ArgumentParser(description="Sync Subway outlets from MySQL to Weaviate")
+    parser.add_argument("--full", action="store_true", help="Re-upload every outlet, not just changed ones")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+    try:
+        sync_data(full=args.full, dry_run=args.dry_run)
+    finally:
+        client.close()  # ✅ Close connection to avoid memory leaks
@@ -0,0 +1,435 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+import httpx
+from metrics import LLM_ATTEMPTS, LLM_HEDGES, LLM_SECONDS
+
+# ✅ OpenRouter Configuration
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "meta-llama/llama-3.3-70b-instruct:free"
+
+# ✅ Model Routing Defaults
+DEFAULT_HEDGE_PERCENTILE = 95  # Fire a backup model once a call runs longer than this percentile
+DEFAULT_HEDGE_MIN_SAMPLES = 20  # Until then, hedge at `DEFAULT_HEDGE_FRACTION` of the model's budget
+DEFAULT_HEDGE_FRACTION = 0.5
+DEFAULT_FAILURE_THRESHOLD = 3  # Consecutive failures that open a model's circuit
+DEFAULT_COOLDOWN_SECONDS = 30.0  # How long an open circuit skips the model
+DEFAULT_HISTORY_SIZE = 200  # Latency samples kept per model (and per call kind)
+ADMITTED = object()  # First item of `_stream_once`: a concurrency slot was acquired, the model call starts now
+
+
+class LLMError(Exception):
+    pass
+
+
+def parse_models(spec, default_budget):
+    """
+    "model-a@20,model-b@8" → [("model-a", 20.0), ("model-b", 8.0)]; a model without "@budget" gets `default_budget`.
+    """
+    models = []
+    for item in (spec or "").split(","):
+        name, _, budget = item.strip().partition("@")
+        if name:
+            models.append((name, float(budget) if budget else default_budget))
+    return models
+
+
+class LatencyHistory:
+    """Sliding window of recent successful call latencies (seconds)."""
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class CircuitBreaker:
+    """
+    Stops routing to a model after `failure_threshold` consecutive failures.
+    After `cooldown` seconds it lets calls through again (half-open); one success closes it, one failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures, self.opened_at = 0, None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class ModelRoute:
+    """One model: its latency budget, latency history (completions and time to first token) and circuit breaker."""
+
+    def __init__(self, model, budget, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN_SECONDS,
+                 history_size=DEFAULT_HISTORY_SIZE):
+        self.model = model
+        self.budget = budget
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.history = {"complete": LatencyHistory(history_size), "stream": LatencyHistory(history_size)}
+
+    def hedge_delay(self, kind, percentile=DEFAULT_HEDGE_PERCENTILE, min_samples=DEFAULT_HEDGE_MIN_SAMPLES):
+        """Seconds to wait on this model before firing a backup."""
+        history = self.history[kind]
+        if len(history) < min_samples:
+            return self.budget * DEFAULT_HEDGE_FRACTION
+        return min(history.percentile(percentile), self.budget)
+
+    def record(self, kind, outcome, seconds=None):
+        LLM_ATTEMPTS.labels(self.model, kind, outcome).inc()
+        if outcome == "ok":
+            self.history[kind].record(seconds)
+            LLM_SECONDS.labels(self.model, kind).observe(seconds)
+            self.breaker.record_success()
+        elif outcome in ("error", "timeout"):
+            self.breaker.record_failure()
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "budget_s": self.budget,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            **{
+                kind: {"samples": len(h), "p50_s": h.percentile(50), "p95_s": h.percentile(95)}
+                for kind, h in self.history.items()
+            },
+        }
+
+
+class OpenRouterClient:
+    """
+    Shared async client for OpenRouter completions.
+    - One pooled `httpx.AsyncClient` (keep-alive connections reused across requests)
+    - Connect/read timeouts so a stalled upstream can't hang a request forever
+    - A semaphore caps how many LLM calls are in flight at once
+    - Several models in preference order, each with a latency budget and a circuit breaker:
+      a call still running after the model's p95 latency is hedged with the next model (first answer wins),
+      and a failed call falls back to the next model right away
+    - Budgets, hedge delays and latency samples start once a call holds a semaphore slot:
+      time queued in this worker is never blamed on the model
+    """
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, timeout=60.0, connect_timeout=5.0,
+                 max_concurrency=64, max_connections=100, url=OPENROUTER_URL, models=None,
+                 hedge_percentile=DEFAULT_HEDGE_PERCENTILE, hedge_min_samples=DEFAULT_HEDGE_MIN_SAMPLES,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN_SECONDS):
+        self.api_key = api_key
+        self.url = url
+        self.routes = [
+            ModelRoute(name, budget, failure_threshold, cooldown)
+            for name, budget in (models or [(model, timeout)])
+        ]
+        self.model = self.routes[0].model
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = None
+
+    @property
+    def http(self):
+        # ✅ Created on first use so it binds to the running event loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def warm_up(self):
+        """Opens a pooled connection (DNS + TLS) before the first real request; any HTTP response will do."""
+        try:
+            await self.http.get(self.url, headers=self.headers)
+            return True
+        except httpx.HTTPError as e:
+            logging.error(f"❌ OpenRouter warm-up failed: {str(e)}")
+            return False
+
+    def build_payload(self, prompt, model=None, **overrides):
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "max_tokens": 1000,
+            "temperature": 0.1,
+            "stop": ["User Query:"],
+        }
+        payload.update(overrides)
+        return payload
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def available_routes(self):
+        return [route for route in self.routes if route.breaker.allow()]
+
+    def stats(self):
+        return [route.stats() for route in self.routes]
+
+    def _hedge_delay(self, route, kind):
+        return route.hedge_delay(kind, self.hedge_percentile, self.hedge_min_samples)
+
+    @staticmethod
+    async def _wait(attempts, admitted, delay):
+        """
+        Finished attempts, waiting at most `delay` seconds once the latest attempt was `admitted` (an Event set when it
+        got a semaphore slot). While it is still queued there is nothing to hedge, so no timer runs.
+        """
+        if admitted is not None and not admitted.is_set():
+            waiter = asyncio.create_task(admitted.wait())
+            try:
+                done, _ = await asyncio.wait([*attempts, waiter], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            done.discard(waiter)
+            if done:
+                return done
+        done, _ = await asyncio.wait(attempts, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        return done
+
+    # ✅ Completions
+
+    async def _complete_once(self, route, prompt):
+        response = await self.http.post(self.url, headers=self.headers, json=self.build_payload(prompt, route.model))
+        if response.status_code != 200:
+            logging.error(f"❌ OpenRouter API Error ({route.model}): {response.status_code}, {response.text}")
+            raise LLMError(f"{response.status_code}, {response.text}")
+        return response.json().get("choices", [{}])[0].get("text", "No response received.")
+
+    async def _attempt(self, route, prompt, admitted):
+        """
+        One model's completion within its budget, timed from when it gets a semaphore slot (`admitted` is set then);
+        the outcome feeds its latency history and circuit breaker.
+        """
+        async with self._semaphore:
+            admitted.set()
+            return await self._timed_attempt(route, prompt)
+
+    async def _timed_attempt(self, route, prompt):
+        started = time.perf_counter()
+        try:
+            text = await asyncio.wait_for(self._complete_once(route, prompt), timeout=route.budget)
+        except asyncio.CancelledError:
+            route.record("complete", "cancelled")  # ✅ Lost a hedge race: not the model's fault
+            raise
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            logging.error(f"❌ OpenRouter API timed out ({route.model}, budget {route.budget}s)")
+            route.record("complete", "timeout")
+            raise LLMError("The language model took too long to respond.")
+        except LLMError:
+            route.record("complete", "error")
+            raise
+        except Exception as e:
+            logging.error(f"❌ Failed to connect to OpenRouter API ({route.model}): {str(e)}", exc_info=True)
+            route.record("complete", "error")
+            raise LLMError(str(e))
+        route.record("complete", "ok", time.perf_counter() - started)
+        return text
+
+    async def complete(self, prompt):
+        """
+        Returns the completion text, or an "Error: ..." string if every model failed.
+        """
+        routes = iter(self.available_routes())
+        attempts = {}  # task → route
+        admitted = {}  # route → Event set once its call holds a semaphore slot
+        last_error = "All language models are unavailable (circuit open)."
+
+        def launch():
+            route = next(routes, None)
+            if route is not None:
+                admitted[route] = asyncio.Event()
+                attempts[asyncio.create_task(self._attempt(route, prompt, admitted[route]))] = route
+            return route
+
+        latest = launch()
+        try:
+            while attempts:
+                delay = self._hedge_delay(latest, "complete") if latest is not None else None
+                done = await self._wait(attempts, admitted.get(latest), delay)
+                if not done:
+                    # ✅ Slower than usual: hedge with the next model, keep the first one running
+                    slow = latest
+                    latest = launch()
+                    if latest is not None:
+                        LLM_HEDGES.labels(slow.model).inc()
+                        logging.info(f"🔀 Hedging {slow.model} with {latest.model} after {delay:.1f}s")
+                    continue
+                for task in done:
+                    attempts.pop(task)
+                    try:
+                        return task.result()
+                    except LLMError as e:
+                        last_error = str(e)
+                        latest = launch() or latest  # ✅ Fall back to the next model right away
+        finally:
+            for task in attempts:
+                task.cancel()
+        return f"Error: {last_error}"
+
+    # ✅ Streaming
+
+    async def _stream_once(self, route, prompt):
+        """Yields one model's completion chunks; raises `LLMError` on upstream errors."""
+        payload = self.build_payload(prompt, route.model, stream=True)
+        async with self._semaphore:
+            yield ADMITTED  # ✅ Queueing for the slot is over: the caller starts the model's budget now
+            async with self.http.stream("POST", self.url, headers=self.headers, json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    logging.error(f"❌ OpenRouter API Error ({route.model}): {response.status_code}, {body}")
+                    raise LLMError(f"{response.status_code}, {body}")
+
+                async for line in response.aiter_lines():
+                    # ✅ Skip keep-alive comments (": OPENROUTER PROCESSING") and blank lines
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+
+                    chunk = json.loads(data)
+                    if "error" in chunk:
+                        logging.error(f"❌ OpenRouter stream error ({route.model}): {chunk['error']}")
+                        raise LLMError(chunk["error"].get("message", chunk["error"]))
+
+                    choice = (chunk.get("choices") or [{}])[0]
+                    text = choice.get("text") or (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+
+    async def _first_chunk(self, route, chunks, admitted):
+        """
+        Waits (within the model's budget, counted from when the stream gets a semaphore slot and `admitted` is set)
+        for a stream's first chunk; None if the answer is empty.
+        """
+        await anext(chunks)  # ✅ ADMITTED: time spent queueing in this worker is not the model's
+        admitted.set()
+        started = time.perf_counter()
+        try:
+            chunk = await asyncio.wait_for(anext(chunks, None), timeout=route.budget)
+        except asyncio.CancelledError:
+            route.record("stream", "cancelled")
+            raise
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            logging.error(f"❌ OpenRouter API timed out ({route.model}, budget {route.budget}s)")
+            route.record("stream", "timeout")
+            raise LLMError("The language model took too long to respond.")
+        except LLMError:
+            route.record("stream", "error")
+            raise
+        except Exception as e:
+            logging.error(f"❌ Failed to connect to OpenRouter API ({route.model}): {str(e)}", exc_info=True)
+            route.record("stream", "error")
+            raise LLMError(str(e))
+        route.record("stream", "ok", time.perf_counter() - started)
+        return chunk
+
+    async def stream(self, prompt):
+        """
+        Yields completion text chunks as OpenRouter streams them (SSE `data:` lines).
+        Hedging and fallback race on the first chunk; the winning model streams the rest.
+        Raises `LLMError` if every model failed, or if the winning stream breaks off (after the chunks so far),
+        so callers can tell a failed answer from a complete one.
+        """
+        routes = iter(self.available_routes())
+        attempts = {}  # task → (route, chunk iterator)
+        admitted = {}  # route → Event set once its stream holds a semaphore slot
+        last_error = "All language models are unavailable (circuit open)."
+
+        def launch():
+            route = next(routes, None)
+            if route is not None:
+                chunks = self._stream_once(route, prompt)
+                admitted[route] = asyncio.Event()
+                attempts[asyncio.create_task(self._first_chunk(route, chunks, admitted[route]))] = (route, chunks)
+            return route
+
+        latest, winner = launch(), None
+        try:
+            while attempts and winner is None:
+                delay = self._hedge_delay(latest, "stream") if latest is not None else None
+                done = await self._wait(attempts, admitted.get(latest), delay)
+                if not done:
+                    # ✅ No first token yet: hedge with the next model
+                    slow = latest
+                    latest = launch()
+                    if latest is not None:
+                        LLM_HEDGES.labels(slow.model).inc()
+                        logging.info(f"🔀 Hedging {slow.model} stream with {latest.model} after {delay:.1f}s")
+                    continue
+                for task in done:
+                    route, chunks = attempts.pop(task)
+                    try:
+                        first = task.result()
+                    except LLMError as e:
+                        last_error = str(e)
+                        latest = launch() or latest  # ✅ Fall back to the next model right away
+                        continue
+                    winner = (route, chunks, first)
+                    break
+        finally:
+            # ✅ Stop the losing streams (and close their connections)
+            for task in attempts:
+                task.cancel()
+            await asyncio.gather(*attempts, return_exceptions=True)
+            for _, chunks in attempts.values():
+                await chunks.aclose()
+
+        if winner is None:
+            raise LLMError(last_error)
+
+        route, chunks, first = winner
+        if first is None:
+            return
+        yield first
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except LLMError:
+            route.breaker.record_failure()
+            raise
+        except httpx.TimeoutException:
+            route.breaker.record_failure()
+            raise LLMError("The language model took too long to respond.")
+        except Exception as e:
+            logging.error(f"❌ OpenRouter stream failed ({route.model}): {str(e)}", exc_info=True)
+            route.breaker.record_failure()
+            raise LLMError(str(e))
+        finally:
+            await chunks.aclose()
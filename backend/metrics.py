@@ -0,0 +1,114 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+
+# ✅ Chat Pipeline Metrics (Prometheus)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds", "Time spent in each chat pipeline stage", ["stage", "intent"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds", "End-to-end chatbot request latency", ["endpoint", "intent"], buckets=LATENCY_BUCKETS
+)
+ERRORS = Counter("chatbot_errors_total", "Chatbot pipeline errors", ["stage"])
+COALESCED_REQUESTS = Counter(
+    "chatbot_coalesced_requests_total", "Requests that joined an identical in-flight request", ["endpoint"]
+)
+CACHE_LOOKUPS = Counter("chatbot_cache_lookups_total", "Response cache lookups", ["result"])
+LLM_ATTEMPTS = Counter(
+    "chatbot_llm_attempts_total", "LLM calls per model and outcome (ok/error/timeout/cancelled)", ["model", "kind", "outcome"]
+)
+LLM_HEDGES = Counter("chatbot_llm_hedges_total", "Backup model calls fired because a model was slow", ["model"])
+LLM_SECONDS = Histogram(
+    "chatbot_llm_seconds", "Successful LLM latency per model (completion, or time to first token)", ["model", "kind"],
+    buckets=LATENCY_BUCKETS,
+)
+RETRIEVED_OUTLETS = Histogram(
+    "chatbot_retrieved_outlets", "Outlets returned by retrieval", buckets=(0, 1, 5, 10, 20, 50, 100, 200)
+)
+PROMPT_TOKENS = Histogram(
+    "chatbot_prompt_tokens", "Estimated tokens of outlet data in LLM prompts", buckets=(0, 100, 250, 500, 1000, 2000, 4000)
+)
+RESPONSE_CHARS = Histogram(
+    "chatbot_response_chars", "Length of chatbot answers", buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000)
+)
+
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    Stage spans of one chatbot request. Fed into the histograms when the request ends,
+    and rendered as a `Server-Timing` header (or SSE payload) for the browser.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.intent = "unknown"
+        self.spans = []  # (stage, seconds) in execution order
+        self.started = time.perf_counter()
+
+    def record(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def finish(self):
+        total = self.total()
+        for stage, seconds in self.spans:
+            STAGE_SECONDS.labels(stage, self.intent).observe(seconds)
+        REQUEST_SECONDS.labels(self.endpoint, self.intent).observe(total)
+        return total
+
+    def as_dict(self):
+        return {**{stage: round(seconds * 1000, 1) for stage, seconds in self.spans}, "total": round(self.total() * 1000, 1)}
+
+    def server_timing(self):
+        """`Server-Timing` header value, e.g. `retrieval;dur=48.2, llm;dur=812.0, total;dur=865.3`."""
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.as_dict().items())
+
+
+def start_request(endpoint):
+    """Starts timing the current request; spans anywhere in its call tree attach to it."""
+    timings = RequestTimings(endpoint)
+    _current.set(timings)
+    return timings
+
+
+@contextmanager
+def span(stage):
+    """Times a pipeline stage of the current request; exceptions count as errors of that stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(stage).inc()
+        raise
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.record(stage, time.perf_counter() - started)
+
+
+def mark(stage):
+    """Records the time from request start to now (e.g. time to first token) as a span."""
+    timings = _current.get()
+    if timings is not None:
+        timings.record(stage, timings.total())
+
+
+def count_error(stage):
+    ERRORS.labels(stage).inc()
+
+
+def render_metrics():
+    """Prometheus exposition; aggregates all workers when `PROMETHEUS_MULTIPROC_DIR` is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,308 @@
+import json
+import re
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+# ✅ Schedule Configuration
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+MALAYSIA_TZ = timezone(timedelta(hours=8))  # No daylight saving in Malaysia
+
+DAY_NAMES = {
+    "monday": 0, "mon": 0,
+    "tuesday": 1, "tues": 1, "tue": 1,
+    "wednesday": 2, "wed": 2,
+    "thursday": 3, "thurs": 3, "thur": 3, "thu": 3,
+    "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5,
+    "sunday": 6, "sun": 6,
+}
+WEEKDAY_LABELS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# ✅ Tokens recognised in free-text operating hours ("Mon - Fri, 8:00 AM - 10:00 PM Public Holiday, Closed")
+TIME = r"\d{1,2}(?:[:.]\d{2})?\s*[ap]\.?m\.?"
+HOURS_TOKEN = re.compile(
+    rf"(?P<time>{TIME}|12\s*noon|noon|midnight)"
+    rf"|(?P<allday>24\s*(?:hours|hrs)|open\s+24)"
+    rf"|(?P<closed>closed)"
+    rf"|(?P<ph>public\s+holidays?|\bph\b)"
+    rf"|(?P<daily>\bdaily\b|every\s*day)"
+    rf"|(?P<day>\b(?:{'|'.join(sorted(DAY_NAMES, key=len, reverse=True))})\b)"
+    rf"|(?P<range>[-–—]|\bto\b|\buntil\b|\btill\b)",
+    re.IGNORECASE,
+)
+
+
+def parse_clock(text):
+    """ "8:00 AM" / "10.30pm" / "11pm" / "noon" / "midnight" → minutes after midnight."""
+    text = text.lower().replace(".", ":").replace(" ", "")
+    if "noon" in text:
+        return 12 * 60
+    if text == "midnight":
+        return 0
+    match = re.match(r"(\d{1,2})(?::(\d{2}))?:?([ap])", text)
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if hour > 12 or minute > 59:
+        return None
+    return (hour % 12 + (12 if meridiem == "p" else 0)) * 60 + minute
+
+
+def parse_operating_hours(hours_text):
+    """
+    Parses free-text operating hours into a structured schedule:
+    {"weekly": {"0": [[480, 1320]], ...}, "public_holiday": [[600, 1320]]}
+    - Keys of "weekly" are weekdays (0 = Monday), values are [open, close] minutes after midnight
+    - A close past midnight is stored as > 1440 (8:00 PM - 2:00 AM → [1200, 1560])
+    - `public_holiday` is [] when closed on public holidays and missing when not stated
+    Returns None if no hours could be recognised.
+    """
+    if not hours_text:
+        return None
+
+    tokens = [(match.lastgroup, match.group()) for match in HOURS_TOKEN.finditer(hours_text)]
+    weekly, public_holiday = {}, None
+    group_days, group_ph, group_used = set(), False, False
+
+    def assign(intervals):
+        nonlocal public_holiday
+        days = group_days if (group_days or group_ph) else set(range(7))  # ✅ No day given: every day
+        for day in days:
+            weekly.setdefault(day, []).extend(intervals)
+        if group_ph:
+            public_holiday = (public_holiday or []) + intervals
+
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+
+        if kind in ("day", "ph", "daily"):
+            if group_used:  # ✅ A day after hours starts a new "days → hours" group
+                group_days, group_ph, group_used = set(), False, False
+            if kind == "ph":
+                group_ph = True
+            elif kind == "daily":
+                group_days.update(range(7))
+            else:
+                day = DAY_NAMES[text.lower()]
+                # ✅ "Monday - Friday": add every day in the (possibly wrapping) range
+                if i >= 2 and tokens[i - 1][0] == "range" and tokens[i - 2][0] == "day":
+                    start = DAY_NAMES[tokens[i - 2][1].lower()]
+                    group_days.update((start + offset) % 7 for offset in range((day - start) % 7 + 1))
+                else:
+                    group_days.add(day)
+
+        elif kind == "time" and i + 2 < len(tokens) and tokens[i + 1][0] == "range" and tokens[i + 2][0] == "time":
+            opens, closes = parse_clock(text), parse_clock(tokens[i + 2][1])
+            if opens is not None and closes is not None:
+                if closes <= opens:
+                    closes += MINUTES_PER_DAY  # ✅ Closes after midnight (or 24h when equal)
+                assign([[opens, closes]])
+                group_used = True
+            i += 2
+
+        elif kind == "allday":
+            assign([[0, MINUTES_PER_DAY]])
+            group_used = True
+
+        elif kind == "closed":
+            if group_ph:
+                public_holiday = public_holiday or []
+            for day in group_days:
+                weekly.setdefault(day, [])
+            group_used = True
+
+        i += 1
+
+    if not weekly and public_holiday is None:
+        return None
+
+    schedule = {"weekly": {str(day): sorted(intervals) for day, intervals in sorted(weekly.items())}}
+    if public_holiday is not None:
+        schedule["public_holiday"] = sorted(public_holiday)
+    return schedule
+
+
+def load_schedule(value):
+    """Schedule from the `operating_schedule` column (JSON text) or an already-decoded dict."""
+    if not value:
+        return None
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def format_minutes(minutes):
+    return (datetime(2000, 1, 1) + timedelta(minutes=minutes % MINUTES_PER_DAY)).strftime("%I:%M %p").lstrip("0")
+
+
+def latest_close(schedule, weekday=None):
+    """Latest closing minute on `weekday` (or across the whole week), ignoring public holidays."""
+    if not schedule:
+        return None
+    days = [str(weekday)] if weekday is not None else schedule["weekly"].keys()
+    closes = [close for day in days for _, close in schedule["weekly"].get(day, [])]
+    return max(closes) if closes else None
+
+
+class OpeningHoursIndex:
+    """
+    Interval index over every outlet's weekly schedule.
+    - The week (in minutes) is cut into segments at every open/close time
+    - Each segment holds the set of outlets open throughout it, so "open at T" is one binary search
+    - Per-day "latest closing" lists are pre-sorted, so "closes latest" is a lookup
+    """
+
+    def __init__(self, schedules):
+        self.schedules = {outlet_id: s for outlet_id, s in schedules.items() if s}
+        self.holiday_ids = frozenset(i for i, s in self.schedules.items() if "public_holiday" in s)
+
+        week_intervals, holiday_intervals = [], []
+        for outlet_id, schedule in self.schedules.items():
+            week, holiday = self._intervals(outlet_id, schedule)
+            week_intervals += week
+            holiday_intervals += holiday
+
+        self._week_bounds, self._week_open = self._segments(week_intervals)
+        self._holiday_bounds, self._holiday_open = self._segments(holiday_intervals)
+
+        # ✅ Outlets sorted by latest closing time, per weekday and across the week
+        self._latest = {}
+        for weekday in [None] + list(range(7)):
+            ranked = [(latest_close(s, weekday), i) for i, s in self.schedules.items()]
+            self._latest[weekday] = sorted((r for r in ranked if r[0] is not None), reverse=True)
+
+    @staticmethod
+    def _intervals(outlet_id, schedule):
+        """(week intervals, public-holiday intervals) of one schedule, as (outlet_id, start, end) minutes."""
+        week_intervals, holiday_intervals = [], []
+        for day, intervals in schedule["weekly"].items():
+            for opens, closes in intervals:
+                start, end = int(day) * MINUTES_PER_DAY + opens, int(day) * MINUTES_PER_DAY + closes
+                week_intervals.append((outlet_id, start, min(end, MINUTES_PER_WEEK)))
+                if end > MINUTES_PER_WEEK:  # ✅ Sunday night past midnight wraps to Monday
+                    week_intervals.append((outlet_id, 0, end - MINUTES_PER_WEEK))
+        for opens, closes in schedule.get("public_holiday", []):
+            holiday_intervals.append((outlet_id, opens, min(closes, MINUTES_PER_DAY)))
+            if closes > MINUTES_PER_DAY:  # ✅ Holiday hours past midnight wrap to the early morning, like the week
+                holiday_intervals.append((outlet_id, 0, closes - MINUTES_PER_DAY))
+        return week_intervals, holiday_intervals
+
+    def with_changes(self, schedules, deleted_ids=()):
+        """
+        New index with `schedules` ({id: schedule or None}) replaced and `deleted_ids` dropped; this one is left untouched.
+        Touched outlets are taken out of the segments that held them and added to their new intervals
+        (splitting a segment where a new open/close time falls); other segments are shared as-is.
+        """
+        touched = schedules.keys() | set(deleted_ids)
+        index = OpeningHoursIndex.__new__(OpeningHoursIndex)
+        index.schedules = {i: s for i, s in self.schedules.items() if i not in touched}
+        index.schedules.update({i: s for i, s in schedules.items() if s})
+        index.holiday_ids = (self.holiday_ids - touched) | {i for i, s in schedules.items() if s and "public_holiday" in s}
+
+        week_intervals, holiday_intervals = [], []
+        for outlet_id, schedule in schedules.items():
+            if schedule:
+                week, holiday = self._intervals(outlet_id, schedule)
+                week_intervals += week
+                holiday_intervals += holiday
+        index._week_bounds, index._week_open = self._update_segments(self._week_bounds, self._week_open, touched, week_intervals)
+        index._holiday_bounds, index._holiday_open = self._update_segments(
+            self._holiday_bounds, self._holiday_open, touched, holiday_intervals
+        )
+
+        index._latest = {}
+        for weekday, ranked in self._latest.items():
+            new = [(latest_close(s, weekday), i) for i, s in schedules.items() if s]
+            kept = [r for r in ranked if r[1] not in touched]
+            index._latest[weekday] = sorted(kept + [r for r in new if r[0] is not None], reverse=True)
+        return index
+
+    @staticmethod
+    def _update_segments(bounds, open_sets, removed_ids, intervals):
+        """Segments with `removed_ids` taken out and `intervals` added (bounds split where they start or end)."""
+        bounds = list(bounds)
+        open_sets = [ids - removed_ids if not ids.isdisjoint(removed_ids) else ids for ids in open_sets]
+        for outlet_id, start, end in intervals:
+            if end <= start:
+                continue
+            for boundary in (start, end):
+                position = bisect_right(bounds, boundary) - 1
+                if bounds[position] != boundary:
+                    bounds.insert(position + 1, boundary)
+                    open_sets.insert(position + 1, open_sets[position])
+            first, last = bisect_right(bounds, start) - 1, bisect_right(bounds, end) - 1
+            for position in range(first, last):
+                open_sets[position] = open_sets[position] | {outlet_id}
+        return bounds, open_sets
+
+    @staticmethod
+    def _segments(intervals):
+        """Sweeps [start, end) intervals into boundary list + open-outlet set per segment."""
+        events = {}
+        for outlet_id, start, end in intervals:
+            if end > start:
+                events.setdefault(start, []).append((outlet_id, 1))
+                events.setdefault(end, []).append((outlet_id, -1))
+
+        bounds, open_sets, active = [0], [frozenset()], Counter()
+        for boundary in sorted(events):
+            for outlet_id, delta in events[boundary]:
+                active[outlet_id] += delta
+                if not active[outlet_id]:
+                    del active[outlet_id]
+            if boundary == bounds[-1]:
+                open_sets[-1] = frozenset(active)
+            else:
+                bounds.append(boundary)
+                open_sets.append(frozenset(active))
+        return bounds, open_sets
+
+    def open_at(self, weekday, minute, public_holiday=False):
+        """Outlet ids open at `minute` after midnight on `weekday` (0 = Monday)."""
+        t = weekday * MINUTES_PER_DAY + minute
+        open_ids = self._week_open[bisect_right(self._week_bounds, t) - 1]
+        if not public_holiday:
+            return open_ids
+
+        # ✅ Outlets with public-holiday rules follow those instead of the weekday hours
+        holiday_open = self._holiday_open[bisect_right(self._holiday_bounds, minute) - 1]
+        return (open_ids - self.holiday_ids) | holiday_open
+
+    def closes_latest(self, weekday=None, candidates=None):
+        """
+        (latest closing minute, [outlet ids]) on `weekday` (or any day), optionally among `candidates`.
+        """
+        ranked = self._latest[weekday]
+        if candidates is not None:
+            ranked = [r for r in ranked if r[1] in candidates]
+        if not ranked:
+            return None, []
+        latest = ranked[0][0]
+        return latest, sorted(i for close, i in ranked if close == latest)
+
+
+def parse_time_query(query, now=None):
+    """
+    Reads the moment a query asks about: "open now", "open at 11pm on sunday", "open tonight at 10:30pm".
+    Returns (weekday, minute, public_holiday) or None if the query names no time.
+    """
+    now = now or datetime.now(MALAYSIA_TZ)
+    query = query.lower()
+    public_holiday = bool(re.search(r"public\s+holiday|\bph\b", query))
+
+    weekday = now.weekday()
+    if "tomorrow" in query:
+        weekday = (weekday + 1) % 7
+    day_match = re.search(rf"\b({'|'.join(sorted(DAY_NAMES, key=len, reverse=True))})\b", query)
+    if day_match:
+        weekday = DAY_NAMES[day_match.group(1)]
+
+    time_match = re.search(rf"({TIME}|noon|midnight)", query)
+    if time_match:
+        minute = parse_clock(time_match.group(1))
+        if minute is not None:
+            return weekday, minute, public_holiday
+    if re.search(r"\b(now|right now|currently)\b", query):
+        return weekday, now.hour * 60 + now.minute, public_holiday
+    return None
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import weaviate.classes as wvc
+from weaviate.classes.config import DataType, Property, Tokenization
+from weaviate.classes.query import Filter
+from weaviate.util import generate_uuid5
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, SubwayOutlet, OutletChange, OutletChangeOffset, OutletChangeLease
+from outlet_snapshot import outlets_from_rows
+
+# ✅ Change Consumer Defaults
+DEFAULT_POLL_SECONDS = 2.0  # How often the API checks the outbox for new scrapes
+DEFAULT_BATCH_SIZE = 1000  # Outbox rows applied per step
+WEAVIATE_CONSUMER = "weaviate"  # Offset name for the Weaviate sync (shared with ingest_data.py)
+DEFAULT_LEASE_SECONDS = 30.0  # A Weaviate sync leader that stops renewing is replaced after this long
+
+# ✅ Weaviate object layout (shared with ingest_data.py)
+CLASS_NAME = "SubwayOutlet"
+SYNCED_FIELDS = ("name", "address", "operating_hours", "waze_link", "latitude", "longitude")
+DELETE_CHUNK_SIZE = 500  # UUIDs per delete_many request
+VECTORIZER = "text2vec-weaviate"
+
+# ✅ `content_hash` is bookkeeping only: filterable, never searched or embedded into the outlet's vector
+CONTENT_HASH_PROPERTY = Property(
+    name="content_hash",
+    data_type=DataType.TEXT,
+    description="Hash of the synced fields",
+    tokenization=Tokenization.FIELD,
+    index_filterable=True,
+    index_searchable=False,
+    skip_vectorization=True,
+    vectorize_property_name=False,
+)
+CONTENT_HASH_SCHEMA = {
+    "name": "content_hash",
+    "dataType": ["text"],
+    "description": "Hash of the synced fields",
+    "tokenization": "field",
+    "indexFilterable": True,
+    "indexSearchable": False,
+    "moduleConfig": {VECTORIZER: {"skip": True, "vectorizePropertyName": False}},
+}
+
+
+def outlet_uuid(outlet_id):
+    """Same outlet primary key → same Weaviate UUID, so re-runs overwrite instead of duplicating."""
+    return generate_uuid5(f"subway-outlet/{outlet_id}")
+
+
+def outlet_properties(outlet):
+    obj = {field: getattr(outlet, field) for field in SYNCED_FIELDS}
+    obj["content_hash"] = hashlib.sha1(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+    return obj
+
+
+class ChangeBatch:
+    """
+    A run of outbox rows (`changes` = [(version, outlet id)]) plus the current state of the touched outlets.
+    Outlets missing from `outlets` no longer exist in the table (deleted).
+    """
+
+    def __init__(self, changes, outlets, schedules):
+        self.changes = changes
+        self.version = changes[-1][0]
+        self.outlets = outlets
+        self.schedules = schedules
+
+    def touched_since(self, version):
+        return {outlet_id for change_version, outlet_id in self.changes if change_version > version}
+
+    def subset(self, outlet_ids):
+        """(outlets, schedules, deleted ids) restricted to `outlet_ids`."""
+        outlets = {i: self.outlets[i] for i in outlet_ids if i in self.outlets}
+        return outlets, {i: self.schedules.get(i) for i in outlets}, outlet_ids - outlets.keys()
+
+
+def latest_version(session_factory=SessionLocal):
+    with session_factory() as db:
+        return db.query(func.max(OutletChange.version)).scalar() or 0
+
+
+def read_changes(session_factory, since, limit=DEFAULT_BATCH_SIZE):
+    """The next `limit` outbox rows after version `since`, with their outlets re-read (None if nothing is new)."""
+    with session_factory() as db:
+        changes = [
+            (version, outlet_id)
+            for version, outlet_id in db.query(OutletChange.version, OutletChange.outlet_id)
+            .filter(OutletChange.version > since).order_by(OutletChange.version).limit(limit)
+        ]
+        if not changes:
+            return None
+        rows = db.query(SubwayOutlet).filter(SubwayOutlet.id.in_({outlet_id for _, outlet_id in changes})).all()
+        outlets, schedules = outlets_from_rows(rows)
+    return ChangeBatch(changes, {outlet.id: outlet for outlet in outlets}, schedules)
+
+
+def read_offset(session_factory, consumer):
+    with session_factory() as db:
+        offset = db.get(OutletChangeOffset, consumer)
+        return offset.version if offset is not None else 0
+
+
+def save_offset(session_factory, consumer, version):
+    """Stores how far `consumer` has applied the outbox (never moves backwards)."""
+    with session_factory() as db:
+        with db.begin():
+            offset = db.get(OutletChangeOffset, consumer)
+            if offset is None:
+                db.add(OutletChangeOffset(consumer=consumer, version=version))
+            elif offset.version < version:
+                offset.version = version
+
+
+def acquire_lease(session_factory, consumer, holder, lease_seconds):
+    """Takes or renews `consumer`'s lease for `holder`; True if `holder` now leads (one leader across all hosts)."""
+    now = time.time()
+    try:
+        with session_factory() as db:
+            with db.begin():
+                lease = db.query(OutletChangeLease).filter(OutletChangeLease.consumer == consumer).with_for_update().one_or_none()
+                if lease is None:
+                    db.add(OutletChangeLease(consumer=consumer, holder=holder, expires_at=now + lease_seconds))
+                elif lease.holder == holder or lease.expires_at < now:
+                    lease.holder, lease.expires_at = holder, now + lease_seconds
+                else:
+                    return False
+    except IntegrityError:
+        return False  # ✅ Another worker created the lease row first
+    return True
+
+
+def release_lease(session_factory, consumer, holder):
+    """Lets another worker take over right away instead of waiting for the lease to expire."""
+    with session_factory() as db:
+        with db.begin():
+            db.query(OutletChangeLease).filter(
+                OutletChangeLease.consumer == consumer, OutletChangeLease.holder == holder
+            ).update({OutletChangeLease.expires_at: 0.0})
+
+
+async def sync_weaviate_changes(client, outlet_ids, outlets):
+    """Upserts the touched outlets that still exist and deletes the rest; only these objects are re-vectorized."""
+    collection = client.collections.get(CLASS_NAME)
+    objects = [
+        wvc.data.DataObject(properties=outlet_properties(outlets[i]), uuid=outlet_uuid(i))
+        for i in sorted(outlet_ids) if i in outlets
+    ]
+    deleted = [outlet_uuid(i) for i in sorted(outlet_ids) if i not in outlets]
+
+    if objects:
+        result = await collection.data.insert_many(objects)  # ✅ Batch import: an existing UUID is overwritten
+        if result.has_errors:
+            error = next(iter(result.errors.values()))
+            raise RuntimeError(f"{len(result.errors)} Weaviate objects failed to upload, e.g. {error.message}")
+    for i in range(0, len(deleted), DELETE_CHUNK_SIZE):
+        await collection.data.delete_many(where=Filter.by_id().contains_any(deleted[i:i + DELETE_CHUNK_SIZE]))
+    return len(objects), len(deleted)
+
+
+class OutletChangeConsumer:
+    """
+    Tails the `outlet_changes` outbox that `scraping.py` fills and applies only the touched outlets:
+    - to the in-memory outlet snapshot (`OutletSnapshotStore.apply_changes`), tracked by `store.data_version`;
+      every worker does this, except with a shared snapshot file, where only the refresher does and the others follow the file
+    - to Weaviate (when it is the retriever), tracked by a durable offset so missed scrapes are caught up after a restart;
+      only the worker holding the `outlet_change_leases` row does this, so objects are re-vectorized once
+    """
+
+    def __init__(self, store, session_factory=SessionLocal, weaviate_connection=None,
+                 poll_seconds=DEFAULT_POLL_SECONDS, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.store = store
+        self.session_factory = session_factory
+        self.weaviate_connection = weaviate_connection
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.weaviate_version = None  # ✅ Read from `outlet_change_offsets` on becoming leader
+        self.applied = 0
+        self.synced = 0
+        self.last_change_at = None
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.poll_seconds:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                await asyncio.to_thread(release_lease, self.session_factory, WEAVIATE_CONSUMER, self.holder)
+            except Exception as e:
+                logging.error(f"❌ Failed to release the Weaviate sync lease: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                while await self.poll():  # ✅ Drain a backlog batch by batch
+                    pass
+            except Exception as e:
+                # ✅ Retried on the next poll; cursors only advance after a batch is applied
+                logging.error(f"❌ Outlet change consumer failed: {str(e)}", exc_info=True)
+
+    async def poll(self):
+        """Applies the next outbox batch; returns True if it was full (more rows may be waiting)."""
+        if self.store.loaded is None:
+            return False
+        apply_snapshot = not self.store.snapshot_path or self.store.is_refresher()
+        sync_weaviate = self.weaviate_connection is not None and await self._lead()
+
+        cursors = [self.store.data_version] if apply_snapshot else []
+        if sync_weaviate:
+            if self.weaviate_version is None:
+                self.weaviate_version = await asyncio.to_thread(read_offset, self.session_factory, WEAVIATE_CONSUMER)
+            cursors.append(self.weaviate_version)
+        if not cursors:
+            return False
+
+        batch = await asyncio.to_thread(read_changes, self.session_factory, min(cursors), self.batch_size)
+        if batch is None:
+            return False
+
+        outlet_ids = batch.touched_since(self.store.data_version) if apply_snapshot else None
+        if outlet_ids:
+            outlets, schedules, deleted = batch.subset(outlet_ids)
+            snapshot = await asyncio.to_thread(self.store.apply_changes, batch.version, outlets, schedules, deleted)
+            self.applied += len(outlet_ids)
+            self.last_change_at = time.time()
+            logging.info(f"✅ Applied {len(outlets)} changed / {len(deleted)} deleted outlet(s) up to data version "
+                         f"{batch.version} (snapshot {snapshot.version})")
+
+        if sync_weaviate and batch.version > self.weaviate_version:
+            client = await self.weaviate_connection.get()
+            upserted, deleted = await sync_weaviate_changes(client, batch.touched_since(self.weaviate_version), batch.outlets)
+            await asyncio.to_thread(save_offset, self.session_factory, WEAVIATE_CONSUMER, batch.version)
+            self.weaviate_version = batch.version
+            self.synced += upserted + deleted
+            logging.info(f"✅ Weaviate synced up to data version {batch.version}: {upserted} upserted, {deleted} deleted")
+
+        return len(batch.changes) >= self.batch_size
+
+    async def _lead(self):
+        """Takes or renews the Weaviate sync lease; a new leader re-reads the offset its predecessor saved."""
+        leader = await asyncio.to_thread(acquire_lease, self.session_factory, WEAVIATE_CONSUMER, self.holder, self.lease_seconds)
+        if leader and not self.is_leader:
+            self.weaviate_version = None
+            logging.info(f"✅ This worker ({self.holder}) syncs outlet changes to Weaviate")
+        self.is_leader = leader
+        return leader
+
+    def stats(self):
+        return {
+            "data_version": self.store.data_version,
+            "weaviate_leader": self.is_leader,
+            "weaviate_version": self.weaviate_version,
+            "outlets_applied": self.applied,
+            "weaviate_objects_synced": self.synced,
+            "last_change_at": self.last_change_at,
+        }
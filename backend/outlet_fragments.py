@@ -0,0 +1,64 @@
+from operating_hours import WEEKDAY_LABELS, format_minutes
+from prompt_context import compact_line
+
+
+def waze_anchor(waze_link):
+    waze_link = (waze_link or '').strip()
+    # ✅ Ensure Waze link is correctly formatted
+    if not waze_link or waze_link in ['#', 'None']:
+        return "No Waze link available"
+    return (
+        f'<a href="{waze_link}" target="_blank" rel="noopener noreferrer" '
+        f'style="color: #007bff; text-decoration: none;">🚗 Navigate Here</a>'
+    )
+
+
+def format_intervals(intervals):
+    return ", ".join(f"{format_minutes(o)} - {format_minutes(c)}" for o, c in intervals)
+
+
+class OutletFragments:
+    """
+    Display pieces of one outlet, rendered once per snapshot and reused by every answer.
+    - `card(weekday)`: the opening-hours answer card (with that weekday's hours if given)
+    - `list_item`: the `<li>` used by count answers
+    - `prompt_line`: the compact "Name | Address | Hours" line sent to Llama-3
+    """
+
+    __slots__ = ("head", "tail", "day_lines", "list_item", "prompt_line")
+
+    def __init__(self, outlet, schedule):
+        holiday_hours = schedule.get("public_holiday") if schedule else None
+        if holiday_hours is None:
+            holiday_status = "Not stated"
+        elif not holiday_hours:
+            holiday_status = "Closed"
+        else:
+            holiday_status = format_intervals(holiday_hours)
+
+        self.head = (
+            f"<b>{outlet.name}</b><br>"
+            f"📍 Address: {outlet.address or 'Not available'}<br>"
+            f"🕒 Operating Hours: {outlet.operating_hours or 'N/A'}<br>"
+        )
+        self.tail = (
+            f"🚦 Public Holiday Status: {holiday_status}<br>"
+            f"🌍 Location: Latitude {outlet.latitude}, Longitude {outlet.longitude}<br>"
+            f"{waze_anchor(outlet.waze_link)}<br>"
+        )
+        self.day_lines = tuple(
+            f"📅 {label}: {format_intervals(schedule['weekly'].get(str(day), [])) or 'Closed'}<br>" if schedule else ""
+            for day, label in enumerate(WEEKDAY_LABELS)
+        )
+        self.list_item = f"<li>🏪 <b>{outlet.name}</b></li>"
+        self.prompt_line = compact_line(outlet.name, outlet.address, outlet.operating_hours)
+
+    def card(self, weekday=None):
+        if weekday is None:
+            return self.head + self.tail
+        return self.head + self.day_lines[weekday] + self.tail
+
+
+def build_fragments(outlets, schedules):
+    """{outlet id: OutletFragments} for a snapshot."""
+    return {outlet.id: OutletFragments(outlet, schedules.get(outlet.id)) for outlet in outlets}
@@ -0,0 +1,320 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+import orjson
+from sqlalchemy import func
+from database import SessionLocal, SubwayOutlet, OutletChange
+from schemas import SubwayOutletSchema
+from spatial_index import SpatialIndex
+from gazetteer import Gazetteer
+from operating_hours import OpeningHoursIndex, load_schedule, parse_operating_hours
+from outlet_fragments import build_fragments
+from compression import compress
+from snapshot_file import SnapshotFile, MappedOutlets, MappedById, MappedByKey, MappedFragments, write_snapshot_file
+
+try:
+    import fcntl  # ✅ Optional: elects one refresher per host; without it every worker refreshes (writes stay atomic)
+except ImportError:
+    fcntl = None
+
+# ✅ Snapshot Configuration
+DEFAULT_REFRESH_SECONDS = 300  # Reload the outlet table every 5 minutes
+DEFAULT_POLL_SECONDS = 1.0  # How often workers check the shared snapshot file for a new version
+MAX_DELTAS = 16  # Change batches a snapshot remembers, so indexes built on an older version can catch up incrementally
+
+
+class OutletSnapshot:
+    """
+    Immutable, process-level copy of the `subway_outlets` table.
+    - `body` holds the ready-to-send JSON bytes for `GET /outlets` (compressed copies are made once, on demand)
+    - `fragments` holds each outlet's answer HTML and prompt line, rendered once
+    - `version` is a content hash, so identical data always has the same ETag
+    - Built from a mapped `SnapshotFile`, `outlets`, `by_id`, `schedules`, `fragments`, `prompt_lines` and
+      `ids_by_key` are lazy views that decode one row from the shared file when a request reads it;
+      only the gazetteer and opening-hours index are built per worker
+    - Built from a `base` snapshot plus `changes` = ({id: outlet}, deleted ids), the spatial grid, gazetteer and
+      opening-hours index are patched for the touched outlets instead of rebuilt; `deltas` records the change
+      batches since, so `changes_since()` lets other indexes (the local retriever's) catch up the same way
+    """
+
+    def __init__(self, outlets, schedules=None, mapped=None, fragments=None, base=None, changes=None):
+        self.outlets = outlets
+        self.mapped = mapped
+        if mapped is not None:
+            self.by_id = MappedById(mapped, SnapshotFile.outlet)
+            self.ids = mapped.ids
+            self.body = mapped.section("body")
+            self.version = mapped.version
+        else:
+            self.by_id = {outlet.id: outlet for outlet in outlets}
+            self.ids = np.sort(np.array([outlet.id for outlet in outlets], dtype=np.int64))
+            self.body = orjson.dumps([outlet.model_dump() for outlet in outlets])
+            self.version = hashlib.sha1(self.body).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        self.loaded_at = time.time()
+        self.schedules = schedules if schedules is not None else {
+            outlet.id: parse_operating_hours(outlet.operating_hours) for outlet in outlets
+        }
+        if base is not None:
+            # ✅ Patch the base snapshot's indexes for the touched outlets only
+            changed, deleted_ids = changes
+            self.spatial_index = base.spatial_index.with_changes(changed, deleted_ids, lookup=self.by_id if mapped else None)
+            self.gazetteer = base.gazetteer.with_changes(changed, deleted_ids)
+            self.hours_index = base.hours_index.with_changes({i: self.schedules.get(i) for i in changed}, deleted_ids)
+            self.deltas = (*base.deltas, (base.version, frozenset(changed.keys() | set(deleted_ids))))[-MAX_DELTAS:]
+        else:
+            if mapped is not None:
+                self.spatial_index = SpatialIndex(self.by_id, columns=(mapped.ids, mapped.latitudes, mapped.longitudes))
+            else:
+                self.spatial_index = SpatialIndex(outlets)
+            self.gazetteer = Gazetteer(outlets)
+            self.hours_index = OpeningHoursIndex(self.schedules)
+            self.deltas = ()
+        if mapped is not None:
+            self.fragments = MappedById(mapped, MappedFragments)
+            self.prompt_lines = MappedByKey(mapped, lambda file, row: file.string(row, "prompt_line"))
+            self.ids_by_key = MappedByKey(mapped, lambda file, row: int(file.ids[row]))
+        else:
+            self.fragments = fragments if fragments is not None else build_fragments(outlets, self.schedules)
+            self.prompt_lines = {(outlet.name, outlet.address): self.fragments[outlet.id].prompt_line for outlet in outlets}
+            self.ids_by_key = {(outlet.name, outlet.address): outlet.id for outlet in outlets}  # ✅ Search hits → outlet ids
+        self._encoded_bodies = {}
+
+    @classmethod
+    def from_file(cls, mapped, base=None):
+        """
+        Snapshot over a mapped file. If the file records the change batch that produced it from `base`'s
+        version, `base`'s indexes are patched for the touched outlets instead of rebuilt.
+        """
+        outlets, schedules = MappedOutlets(mapped), MappedById(mapped, SnapshotFile.schedule)
+        if base is None or mapped.changes is None or mapped.changes["base"] != base.version:
+            return cls(outlets, schedules, mapped=mapped)
+        rows = {i: mapped.row_of(i) for i in mapped.changes["ids"]}
+        changed = {i: mapped.outlet(row) for i, row in rows.items() if row is not None}
+        deleted_ids = [i for i, row in rows.items() if row is None]
+        return cls(outlets, schedules, mapped=mapped, base=base, changes=(changed, deleted_ids))
+
+    def with_changes(self, outlets, schedules, deleted_ids=()):
+        """
+        New snapshot with `outlets` ({id: outlet}) added or replaced and `deleted_ids` removed.
+        Unchanged outlets keep their parsed schedules and rendered fragments, and the indexes are patched, not rebuilt.
+        """
+        merged, merged_schedules = merge_changes(self.outlets, self.schedules, outlets, schedules, deleted_ids)
+        changed = outlets.keys() | set(deleted_ids)
+        fragments = {i: f for i, f in self.fragments.items() if i not in changed}
+        fragments.update(build_fragments(outlets.values(), schedules))
+        return OutletSnapshot(merged, merged_schedules, fragments=fragments, base=self, changes=(outlets, deleted_ids))
+
+    def changes_since(self, version):
+        """Ids touched since the snapshot with `version` (empty if it is this one), or None if it is too old to tell."""
+        if version == self.version:
+            return set()
+        touched = set()
+        for base_version, ids in reversed(self.deltas):
+            touched |= ids
+            if base_version == version:
+                return touched
+        return None
+
+    def encoded_body(self, encoding):
+        """`body` compressed with "br"/"gzip" at the best level; computed once per snapshot."""
+        encoded = self._encoded_bodies.get(encoding)
+        if encoded is None and self.mapped is not None:
+            encoded = self.mapped.section(f"body.{encoding}")  # ✅ Compressed by the refresher, shared by every worker
+        if encoded is None:
+            encoded = self._encoded_bodies[encoding] = compress(self.body, encoding, best=True)
+        return encoded
+
+    def matches(self, if_none_match, etag=None):
+        """True if an `If-None-Match` header already names this snapshot's ETag (or a derived `etag`)."""
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or (etag or self.etag) in tags
+
+    def page(self, bbox=None, after=None, limit=None):
+        """
+        Keyset page of outlets, ordered by id: those with id > `after`, optionally inside
+        `bbox` = (south, west, north, east). Returns (outlets, next_after); next_after is None on the last page.
+        """
+        ids = self.ids if bbox is None else self.spatial_index.within_bbox(*bbox)
+        if after is not None:
+            ids = ids[np.searchsorted(ids, after, side="right"):]
+
+        next_after = None
+        if limit is not None and len(ids) > limit:
+            ids = ids[:limit]
+            next_after = int(ids[-1])
+        return [self.by_id[int(outlet_id)] for outlet_id in ids], next_after
+
+
+def outlets_from_rows(rows):
+    """`SubwayOutlet` rows → (outlet schemas, {id: schedule})."""
+    outlets = [SubwayOutletSchema.model_validate(row) for row in rows]
+    # ✅ Rows scraped before schedules existed are parsed here, once per load
+    schedules = {row.id: load_schedule(row.operating_schedule) or parse_operating_hours(row.operating_hours) for row in rows}
+    return outlets, schedules
+
+
+def merge_changes(outlets, schedules, changed_outlets, changed_schedules, deleted_ids=()):
+    """Outlet list (by id) and schedules with `changed_outlets` ({id: outlet}) upserted and `deleted_ids` dropped."""
+    changed = changed_outlets.keys() | set(deleted_ids)
+    merged = sorted([o for o in outlets if o.id not in changed] + list(changed_outlets.values()), key=lambda o: o.id)
+    merged_schedules = {i: schedule for i, schedule in schedules.items() if i not in changed}
+    merged_schedules.update({i: changed_schedules.get(i) for i in changed_outlets})
+    return merged, merged_schedules
+
+
+class OutletSnapshotStore:
+    """
+    Holds the current `OutletSnapshot` and swaps in a new one on reload.
+    Readers never lock: they grab whatever snapshot is current.
+
+    With `snapshot_path` (multi-worker serving), the table goes through a shared memory-mapped file:
+    - One worker per host (holding `<snapshot_path>.lock`) reloads MySQL every `refresh_seconds` and writes the file
+    - Every worker polls the file every `poll_seconds` and maps each new version, so they all switch together
+    """
+
+    def __init__(self, session_factory=SessionLocal, refresh_seconds=DEFAULT_REFRESH_SECONDS, snapshot_path=None,
+                 poll_seconds=DEFAULT_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self.snapshot_path = snapshot_path
+        self.poll_seconds = poll_seconds
+        self._snapshot = None
+        self.data_version = 0  # ✅ Last `outlet_changes` version reflected in the snapshot
+        self._file_key = None
+        self._lock_file = None
+        self._reload_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        """The current snapshot, or None if nothing has loaded yet (never touches MySQL)."""
+        return self._snapshot
+
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is None and self.snapshot_path:
+            snapshot = self.load_file()  # ✅ Another worker already published the data: map it, skip MySQL
+        return snapshot if snapshot is not None else self.reload()
+
+    def load(self):
+        """Initial load: the shared snapshot file if there is one, otherwise the outlet table."""
+        return (self.snapshot_path and self.load_file()) or self.reload()
+
+    def reload(self):
+        """Re-read the outlet table; keeps the old snapshot if the data is unchanged."""
+        with self._reload_lock:
+            with self.session_factory() as db:
+                # ✅ Read the outbox position first: changes committed after it are (re)applied by `apply_changes`
+                data_version = db.query(func.max(OutletChange.version)).scalar() or 0
+                outlets, schedules = outlets_from_rows(db.query(SubwayOutlet).order_by(SubwayOutlet.id).all())
+
+            self.data_version = max(self.data_version, data_version)
+            if self.snapshot_path:
+                write_snapshot_file(self.snapshot_path, outlets, schedules)  # ✅ No-op if the file already has this version
+                return self.load_file()
+
+            snapshot = OutletSnapshot(outlets, schedules)
+            return self._swap(snapshot)
+
+    def apply_changes(self, version, outlets, schedules, deleted_ids=()):
+        """
+        Applies one batch of the change outbox (up to `version`) without re-reading the table:
+        `outlets` ({id: outlet}) are added or replaced and `deleted_ids` removed.
+        """
+        with self._reload_lock:
+            current = self.current()
+            if self.snapshot_path:
+                merged, merged_schedules = merge_changes(current.outlets, current.schedules, outlets, schedules, deleted_ids)
+                # ✅ Record the batch, so workers holding `current` patch their indexes instead of rebuilding them
+                changes = {"base": current.version, "ids": sorted(outlets.keys() | set(deleted_ids))}
+                write_snapshot_file(self.snapshot_path, merged, merged_schedules, changes=changes)
+                snapshot = self.load_file()
+            else:
+                snapshot = self._swap(current.with_changes(outlets, schedules, deleted_ids))
+            self.data_version = max(self.data_version, version)
+            return snapshot
+
+    def load_file(self):
+        """Maps the shared snapshot file if it changed since the last call; returns the current snapshot (None if no file)."""
+        with self._reload_lock:
+            try:
+                stat = os.stat(self.snapshot_path)
+            except FileNotFoundError:
+                return self._snapshot
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if key == self._file_key:
+                return self._snapshot
+
+            try:
+                mapped = SnapshotFile(self.snapshot_path)
+            except ValueError as e:
+                # ✅ e.g. written by an older release: the refresher's next reload rewrites it
+                logging.error(f"❌ Unreadable snapshot file {self.snapshot_path}: {str(e)}")
+                return self._snapshot
+            self._file_key = (mapped.stat.st_ino, mapped.stat.st_mtime_ns, mapped.stat.st_size)
+            if self._snapshot is not None and self._snapshot.version == mapped.version:
+                return self._snapshot
+            return self._swap(OutletSnapshot.from_file(mapped, base=self._snapshot))
+
+    def _swap(self, snapshot):
+        if self._snapshot is not None and self._snapshot.version == snapshot.version:
+            return self._snapshot
+
+        self._snapshot = snapshot  # ✅ Atomic reference swap
+        source = f" (mapped from {self.snapshot_path})" if snapshot.mapped is not None else ""
+        logging.info(f"✅ Outlet snapshot loaded: {len(snapshot.outlets)} outlets, version {snapshot.version}{source}")
+        return snapshot
+
+    def is_refresher(self):
+        """True if this process reloads MySQL for the host: it holds the snapshot file's lock (taken on first call)."""
+        if not self.snapshot_path or fcntl is None:
+            return True
+        if self._lock_file is None:
+            lock_file = open(f"{self.snapshot_path}.lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)  # ✅ Released automatically if this worker dies
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            logging.info(f"✅ This worker (pid {os.getpid()}) refreshes {self.snapshot_path}")
+        return True
+
+    def start_background_refresh(self):
+        if self._thread is not None or not (self.refresh_seconds or self.snapshot_path):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="outlet-snapshot-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # ✅ Lets another worker take over refreshing
+            self._lock_file = None
+
+    def _refresh_loop(self):
+        interval = self.poll_seconds if self.snapshot_path else self.refresh_seconds
+        next_reload = time.monotonic() + self.refresh_seconds
+        while not self._stop.wait(interval):
+            try:
+                if not self.snapshot_path:
+                    self.reload()
+                elif self.refresh_seconds and time.monotonic() >= next_reload and self.is_refresher():
+                    next_reload = time.monotonic() + self.refresh_seconds
+                    self.reload()
+                else:
+                    self.load_file()  # ✅ Pick up what the refresher (or a POST /outlets/reload) published
+            except Exception as e:
+                # ✅ Keep serving the last good snapshot if MySQL is unavailable
+                logging.error(f"❌ Outlet snapshot reload failed: {str(e)}", exc_info=True)
@@ -0,0 +1,74 @@
+import math
+import re
+from collections import namedtuple
+
+# ✅ Prompt Context Configuration
+DEFAULT_TOKEN_BUDGET = 1200  # Max estimated tokens of outlet data in the prompt
+DEFAULT_MAX_OUTLETS = 20  # Never send more than this many outlets, however small
+CHARS_PER_TOKEN = 4  # Rough average for English/Malay text with Llama tokenizers
+FIELD_WEIGHTS = {"name": 3.0, "address": 2.0, "operating_hours": 1.0}
+STOPWORDS = {
+    "the", "a", "an", "is", "are", "in", "at", "on", "of", "to", "for", "and", "or", "which", "what", "where",
+    "subway", "outlet", "outlets", "near", "any", "me", "there", "do", "does", "that", "with", "can", "i",
+}
+
+PromptContext = namedtuple("PromptContext", ["text", "outlets", "tokens"])
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token); no tokenizer round trip needed."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def query_terms(query):
+    return {token for token in re.findall(r"[a-z0-9]+", query.lower()) if token not in STOPWORDS}
+
+
+def rerank(query, outlets):
+    """
+    Orders retrieved outlets by field-weighted term overlap with the query.
+    Ties keep the retriever's order, which also breaks in as a small rank prior.
+    """
+    terms = query_terms(query)
+
+    def score(item):
+        rank, outlet = item
+        overlap = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            words = set(re.findall(r"[a-z0-9]+", str(outlet.properties.get(field) or "").lower()))
+            overlap += weight * len(terms & words)
+        return overlap + 1.0 / (rank + 1)
+
+    return [outlet for _, outlet in sorted(enumerate(outlets), key=score, reverse=True)]
+
+
+def compact_line(name, address, operating_hours):
+    """One outlet as a single plain-text line: "Name | Address | Hours"."""
+    fields = [name or "Unknown", address or "", operating_hours or ""]
+    return " | ".join(re.sub(r"\s+", " ", str(field)).strip() for field in fields if field)
+
+
+def compact_outlet_line(outlet):
+    properties = outlet.properties
+    return compact_line(properties.get("name"), properties.get("address"), properties.get("operating_hours"))
+
+
+def build_prompt_context(query, outlets, token_budget=DEFAULT_TOKEN_BUDGET, max_outlets=DEFAULT_MAX_OUTLETS, lines_by_key=None):
+    """
+    Reranks `outlets` against the query and keeps the best ones that fit in `token_budget`.
+    Prompt size stays flat no matter how many outlets the retriever returns.
+    `lines_by_key` maps (name, address) to a precompiled line (the outlet snapshot's); others are built here.
+    """
+    lines_by_key = lines_by_key or {}
+    lines, used, tokens = [], [], 0
+    for outlet in rerank(query, outlets):
+        if len(used) >= max_outlets:
+            break
+        line = lines_by_key.get((outlet.properties.get("name"), outlet.properties.get("address"))) or compact_outlet_line(outlet)
+        line_tokens = estimate_tokens(line) + 1  # ✅ +1 for the newline
+        if tokens + line_tokens > token_budget:
+            break
+        lines.append(line)
+        used.append(outlet)
+        tokens += line_tokens
+    return PromptContext("\n".join(lines), used, tokens)
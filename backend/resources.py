@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+
+# ✅ Lazy Initialization Defaults
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 0.5  # Doubled after every failed attempt
+DEFAULT_COOLDOWN_SECONDS = 5.0  # Fail fast for this long after all retries failed
+
+
+class ResourceUnavailable(RuntimeError):
+    pass
+
+
+class LazyResource:
+    """
+    An upstream dependency (database, Weaviate, ...) initialized on first use instead of at import.
+    - Concurrent callers share one initialization attempt
+    - Failed attempts are retried with exponential backoff
+    - After giving up, callers fail fast for `cooldown` seconds instead of piling up retries
+    - `check(value)` is an optional cheap liveness ping used by `probe`
+    """
+
+    def __init__(self, name, init, close=None, check=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF_SECONDS,
+                 cooldown=DEFAULT_COOLDOWN_SECONDS):
+        self.name = name
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.value = None
+        self.error = None
+        self._init = init
+        self._close = close
+        self._check = check
+        self._ready = False
+        self._failed_at = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self):
+        return self._ready
+
+    async def get(self):
+        if self._ready:
+            return self.value
+        async with self._lock:
+            if self._ready:
+                return self.value
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.cooldown:
+                raise ResourceUnavailable(f"{self.name} unavailable: {self.error}")
+
+            for attempt in range(1, self.retries + 1):
+                started = time.perf_counter()
+                try:
+                    self.value = await self._init()
+                except Exception as e:
+                    self.error = str(e) or e.__class__.__name__
+                    logging.error(f"❌ {self.name} initialization failed (attempt {attempt}/{self.retries}): {self.error}")
+                    if attempt < self.retries:
+                        await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                    continue
+                self._ready, self.error, self._failed_at = True, None, None
+                logging.info(f"✅ {self.name} ready in {time.perf_counter() - started:.2f}s")
+                return self.value
+
+            self._failed_at = time.monotonic()
+            raise ResourceUnavailable(f"{self.name} unavailable: {self.error}")
+
+    async def probe(self, timeout):
+        """True if initialized and (with `check`) answering within `timeout` seconds; never initializes."""
+        if not self._ready:
+            return False
+        if self._check is None:
+            return True
+        try:
+            alive = bool(await asyncio.wait_for(self._check(self.value), timeout))
+        except Exception as e:
+            alive, self.error = False, str(e) or e.__class__.__name__
+        else:
+            self.error = None if alive else "health check failed"
+        return alive
+
+    def status(self):
+        return {"ready": self._ready, "error": self.error}
+
+    async def close(self):
+        if self._ready and self._close is not None:
+            await self._close(self.value)
+        self._ready, self.value = False, None
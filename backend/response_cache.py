@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ✅ Response Cache Configuration
+DEFAULT_TTL_SECONDS = 3600  # Cached answers expire after 1 hour
+DEFAULT_MAX_ENTRIES = 1024  # LRU bound per cache
+
+
+def normalize_cache_query(query):
+    """
+    Normalizes query text so trivially different phrasings share a cache entry.
+    "How many outlets in Bangsar?" → "how many outlets in bangsar"
+    """
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class MemoryCacheBackend:
+    """In-process LRU + TTL store (one copy per worker)."""
+
+    blocking = False
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key → (expires_at, value)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)  # ✅ Mark as most recently used
+        return value
+
+    def set(self, key, value, ttl):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # ✅ Evict least recently used
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk LRU + TTL store shared by every worker on the host.
+    Uses WAL mode so readers in one worker don't block writers in another.
+    """
+
+    blocking = True
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache (accessed_at)")
+
+    def _connect(self):
+        # ✅ sqlite3 connections can't be shared across threads: keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl, now),
+        )
+        # ✅ Drop expired rows, then the least recently used ones past the bound
+        conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+        conn.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            "SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        self._connect().execute("DELETE FROM response_cache")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Chatbot answer cache keyed on (outlet data version, normalized query).
+    A new data version (e.g. after a re-scrape) misses every old entry, which then ages out.
+    """
+
+    def __init__(self, backend, ttl=DEFAULT_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query, data_version):
+        return f"{data_version}|{normalize_cache_query(query)}"
+
+    async def _call(self, fn, *args):
+        # ✅ Disk-backed stores run off the event loop
+        if self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def get(self, query, data_version):
+        value = await self._call(self.backend.get, self.key(query, data_version))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, query, data_version, value):
+        await self._call(self.backend.set, self.key(query, data_version), value, self.ttl)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_response_cache(backend="memory", ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, path="response_cache.db"):
+    """
+    Builds the configured cache: "memory", "sqlite", or "none" (returns None).
+    """
+    backend = (backend or "none").lower()
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return ResponseCache(MemoryCacheBackend(max_entries), ttl)
+    if backend == "sqlite":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return ResponseCache(SQLiteCacheBackend(path, max_entries), ttl)
+    raise ValueError(f"Unknown response cache backend: {backend}")
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+import re
+import time
+import zlib
+import numpy as np
+import weaviate.classes as wvc
+
+# ✅ Retriever Configuration
+BM25_K1 = 1.2
+BM25_B = 0.75
+DENSE_DIM = 256  # Hashed character n-gram embedding size
+SEARCH_FIELDS = ("name", "address", "operating_hours")
+STALE_VECTORS_GRACE_SECONDS = 300  # Vector files unused for this long (by any worker) may be removed
+
+
+class RetrievedOutlet:
+    """One search hit. `properties` mirrors the Weaviate object properties."""
+
+    __slots__ = ("id", "properties", "score")
+
+    def __init__(self, properties, id=None, score=None):
+        self.id = id
+        self.properties = properties
+        self.score = score
+
+
+class WeaviateRetriever:
+    """Hybrid search in Weaviate Cloud (the original retrieval path)."""
+
+    def __init__(self, client, collection="SubwayOutlet"):
+        self.client = client
+        self.collection = collection
+
+    async def search(self, query_text, alpha=0.7, limit=100):
+        subway_outlets = self.client.collections.get(self.collection)
+
+        response = await subway_outlets.query.hybrid(
+            query=query_text,
+            alpha=alpha,
+            return_metadata=wvc.query.MetadataQuery(score=False),  # ✅ Score removed
+            limit=limit
+        )
+
+        return [RetrievedOutlet(obj.properties, id=obj.uuid) for obj in response.objects or []]
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+def hashed_ngram_embedding(text, dim=DENSE_DIM, n=3):
+    """
+    Dense vector from hashed character n-grams (crc32, so identical in every process).
+    Tolerates typos and partial words ("bangsr" ≈ "bangsar") without a model download.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in tokenize(text):
+        padded = f" {word} "
+        for i in range(max(len(padded) - n + 1, 1)):
+            h = zlib.crc32(padded[i:i + n].encode("utf-8"))
+            vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def min_max(scores):
+    """Scales scores to [0, 1] like Weaviate's relative score fusion."""
+    low, high = scores.min(), scores.max()
+    return (scores - low) / (high - low) if high > low else np.zeros_like(scores)
+
+
+class LocalHybridIndex:
+    """
+    In-process hybrid index over one outlet snapshot.
+    - BM25 postings per term (NumPy arrays of doc rows + precomputed term weights)
+    - Dense document vectors in a memory-mapped `.npy` matrix shared by every worker
+    - Built from a `base` index and the `changed_ids` since its version, only the changed outlets are
+      re-tokenized and re-embedded; the others' term counts and vector rows are carried over
+    """
+
+    def __init__(self, snapshot, vectors_dir, embed=hashed_ngram_embedding, base=None, changed_ids=()):
+        self.version = snapshot.version
+        self.embed = embed
+        self.ids = [outlet.id for outlet in snapshot.outlets]
+        base_rows = {} if base is None else {i: row for row, i in enumerate(base.ids) if i not in changed_ids}
+
+        self.properties, self.term_counts, documents = [], [], {}
+        for row, outlet in enumerate(snapshot.outlets):
+            old = base_rows.get(outlet.id)
+            if old is not None:
+                self.properties.append(base.properties[old])
+                self.term_counts.append(base.term_counts[old])
+                continue
+            properties = {field: value for field, value in outlet.model_dump().items() if field != "id"}
+            documents[row] = " ".join(str(properties.get(field) or "") for field in SEARCH_FIELDS)
+            self.properties.append(properties)
+            counts = {}
+            for token in tokenize(documents[row]):
+                counts[token] = counts.get(token, 0) + 1
+            self.term_counts.append(counts)
+
+        self._build_bm25(self.term_counts)
+        self.vectors = self._load_vectors(documents, vectors_dir, base, base_rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build_bm25(self, term_counts):
+        # ✅ idf and the average length are corpus-wide, so every posting's weight is recomputed (from the kept counts)
+        lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+        avg_length = lengths.mean() if len(lengths) else 0.0
+
+        postings = {}
+        for row, counts in enumerate(term_counts):
+            for token, tf in counts.items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(row)
+                postings[token][1].append(tf)
+
+        # ✅ Precompute idf * saturated tf per posting, so a query is a handful of vector adds
+        n_docs = len(term_counts)
+        self.postings = {}
+        for token, (rows, tfs) in postings.items():
+            rows = np.array(rows, dtype=np.int64)
+            tfs = np.array(tfs, dtype=np.float32)
+            idf = np.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / avg_length)
+            self.postings[token] = (rows, (idf * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32))
+
+    def _load_vectors(self, documents, vectors_dir, base=None, base_rows=None):
+        """
+        Maps `outlet_vectors-<version>.npy`, building it first if no worker has yet:
+        rows in `base_rows` are copied from `base`'s matrix, `documents` ({row: text}) are embedded.
+        """
+        path = os.path.join(vectors_dir, f"outlet_vectors-{self.version}.npy")
+        for attempt in range(2):
+            if not os.path.exists(path):
+                os.makedirs(vectors_dir, exist_ok=True)
+                matrix = np.zeros((len(self.ids), DENSE_DIM), np.float32)
+                kept = [(row, base_rows[i]) for row, i in enumerate(self.ids) if base_rows and i in base_rows]
+                if kept:
+                    rows, old_rows = zip(*kept)
+                    matrix[list(rows)] = base.vectors[list(old_rows)]
+                for row, document in documents.items():
+                    matrix[row] = self.embed(document)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as file:
+                    np.save(file, matrix.astype(np.float32))
+                os.replace(tmp_path, path)  # ✅ Atomic: other workers never map a half-written file
+                self._remove_stale_vectors(vectors_dir, path)
+            try:
+                vectors = np.load(path, mmap_mode="r")
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                logging.info(f"🔍 {path} was removed before it could be mapped; rebuilding it")
+                continue
+            try:
+                os.utime(path)  # ✅ Marks the file as in use, so other workers' cleanup leaves it alone
+            except OSError:
+                pass
+            return vectors
+
+    @staticmethod
+    def _remove_stale_vectors(vectors_dir, current_path):
+        """Removes other versions' files once no worker has mapped them for `STALE_VECTORS_GRACE_SECONDS`."""
+        cutoff = time.time() - STALE_VECTORS_GRACE_SECONDS
+        for name in os.listdir(vectors_dir):
+            path = os.path.join(vectors_dir, name)
+            if name.startswith("outlet_vectors-") and name.endswith(".npy") and path != current_path:
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)  # ✅ Workers still mapping the old file keep their copy until they rebuild
+                except OSError:
+                    pass
+
+    def bm25_scores(self, query_text):
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query_text)):
+            if token in self.postings:
+                rows, weights = self.postings[token]
+                scores[rows] += weights
+        return scores
+
+    def search(self, query_text, alpha=0.7, limit=100):
+        if not self.ids or limit <= 0:
+            return []
+
+        # ✅ Same weighting as Weaviate hybrid: alpha * vector + (1 - alpha) * keyword
+        keyword = self.bm25_scores(query_text)
+        dense = np.asarray(self.vectors @ self.embed(query_text))
+        fused = alpha * min_max(dense) + (1 - alpha) * min_max(keyword)
+
+        limit = min(limit, len(self.ids))
+        top = np.argpartition(-fused, limit - 1)[:limit]
+        top = top[np.argsort(-fused[top], kind="stable")]
+        return [RetrievedOutlet(self.properties[row], id=self.ids[row], score=float(fused[row])) for row in top]
+
+
+class LocalHybridRetriever:
+    """
+    Retriever backed by `LocalHybridIndex`, updated whenever the outlet snapshot changes
+    (patched for the changed outlets if the snapshot knows them, otherwise rebuilt).
+    No network calls: retrieval cost is a few NumPy operations.
+    """
+
+    def __init__(self, snapshot_provider, vectors_dir="vector_index"):
+        self.snapshot_provider = snapshot_provider
+        self.vectors_dir = vectors_dir
+        self._index = None
+        self._lock = asyncio.Lock()
+
+    async def index(self):
+        snapshot = await self.snapshot_provider()
+        if self._index is None or self._index.version != snapshot.version:
+            async with self._lock:
+                if self._index is None or self._index.version != snapshot.version:
+                    changed_ids = snapshot.changes_since(self._index.version) if self._index is not None else None
+                    base = self._index if changed_ids is not None else None
+                    self._index = await asyncio.to_thread(
+                        LocalHybridIndex, snapshot, self.vectors_dir, base=base, changed_ids=changed_ids or ()
+                    )
+                    action = f"updated ({len(changed_ids)} changed)" if base is not None else "built"
+                    logging.info(f"✅ Local hybrid index {action}: {len(self._index)} outlets, version {snapshot.version}")
+        return self._index
+
+    async def search(self, query_text, alpha=0.7, limit=100):
+        return (await self.index()).search(query_text, alpha=alpha, limit=limit)
+
+
+def create_retriever(backend, weaviate_client=None, snapshot_provider=None, vectors_dir="vector_index"):
+    """
+    Builds the configured retriever: "weaviate" (Weaviate Cloud hybrid search) or "local" (in-process).
+    """
+    backend = (backend or "weaviate").lower()
+    if backend == "weaviate":
+        return WeaviateRetriever(weaviate_client)
+    if backend == "local":
+        return LocalHybridRetriever(snapshot_provider, vectors_dir)
+    raise ValueError(f"Unknown retriever backend: {backend}")
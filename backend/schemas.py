@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Tuple
 
 # ✅ Define API Response Schema
 class SubwayOutletSchema(BaseModel):
@@ -14,6 +14,34 @@ class SubwayOutletSchema(BaseModel):
     class Config:
          from_attributes = True  # ✅ Replace 'orm_mode' with 'from_attributes'
 
+# ✅ Define Map Marker Schema (compact projection of an outlet: `GET /outlets?fields=marker`)
+class OutletMarkerSchema(BaseModel):
+    id: int
+    name: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+# ✅ Define Nearby Search Response Schema (outlet + distance from the search point)
+class NearbyOutletSchema(SubwayOutletSchema):
+    distance_m: float
+
+# ✅ Define Overlap Response Schema (outlet pairs whose catchment circles intersect)
+class OutletOverlapsSchema(BaseModel):
+    radius_m: float
+    pairs: List[Tuple[int, int, float]]  # ✅ (outlet_id_a, outlet_id_b, distance_m)
+    highlighted_ids: List[int]  # ✅ Outlets that overlap at least one other outlet
+
 # ✅ Define Request Schema for Chatbot Query
 class ChatbotRequest(BaseModel):
-    query: str  # ✅ Expects JSON { "query": "your question" }
\ No newline at end of file
+    query: str  # ✅ Expects JSON { "query": "your question" }
+    session_id: Optional[str] = None  # ✅ Returned by the previous answer; enables follow-up questions
+
+# ✅ Define Request Schema for Batch Chatbot Queries (answers stream back as NDJSON)
+class ChatbotBatchRequest(BaseModel):
+    queries: List[str]
+    concurrency: Optional[int] = None  # ✅ Max Llama-3 calls in flight for this batch (capped by the server)
+
+# ✅ Define Response Schema for Chatbot Answers (serialized straight to JSON bytes by FastAPI)
+class ChatbotResponse(BaseModel):
+    response: str
+    session_id: Optional[str] = None
@@ -1,172 +1,325 @@
+import argparse
+import json
+import os
+import queue
+import re
+import threading
 import time
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
-from sqlalchemy import text
-from database import SessionLocal
-from geocoding import get_coordinates  
+from sqlalchemy import func
+from database import SessionLocal, OutletChange, bulk_upsert_outlets, init_db
+from geocoding import get_coordinates_many
+from operating_hours import parse_operating_hours
 
-# ✅ Database connection (MySQL)
-session = SessionLocal()
+# ✅ Scraper Configuration
+BASE_URL = "https://subway.com.my/find-a-subway"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36"
+DEFAULT_REGIONS = [
+    "kuala lumpur", "selangor", "putrajaya", "negeri sembilan", "melaka", "johor", "pahang", "terengganu",
+    "kelantan", "perak", "penang", "kedah", "perlis", "sabah", "sarawak", "labuan",
+]
+DEFAULT_WORKERS = 4
+PAGE_TIMEOUT = 15  # Seconds to wait for search results to render
+MAX_RETRIES = 3
+RETRY_BACKOFF = 2.0  # Seconds, multiplied by the attempt number
 
-# ✅ Set up Selenium WebDriver
-options = webdriver.ChromeOptions()
-options.add_argument("--headless")  # Run in background (remove for debugging)
-options.add_argument("--no-sandbox")
-options.add_argument("--disable-dev-shm-usage")
-options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36")
 
-driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+def region_slug(term):
+    return re.sub(r"[^a-z0-9]+", "-", term.lower()).strip("-")
+
+
+def fixture_path(fixtures_dir, term, page_no):
+    return os.path.join(fixtures_dir, region_slug(term), f"page-{page_no}.html")
+
+
+# ✅ Page Sources: a live browser, or saved HTML for offline replay
+class BrowserPageSource:
+    """One headless Chrome, owned by a single worker thread."""
+
+    def __init__(self, driver_path):
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless")  # Run in background (remove for debugging)
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument(f"user-agent={USER_AGENT}")
+        self.driver = webdriver.Chrome(service=Service(driver_path), options=options)
+
+    def fetch(self, term, page_no, url=None):
+        """Page 1 runs the search for `term`; later pages open the pagination `url`."""
+        if page_no == 1:
+            self.driver.get(BASE_URL)
+            search_box = WebDriverWait(self.driver, PAGE_TIMEOUT).until(
+                EC.presence_of_element_located((By.ID, "fp_searchAddress"))
+            )
+            previous = self._first_result()
+            search_box.clear()
+            search_box.send_keys(term)
+            WebDriverWait(self.driver, PAGE_TIMEOUT).until(
+                EC.element_to_be_clickable((By.ID, "fp_searchAddressBtn"))
+            ).click()
+            return self._wait_for_results(previous)
+
+        self.driver.get(url)
+        return self._wait_for_results()
+
+    def _first_result(self):
+        results = self.driver.find_elements(By.CLASS_NAME, "location_left")
+        return results[0] if results else None
+
+    def _wait_for_results(self, previous=None):
+        """Waits for the results to (re)render instead of sleeping a fixed time."""
+        wait = WebDriverWait(self.driver, PAGE_TIMEOUT)
+        if previous is not None:
+            wait.until(EC.staleness_of(previous))  # ✅ Old results replaced by the new search
+        wait.until(EC.presence_of_element_located((By.CLASS_NAME, "location_left")))
+        return self.driver.page_source
+
+    def close(self):
+        self.driver.quit()  # Close the browser
 
-# ✅ Load the Website
-BASE_URL = "https://subway.com.my/find-a-subway"
-driver.get(BASE_URL)
-#time.sleep(5)  # Wait for JavaScript to load content
 
-# ✅ Locate the search box and button using correct IDs
-search_box = WebDriverWait(driver, 10).until(
-    EC.presence_of_element_located((By.ID, "fp_searchAddress"))
-)
-search_box.clear()
-search_box.send_keys("kuala lumpur")
+class FixturePageSource:
+    """Replays pages saved with `--record` (<dir>/<region>/page-<n>.html); `latency` simulates page loads."""
 
-# Click the search button
-search_button = WebDriverWait(driver, 10).until(
-    EC.element_to_be_clickable((By.ID, "fp_searchAddressBtn"))
-)
-search_button.click()
+    def __init__(self, fixtures_dir, latency=0.0):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
 
-# Wait for search results to load
-#time.sleep(5)
+    def fetch(self, term, page_no, url=None):
+        if self.latency:
+            time.sleep(self.latency)
+        path = fixture_path(self.fixtures_dir, term, page_no)
+        if page_no == 1 and not os.path.exists(path):
+            return ""  # ✅ No fixtures recorded for this region
+        with open(path, encoding="utf-8") as file:
+            return file.read()
+
+    def close(self):
+        pass
+
+
+# ✅ Web Scraping Functions (plain HTML in, so live pages and fixtures parse the same way)
+def extract_operating_hours(info_box):
+    """Returns (address, operating hours) from an outlet's info box."""
+    paragraphs = info_box.find_all("p")  # ✅ Extract all <p> elements
+
+    # ✅ Remove empty text and "Find out more..."
+    filtered_paragraphs = [p.text.strip() for p in paragraphs if p.text.strip() and "Find out more" not in p.text]
+    if not filtered_paragraphs:
+        return None, "N/A"
+
+    # ✅ First <p> is the address; process only operating hours (ignore the first paragraph)
+    operating_hours_lines = []
+    for current_line in filtered_paragraphs[1:]:
+        # ✅ If the previous line contains operating hours, merge it
+        if operating_hours_lines and any(kw in current_line.lower() for kw in ["am", "pm", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]):
+            operating_hours_lines[-1] += f" {current_line}"  # ✅ Merge line
+        else:
+            operating_hours_lines.append(current_line)  # ✅ Add new line
+
+    return filtered_paragraphs[0], " ".join(operating_hours_lines) if operating_hours_lines else "N/A"
 
-# ✅ Extract updated HTML after JavaScript execution
-soup = BeautifulSoup(driver.page_source, "html.parser")
 
-# ✅ Web Scraping Function with Debugging
 def extract_data(page_soup):
+    """Returns (name, address, operating_hours, waze_link) for every outlet on a results page."""
     outlets = []
-    direction_buttons = driver.find_elements(By.CLASS_NAME, "directionButton")  # Selenium extracts dynamic content
-    info_boxes = driver.find_elements(By.CLASS_NAME, "infoboxcontent")  # Extract dynamically loaded information
+    direction_buttons = page_soup.find_all(class_="directionButton")
+    info_boxes = page_soup.find_all(class_="infoboxcontent")
 
     for outlet, button, info_box in zip(page_soup.find_all("div", class_="location_left"), direction_buttons, info_boxes):
         try:
             name = outlet.find("h4").text.strip()
             address = outlet.find("p").text.strip()
 
-            # Ensure only "Kuala Lumpur" locations are extracted
-            if "kuala lumpur" not in address.lower():
-                continue
-
-            # Extract operating hours using Selenium
             operating_hours = "N/A"
             try:
-                raw_html = info_box.get_attribute("innerHTML")
-                soup = BeautifulSoup(raw_html, "html.parser")
-                
-                paragraphs = soup.find_all("p")  # ✅ Extract all <p> elements
-                
-                # ✅ Remove empty text and "Find out more..."
-                filtered_paragraphs = [p.text.strip() for p in paragraphs if p.text.strip() and "Find out more" not in p.text]
-                
-                # ✅ Separate address and operating hours
-                if filtered_paragraphs:
-                    address = filtered_paragraphs[0]  # ✅ First <p> is the address
-                    
-                    # ✅ Process only operating hours (ignore the first paragraph)
-                    operating_hours_lines = []
-                    for i in range(1, len(filtered_paragraphs)):  # ✅ Start from second paragraph
-                        current_line = filtered_paragraphs[i]
-                        
-                        # ✅ If the previous line contains operating hours, merge it
-                        if operating_hours_lines and any(kw in current_line.lower() for kw in ["am", "pm", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]):
-                            operating_hours_lines[-1] += f" {current_line}"  # ✅ Merge line
-                        else:
-                            operating_hours_lines.append(current_line)  # ✅ Add new line
-
-                    if operating_hours_lines:
-                        operating_hours = " ".join(operating_hours_lines)  # ✅ Merge all operating hours
-
+                info_address, operating_hours = extract_operating_hours(info_box)
+                address = info_address or address
             except Exception as e:
                 print(f"❌ Error extracting operating hours for {name}: {e}")
 
-            # ✅ Fetch latitude & longitude using Google Maps API
-            latitude, longitude = None, None
-            if address:
-                latitude, longitude = get_coordinates(address)
-                
-            # Extract Waze link using Selenium
+            # Extract Waze link
             waze_link = "N/A"
-            links = button.find_elements(By.TAG_NAME, "a")
-            for link in links:
-                href = link.get_attribute("href")
-                if "waze.com" in href:  # Ensure it's a Waze link
-                    waze_link = href
+            for link in button.find_all("a", href=True):
+                if "waze.com" in link["href"]:  # Ensure it's a Waze link
+                    waze_link = link["href"]
                     break
 
-            # ✅ Store data
-            outlets.append((name, address, operating_hours, latitude, longitude, waze_link))
+            outlets.append((name, address, operating_hours, waze_link))
         except AttributeError:
             continue
     return outlets
 
 
-# ✅ Scrape the Subway locations
-outlets = extract_data(soup)
+def parse_page(page_html):
+    """Returns (outlets, next page URL or None)."""
+    page_soup = BeautifulSoup(page_html, "html.parser")
+    next_button = page_soup.find("a", class_="next-page")
+    return extract_data(page_soup), next_button["href"] if next_button and next_button.get("href") else None
 
-# ✅ Handle Pagination
-while True:
-    next_button = soup.find("a", class_="next-page")
-    if next_button:
-        next_page_url = next_button["href"]
-        driver.get(next_page_url)
-        time.sleep(5)  # Wait for JavaScript to load
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        outlets.extend(extract_data(soup))
-    else:
-        break
 
-driver.quit()  # Close the browser
+# ✅ Scraping Workers (one page source each, regions pulled from a shared queue)
+def fetch_with_retry(source, term, page_no, url):
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            return source.fetch(term, page_no, url)
+        except WebDriverException as e:  # ✅ Includes TimeoutException from the explicit waits
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"⚠️ '{term}' page {page_no} failed ({e.__class__.__name__}), retry {attempt}/{MAX_RETRIES - 1}")
+            time.sleep(RETRY_BACKOFF * attempt)
+
+
+def scrape_region(source, term, results, record_dir=None):
+    """Follows the pagination of one search term, putting each page's outlets on `results`."""
+    page_no, url = 1, None
+    while True:
+        page_html = fetch_with_retry(source, term, page_no, url)
+        if record_dir:
+            path = fixture_path(record_dir, term, page_no)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(page_html)
+
+        outlets, url = parse_page(page_html)
+        results.put((term, page_no, outlets))
+        if not url:
+            return page_no
+        page_no += 1
+
+
+def scrape_worker(make_source, regions, results, failed, record_dir=None):
+    source = make_source()
+    try:
+        while True:
+            try:
+                term = regions.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                pages = scrape_region(source, term, results, record_dir)
+                print(f"✅ '{term}': {pages} page(s)")
+            except Exception as e:
+                failed.append(term)
+                print(f"❌ Giving up on '{term}': {e}")
+    finally:
+        source.close()
 
-# ✅ Debugging: Print extracted data
-#print("Extracted Data:", outlets)
 
 # ✅ Insert or Update Data in MySQL Table
-for outlet in outlets:
-    name, address, operating_hours, latitude, longitude, waze_link = outlet
-
-    # Check if the record already exists
-    check_query = text("SELECT COUNT(*) FROM subway_outlets WHERE name = :name AND address = :address")
-    result = session.execute(check_query, {"name": name, "address": address}).scalar()
-
-    if result == 0:
-        # If not exists, INSERT
-        insert_query = text("""
-            INSERT INTO subway_outlets (name, address, operating_hours, latitude, longitude, waze_link)
-            VALUES (:name, :address, :operating_hours, :latitude, :longitude, :waze_link)
-        """)
-        session.execute(insert_query, {
-            "name": name, "address": address, "operating_hours": operating_hours,
-            "latitude": latitude, "longitude": longitude, "waze_link": waze_link
-        })
+def outlet_row(name, address, operating_hours, latitude, longitude, waze_link):
+    # ✅ Parse operating hours once here, so the API never has to re-parse the free text
+    schedule = parse_operating_hours(operating_hours)
+    return {
+        "name": name, "address": address, "operating_hours": operating_hours,
+        "latitude": latitude, "longitude": longitude, "waze_link": waze_link,
+        "operating_schedule": json.dumps(schedule) if schedule else None,
+    }
+
+
+def write_outlets(results, session_factory=SessionLocal, geocode=True):
+    """
+    Single writer: consumes pages from `results` until a None sentinel, geocodes the outlets
+    in one batch, then upserts them in one transaction. Outlets found by several overlapping
+    searches are written once. New/changed outlets land in the `outlet_changes` outbox in the same
+    transaction, so the running API picks them up within seconds.
+    """
+    scraped = {}
+    stats = {"pages": 0, "outlets": 0, "duplicates": 0}
+    while True:
+        item = results.get()
+        if item is None:
+            break
+        _, _, outlets = item
+        stats["pages"] += 1
+        for outlet in outlets:
+            if outlet[:2] in scraped:
+                stats["duplicates"] += 1
+                continue
+            scraped[outlet[:2]] = outlet
+    stats["outlets"] = len(scraped)
+
+    # ✅ Fetch latitude & longitude using Google Maps API (cached, concurrent, rate-limited)
+    coordinates = get_coordinates_many([address for _, address in scraped]) if geocode else {}
+    rows = [
+        outlet_row(name, address, operating_hours, *coordinates.get(address, (None, None)), waze_link)
+        for name, address, operating_hours, waze_link in scraped.values()
+    ]
+
+    with session_factory() as session:
+        with session.begin():  # ✅ One transaction, committed once
+            stats.update(bulk_upsert_outlets(session, rows))
+            stats["data_version"] = session.query(func.max(OutletChange.version)).scalar() or 0
+    return stats
+
+
+def run_pipeline(regions=None, workers=DEFAULT_WORKERS, replay_dir=None, replay_latency=0.0,
+                 record_dir=None, geocode=True, session_factory=SessionLocal):
+    """
+    Scrapes `regions` (search terms) with a pool of `workers` browsers, or replays saved HTML
+    from `replay_dir`, and writes the outlets to the database through a single writer.
+    """
+    init_db()
+    if regions is None:
+        regions = sorted(os.listdir(replay_dir)) if replay_dir else DEFAULT_REGIONS
+
+    if replay_dir:
+        make_source = lambda: FixturePageSource(replay_dir, replay_latency)
     else:
-        # If exists, UPDATE
-        update_query = text("""
-            UPDATE subway_outlets 
-            SET operating_hours = :operating_hours, latitude = :latitude, longitude = :longitude, waze_link = :waze_link 
-            WHERE name = :name AND address = :address
-        """)
-        session.execute(update_query, {
-            "name": name, "address": address, "operating_hours": operating_hours,
-            "latitude": latitude, "longitude": longitude, "waze_link": waze_link
-        })
-
-    session.commit()  # Commit after each operation
-
-session.close()
-
-print("✅ Data successfully scraped, inserted/updated in MySQL!")
+        driver_path = ChromeDriverManager().install()  # ✅ Once, not per worker
+        make_source = lambda: BrowserPageSource(driver_path)
+
+    tasks = queue.Queue()
+    for term in regions:
+        tasks.put(term)
+    results = queue.Queue(maxsize=workers * 4)  # ✅ Backpressure if the writer falls behind
+    failed = []
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=scrape_worker, args=(make_source, tasks, results, failed, record_dir), daemon=True)
+        for _ in range(max(1, min(workers, len(regions))))
+    ]
+    for thread in threads:
+        thread.start()
+
+    def close_results():
+        for thread in threads:
+            thread.join()
+        results.put(None)
+
+    threading.Thread(target=close_results, daemon=True).start()
+    stats = write_outlets(results, session_factory, geocode)
+    stats["failed_regions"] = failed
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+
+    print(f"✅ Data successfully scraped, inserted/updated in MySQL! {stats['outlets']} outlets from "
+          f"{stats['pages']} pages across {len(regions)} regions in {stats['seconds']}s "
+          f"({stats['inserted']} inserted, {stats['updated']} updated, {stats['unchanged']} unchanged; "
+          f"data version {stats['data_version']})")
+    if failed:
+        print(f"❌ Failed regions: {', '.join(failed)}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Subway Malaysia outlets into MySQL")
+    parser.add_argument("--regions", nargs="+", help="Search terms (default: every state, or every replay fixture)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel browsers")
+    parser.add_argument("--replay", metavar="DIR", help="Replay saved HTML fixtures instead of using a browser")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="Simulated seconds per replayed page")
+    parser.add_argument("--record", metavar="DIR", help="Save every scraped page as a replay fixture")
+    parser.add_argument("--no-geocode", action="store_true", help="Skip Google Maps geocoding")
+    args = parser.parse_args()
+
+    run_pipeline(
+        regions=args.regions, workers=args.workers, replay_dir=args.replay, replay_latency=args.replay_latency,
+        record_dir=args.record, geocode=not args.no_geocode,
+    )
@@ -0,0 +1,103 @@
+import re
+from array import array
+import secrets
+import time
+from collections import OrderedDict, deque
+
+# ✅ Session Store Defaults
+DEFAULT_TTL_SECONDS = 1800  # Idle sessions expire after 30 minutes
+DEFAULT_MAX_SESSIONS = 10000  # LRU bound per worker
+DEFAULT_MAX_OUTLETS = 200  # Outlet ids remembered per session
+DEFAULT_SUMMARY_CHARS = 600  # Rolling conversation summary, oldest turns dropped first
+TURN_QUERY_CHARS = 120  # Each turn's question is cut to this length in the summary
+FOLLOW_UP_PATTERN = re.compile(r"\b(those|these|them|they|that one|the same|above)\b")
+
+
+def is_follow_up(query):
+    """True for queries that refer back to the previous answer ("which of those is open latest?")."""
+    return bool(FOLLOW_UP_PATTERN.search(query))
+
+
+class Session:
+    """
+    What the server remembers about one conversation, bounded in size:
+    - `outlet_ids`: the outlets of the last answer (at most `max_outlets`, packed in an int array)
+    - `summary`: one compact line per turn (at most `summary_chars` characters)
+    """
+
+    __slots__ = ("id", "outlet_ids", "turns", "max_outlets", "summary_chars", "expires_at")
+
+    def __init__(self, session_id, max_outlets=DEFAULT_MAX_OUTLETS, summary_chars=DEFAULT_SUMMARY_CHARS):
+        self.id = session_id
+        self.outlet_ids = array("i")
+        self.turns = deque()
+        self.max_outlets = max_outlets
+        self.summary_chars = summary_chars
+        self.expires_at = 0.0
+
+    @property
+    def summary(self):
+        return "\n".join(self.turns)
+
+    def record(self, query, outlet_ids, outlet_names=()):
+        """Remembers the answer's outlet set and appends the turn to the rolling summary."""
+        if outlet_ids is not None:
+            self.outlet_ids = array("i", list(outlet_ids)[:self.max_outlets])  # ✅ 4 bytes per id
+
+        names = ", ".join(list(outlet_names)[:3])
+        more = len(self.outlet_ids) - min(len(self.outlet_ids), 3)
+        turn = f"Q: {query[:TURN_QUERY_CHARS]} → {len(self.outlet_ids)} outlet(s)"
+        if names:
+            turn += f": {names}{f' (+{more} more)' if more > 0 else ''}"
+        self.turns.append(turn)
+
+        # ✅ Compact: drop the oldest turns once the summary outgrows its budget
+        while len(self.turns) > 1 and sum(len(t) + 1 for t in self.turns) > self.summary_chars:
+            self.turns.popleft()
+
+
+class SessionStore:
+    """
+    In-process LRU + TTL store of conversation sessions (one copy per worker).
+    Unknown, expired or malformed session ids start a fresh session under a new server-generated id.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_sessions=DEFAULT_MAX_SESSIONS, max_outlets=DEFAULT_MAX_OUTLETS,
+                 summary_chars=DEFAULT_SUMMARY_CHARS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_outlets = max_outlets
+        self.summary_chars = summary_chars
+        self._sessions = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    def get_or_create(self, session_id=None):
+        now = time.time()
+        # ✅ LRU order is also expiry order: drop expired sessions from the old end
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.expires_at >= now:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            session_id = secrets.token_urlsafe(16)  # ✅ Never adopt a client-chosen id: only ids this server issued resume
+            session = Session(session_id, self.max_outlets, self.summary_chars)
+            self._sessions[session_id] = session
+            self.created += 1
+
+        session.expires_at = now + self.ttl
+        self._sessions.move_to_end(session_id)  # ✅ Mark as most recently used
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)  # ✅ Evict least recently used
+            self.evicted += 1
+        return session
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        return {"sessions": len(self._sessions), "created": self.created, "evicted": self.evicted}
@@ -0,0 +1,91 @@
+import asyncio
+
+
+class SharedStream:
+    """
+    Runs one async iterator in a background task and replays its chunks to any number of subscribers.
+    Late subscribers get the chunks produced so far, then follow along live.
+    """
+
+    def __init__(self, source):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Condition()
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source):
+        try:
+            async for chunk in source:
+                async with self._changed:
+                    self.chunks.append(chunk)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.chunks) or self.done)
+                new_chunks, done = self.chunks[position:], self.done
+            for chunk in new_chunks:
+                yield chunk
+            position += len(new_chunks)
+            if done and position >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight work: concurrent callers with the same key share one computation.
+    - `do()` for awaitables: every caller gets the leader's result (or exception)
+    - `stream()` for async iterators: every subscriber receives the leader's chunks
+    The shared work runs in its own task, so a caller that disconnects doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def in_flight(self, key):
+        return key in self._calls or key in self._streams
+
+    def _track(self, registry, key, entry, task):
+        registry[key] = entry
+        self.leaders += 1
+
+        def forget(_):
+            if registry.get(key) is entry:
+                del registry[key]
+
+        task.add_done_callback(forget)
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._track(self._calls, key, task, task)
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def stream(self, key, source_factory):
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = SharedStream(source_factory())
+            self._track(self._streams, key, shared, shared.task)
+        else:
+            self.followers += 1
+        return shared.subscribe()
+
+    def stats(self):
+        return {"in_flight": len(self._calls) + len(self._streams), "leaders": self.leaders, "coalesced": self.followers}
@@ -0,0 +1,302 @@
+import hashlib
+import mmap
+import os
+import struct
+from collections.abc import Mapping, Sequence
+import numpy as np
+import orjson
+from schemas import SubwayOutletSchema
+from operating_hours import load_schedule
+from outlet_fragments import build_fragments
+from compression import brotli, compress
+
+# ✅ Packed Outlet Snapshot File
+# One refresher writes the outlet table into a single file; every worker maps it read-only, so
+# the columns, string table, rendered answer fragments and pre-serialized / pre-compressed
+# `GET /outlets` bodies live once in the OS page cache no matter how many workers run.
+#
+# Layout: MAGIC | header length (uint32) | JSON header | 64-byte aligned sections
+# - `ids` int64, `latitude` / `longitude` float64 (NaN = no coordinates), sorted by id
+# - `string_offsets` uint64 (rows * fields + 1) and `string_nulls` uint8 into the UTF-8 `strings` blob
+# - `key_hashes` / `key_rows` int64: (name, address) hash → row, sorted by hash
+# - `body` (JSON list of outlets), `body.gzip` and `body.br` (if brotli is installed)
+# The header's optional `changes` ({"base": version, "ids": [...]}) names the change batch that produced
+# the file from an earlier version, so workers holding that version can patch their indexes.
+MAGIC = b"SUBWAYSNAP2\n"
+ALIGNMENT = 64
+OUTLET_FIELDS = ("name", "address", "operating_hours", "waze_link", "operating_schedule")
+FRAGMENT_FIELDS = ("head", "tail", *(f"day_{day}" for day in range(7)), "list_item", "prompt_line")
+STRING_FIELDS = OUTLET_FIELDS + FRAGMENT_FIELDS
+
+
+def key_hash(name, address):
+    """Signed 64-bit hash of an outlet's (name, address) key."""
+    digest = hashlib.blake2b(f"{name}\0{address}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def snapshot_body(outlets):
+    """The `GET /outlets` JSON bytes and their content version (same hash as `OutletSnapshot.version`)."""
+    body = orjson.dumps([outlet.model_dump() for outlet in outlets])
+    return body, hashlib.sha1(body).hexdigest()[:16]
+
+
+def read_version(path):
+    """Data version stored in an existing snapshot file (None if missing or unreadable)."""
+    try:
+        with open(path, "rb") as file:
+            return _read_header(file.read(len(MAGIC) + 4), file.read).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def _read_header(prefix, read):
+    if len(prefix) < len(MAGIC) + 4 or not prefix.startswith(MAGIC):
+        raise ValueError("Not an outlet snapshot file")
+    (length,) = struct.unpack("<I", prefix[len(MAGIC):])
+    return orjson.loads(read(length))
+
+
+def write_snapshot_file(path, outlets, schedules, changes=None):
+    """
+    Packs `outlets` (sorted by id) and their schedules into `path`, atomically.
+    `changes` is recorded in the header (see above). Returns the data version; an existing file
+    with the same version is left untouched.
+    """
+    outlets = sorted(outlets, key=lambda outlet: outlet.id)
+    body, version = snapshot_body(outlets)
+    if read_version(path) == version:
+        return version
+
+    # ✅ String table: every field and rendered fragment of every outlet, back to back, addressed by offset
+    fragments = build_fragments(outlets, schedules)
+    chunks, offsets, nulls = [], [0], []
+    for outlet in outlets:
+        schedule = schedules.get(outlet.id)
+        fragment = fragments[outlet.id]
+        values = [getattr(outlet, field) for field in OUTLET_FIELDS[:-1]]
+        values += [orjson.dumps(schedule).decode() if schedule else None, fragment.head, fragment.tail,
+                   *fragment.day_lines, fragment.list_item, fragment.prompt_line]
+        for value in values:
+            encoded = value.encode("utf-8") if value is not None else b""
+            chunks.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            nulls.append(value is None)
+
+    coordinate = lambda value: np.nan if value is None else value
+    hashes = np.array([key_hash(outlet.name, outlet.address) for outlet in outlets], dtype=np.int64)
+    key_order = np.argsort(hashes, kind="stable")
+    sections = {
+        "ids": np.array([outlet.id for outlet in outlets], dtype=np.int64),
+        "latitude": np.array([coordinate(outlet.latitude) for outlet in outlets], dtype=np.float64),
+        "longitude": np.array([coordinate(outlet.longitude) for outlet in outlets], dtype=np.float64),
+        "string_offsets": np.array(offsets, dtype=np.uint64),
+        "string_nulls": np.array(nulls, dtype=np.uint8),
+        "key_hashes": hashes[key_order],
+        "key_rows": key_order.astype(np.int64),
+        "strings": b"".join(chunks),
+        "body": body,
+    }
+    for encoding in ("gzip", "br") if brotli is not None else ("gzip",):
+        sections[f"body.{encoding}"] = compress(body, encoding, best=True)  # ✅ Compressed once, for every worker
+
+    # ✅ Header first (section offsets are relative to the aligned start of the data area)
+    table, position = {}, 0
+    for name, data in sections.items():
+        raw = data.tobytes() if isinstance(data, np.ndarray) else data
+        dtype = data.dtype.str if isinstance(data, np.ndarray) else None
+        table[name] = [position, len(raw), dtype]
+        sections[name] = raw
+        position += -(-len(raw) // ALIGNMENT) * ALIGNMENT
+    header = {"version": version, "count": len(outlets), "fields": STRING_FIELDS, "sections": table}
+    if changes is not None:
+        header["changes"] = changes
+    header = orjson.dumps(header)
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for name, raw in sections.items():
+            file.seek(data_start + table[name][0])
+            file.write(raw)
+        file.truncate(data_start + position)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)  # ✅ Atomic: workers see the old file or the new one, never a partial write
+    return version
+
+
+class SnapshotFile:
+    """
+    Read-only, memory-mapped view of a snapshot file.
+    Columns are NumPy arrays and bodies are memoryviews straight over the mapping (zero-copy).
+    The mapping stays valid after the file is replaced; it is released once nothing references it.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.stat = os.fstat(file.fileno())
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        prefix = len(MAGIC) + 4
+        header = _read_header(self._map[:prefix], lambda length: self._map[prefix:prefix + length])
+        (header_length,) = struct.unpack("<I", self._map[len(MAGIC):prefix])
+        self._data_start = -(-(prefix + header_length) // ALIGNMENT) * ALIGNMENT
+        self._sections = header["sections"]
+        self.version = header["version"]
+        self.count = header["count"]
+        self.fields = tuple(header["fields"])
+        self.changes = header.get("changes")
+
+        self.ids = self.array("ids")
+        self.latitudes = self.array("latitude")
+        self.longitudes = self.array("longitude")
+        self._offsets = self.array("string_offsets")
+        self._nulls = self.array("string_nulls")
+        self._strings = self.section("strings")
+        self._key_hashes = self.array("key_hashes")
+        self._key_rows = self.array("key_rows")
+
+    def __len__(self):
+        return self.count
+
+    def section(self, name):
+        """Raw bytes of a section as a memoryview over the mapping (None if absent)."""
+        if name not in self._sections:
+            return None
+        offset, length, _ = self._sections[name]
+        start = self._data_start + offset
+        return memoryview(self._map)[start:start + length]
+
+    def array(self, name):
+        offset, length, dtype = self._sections[name]
+        return np.frombuffer(self._map, dtype=np.dtype(dtype), count=length // np.dtype(dtype).itemsize,
+                             offset=self._data_start + offset)
+
+    def string(self, row, field):
+        index = row * len(self.fields) + self.fields.index(field)
+        if self._nulls[index]:
+            return None
+        return str(self._strings[int(self._offsets[index]):int(self._offsets[index + 1])], "utf-8")
+
+    def row_of(self, outlet_id):
+        """Row of an outlet id (binary search over the id column), or None."""
+        row = int(np.searchsorted(self.ids, outlet_id))
+        return row if row < self.count and self.ids[row] == outlet_id else None
+
+    def row_of_key(self, name, address):
+        """Row of a (name, address) key (binary search over the key hashes), or None."""
+        target = key_hash(name, address)
+        position = int(np.searchsorted(self._key_hashes, target))
+        while position < self.count and self._key_hashes[position] == target:
+            row = int(self._key_rows[position])
+            if self.string(row, "name") == name and self.string(row, "address") == address:
+                return row
+            position += 1
+        return None
+
+    def outlet(self, row):
+        """Outlet schema for one row, decoded on demand (validated when the file was written, so not re-validated)."""
+        latitude, longitude = float(self.latitudes[row]), float(self.longitudes[row])
+        return SubwayOutletSchema.model_construct(
+            id=int(self.ids[row]),
+            name=self.string(row, "name"),
+            address=self.string(row, "address"),
+            operating_hours=self.string(row, "operating_hours"),
+            latitude=None if latitude != latitude else latitude,  # ✅ NaN → None
+            longitude=None if longitude != longitude else longitude,
+            waze_link=self.string(row, "waze_link"),
+        )
+
+    def schedule(self, row):
+        return load_schedule(self.string(row, "operating_schedule"))
+
+
+# ✅ Lazy views: nothing per outlet is copied onto a worker's heap until a request reads it
+class MappedOutlets(Sequence):
+    """The outlets of a snapshot file in id order, decoded on access."""
+
+    def __init__(self, mapped):
+        self.mapped = mapped
+
+    def __len__(self):
+        return self.mapped.count
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.mapped.outlet(i) for i in range(*row.indices(self.mapped.count))]
+        if row < 0:
+            row += self.mapped.count
+        if not 0 <= row < self.mapped.count:
+            raise IndexError(row)
+        return self.mapped.outlet(row)
+
+
+class MappedById(Mapping):
+    """{outlet id: value} over a snapshot file; `value(mapped, row)` decodes one entry."""
+
+    def __init__(self, mapped, value):
+        self.mapped = mapped
+        self.value = value
+
+    def __getitem__(self, outlet_id):
+        row = self.mapped.row_of(outlet_id) if isinstance(outlet_id, (int, np.integer)) else None
+        if row is None:
+            raise KeyError(outlet_id)
+        return self.value(self.mapped, row)
+
+    def __contains__(self, outlet_id):
+        return isinstance(outlet_id, (int, np.integer)) and self.mapped.row_of(outlet_id) is not None
+
+    def __iter__(self):
+        return iter(self.mapped.ids.tolist())
+
+    def __len__(self):
+        return self.mapped.count
+
+
+class MappedByKey(Mapping):
+    """{(name, address): value} over a snapshot file, through the hashed key index."""
+
+    def __init__(self, mapped, value):
+        self.mapped = mapped
+        self.value = value
+
+    def __getitem__(self, key):
+        row = self.mapped.row_of_key(*key) if isinstance(key, tuple) and len(key) == 2 else None
+        if row is None:
+            raise KeyError(key)
+        return self.value(self.mapped, row)
+
+    def __iter__(self):
+        return ((self.mapped.string(row, "name"), self.mapped.string(row, "address")) for row in range(self.mapped.count))
+
+    def __len__(self):
+        return self.mapped.count
+
+
+class MappedFragments:
+    """`OutletFragments` interface over one row's pre-rendered strings."""
+
+    __slots__ = ("mapped", "row")
+
+    def __init__(self, mapped, row):
+        self.mapped = mapped
+        self.row = row
+
+    head = property(lambda self: self.mapped.string(self.row, "head"))
+    tail = property(lambda self: self.mapped.string(self.row, "tail"))
+    list_item = property(lambda self: self.mapped.string(self.row, "list_item"))
+    prompt_line = property(lambda self: self.mapped.string(self.row, "prompt_line"))
+
+    @property
+    def day_lines(self):
+        return tuple(self.mapped.string(self.row, f"day_{day}") for day in range(7))
+
+    def card(self, weekday=None):
+        if weekday is None:
+            return self.head + self.tail
+        return self.head + self.mapped.string(self.row, f"day_{weekday}") + self.tail
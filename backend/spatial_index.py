@@ -0,0 +1,223 @@
+import math
+import numpy as np
+
+# ✅ Spatial Index Configuration
+EARTH_RADIUS_M = 6371000  # Earth radius in meters (same value the map uses)
+DEFAULT_RADIUS_M = 5000  # 5KM catchment circle drawn around every outlet
+DEFAULT_CELL_SIZE_DEG = 0.05  # ~5.5KM grid cells around Malaysia's latitudes
+
+
+def haversine_m(lat, lon, lats, lons):
+    """
+    Vectorized haversine distance (meters) from one point to arrays of points.
+    """
+    lat_r = np.radians(lat)
+    lats_r = np.radians(lats)
+    d_lat = lats_r - lat_r
+    d_lon = np.radians(lons) - np.radians(lon)
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat_r) * np.cos(lats_r) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """
+    Grid index over outlet coordinates.
+    - Outlets are bucketed into fixed-size lat/lng cells
+    - Queries only compute distances for outlets in the cells covering the search circle
+    - Outlets without coordinates are skipped
+    """
+
+    def __init__(self, outlets, cell_size_deg=DEFAULT_CELL_SIZE_DEG, columns=None):
+        """
+        `columns` = (ids, lats, lons) arrays (NaN = no coordinates), e.g. a mapped snapshot file's; used without copying.
+        `outlets` is then an {id: outlet} mapping, only read for the hits a query returns.
+        """
+        self.cell_size = cell_size_deg
+        if columns is not None:
+            ids, lats, lons = columns
+            located = ~(np.isnan(lats) | np.isnan(lons))
+            if not located.all():
+                ids, lats, lons = ids[located], lats[located], lons[located]
+            self.ids, self.lats, self.lons = ids, lats, lons
+            self.outlets = outlets
+        else:
+            located = [o for o in outlets if o.latitude is not None and o.longitude is not None]
+            self.outlets = {o.id: o for o in located}
+            self.ids = np.array([o.id for o in located], dtype=np.int64)
+            self.lats = np.array([o.latitude for o in located], dtype=np.float64)
+            self.lons = np.array([o.longitude for o in located], dtype=np.float64)
+
+        # ✅ Bucket row positions by grid cell
+        buckets = {}
+        for row, cell in enumerate(zip(self._cell(self.lats), self._cell(self.lons))):
+            buckets.setdefault(cell, []).append(row)
+        self.cells = {cell: np.array(rows, dtype=np.int64) for cell, rows in buckets.items()}
+        self.rows = {outlet_id: row for row, outlet_id in enumerate(self.ids.tolist())}
+
+        self._overlap_cache = {}
+
+    def with_changes(self, outlets, deleted_ids=(), lookup=None):
+        """
+        New index with `outlets` ({id: outlet}) added or moved and `deleted_ids` dropped; this one is left untouched.
+        Only the grid cells of touched outlets are rewritten: a removed row is filled with the last row
+        (so the arrays stay compact) and new positions are appended.
+        `lookup` replaces the {id: outlet} mapping (e.g. a newer mapped snapshot's); otherwise it is copied and updated.
+        """
+        index = SpatialIndex.__new__(SpatialIndex)
+        index.cell_size = self.cell_size
+        index.ids, index.lats, index.lons = self.ids.copy(), self.lats.copy(), self.lons.copy()
+        index.cells = dict(self.cells)
+        index.rows = dict(self.rows)
+        index.outlets = lookup if lookup is not None else dict(self.outlets)
+        index._overlap_cache = {}
+
+        edited = {}  # cell → row list, copied from `index.cells` on first touch
+
+        def cell_rows(row):
+            cell = (index._cell(index.lats[row]), index._cell(index.lons[row]))
+            if cell not in edited:
+                edited[cell] = index.cells[cell].tolist() if cell in index.cells else []
+            return edited[cell]
+
+        size = len(index.ids)
+        for outlet_id in outlets.keys() | set(deleted_ids):
+            row = index.rows.pop(outlet_id, None)
+            if lookup is None:
+                index.outlets.pop(outlet_id, None)
+            if row is None:
+                continue
+            cell_rows(row).remove(row)
+            size -= 1
+            if row != size:
+                # ✅ Move the last row into the gap
+                index.ids[row], index.lats[row], index.lons[row] = index.ids[size], index.lats[size], index.lons[size]
+                rows = cell_rows(row)
+                rows[rows.index(size)] = row
+                index.rows[int(index.ids[row])] = row
+
+        located = [o for o in outlets.values() if o.latitude is not None and o.longitude is not None]
+        index.ids = np.concatenate([index.ids[:size], np.array([o.id for o in located], dtype=np.int64)])
+        index.lats = np.concatenate([index.lats[:size], np.array([o.latitude for o in located], dtype=np.float64)])
+        index.lons = np.concatenate([index.lons[:size], np.array([o.longitude for o in located], dtype=np.float64)])
+        for row, outlet in enumerate(located, start=size):
+            index.rows[outlet.id] = row
+            cell_rows(row).append(row)
+            if lookup is None:
+                index.outlets[outlet.id] = outlet
+
+        for cell, rows in edited.items():
+            if rows:
+                index.cells[cell] = np.array(rows, dtype=np.int64)
+            else:
+                index.cells.pop(cell, None)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell(self, degrees):
+        return np.floor(np.asarray(degrees) / self.cell_size).astype(np.int64).tolist()
+
+    def _candidate_rows(self, lat, lon, radius_m):
+        """Row positions of outlets in every grid cell touched by the circle's bounding box."""
+        d_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + d_lat, 89.9))), 1e-6)
+        d_lon = d_lat / cos_lat
+
+        lat_lo, lat_hi = self._cell([lat - d_lat, lat + d_lat])
+        lon_lo, lon_hi = self._cell([lon - d_lon, lon + d_lon])
+
+        # ✅ Large radius: scanning every bucket is cheaper than walking empty cells
+        if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) >= len(self.cells):
+            return np.arange(len(self.ids))
+
+        rows = [
+            self.cells[(i, j)]
+            for i in range(lat_lo, lat_hi + 1)
+            for j in range(lon_lo, lon_hi + 1)
+            if (i, j) in self.cells
+        ]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def within_radius(self, lat, lon, radius_m=DEFAULT_RADIUS_M, limit=None):
+        """
+        Returns [(outlet, distance_m)] for outlets within `radius_m`, nearest first.
+        """
+        rows = self._candidate_rows(lat, lon, radius_m)
+        if rows.size == 0:
+            return []
+
+        distances = haversine_m(lat, lon, self.lats[rows], self.lons[rows])
+        mask = distances <= radius_m
+        rows, distances = rows[mask], distances[mask]
+
+        order = np.argsort(distances, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [(self.outlets[int(self.ids[rows[i]])], float(distances[i])) for i in order]
+
+    def within_bbox(self, south, west, north, east):
+        """
+        Returns the ids (ascending) of outlets inside the lat/lng box, e.g. the map's viewport.
+        """
+        lat_lo, lat_hi = self._cell([south, north])
+        lon_lo, lon_hi = self._cell([west, east])
+
+        if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) >= len(self.cells):
+            rows = np.arange(len(self.ids))
+        else:
+            rows = [
+                self.cells[(i, j)]
+                for i in range(lat_lo, lat_hi + 1)
+                for j in range(lon_lo, lon_hi + 1)
+                if (i, j) in self.cells
+            ]
+            rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+        lats, lons = self.lats[rows], self.lons[rows]
+        mask = (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+        return np.sort(self.ids[rows[mask]])
+
+    def nearest(self, lat, lon, k=5):
+        """
+        Returns the `k` nearest outlets as [(outlet, distance_m)].
+        Grows the search circle until it holds at least `k` outlets.
+        """
+        if k <= 0 or len(self.ids) == 0:
+            return []
+
+        radius_m = self.cell_size * (math.pi / 180) * EARTH_RADIUS_M
+        while self._candidate_rows(lat, lon, radius_m).size < len(self.ids):
+            results = self.within_radius(lat, lon, radius_m, limit=k)
+            # ✅ Every outlet inside the circle was checked, so the k found are the true k nearest
+            if len(results) >= k:
+                return results
+            radius_m *= 2
+
+        # ✅ Search circle covers the whole index: rank every outlet
+        distances = haversine_m(lat, lon, self.lats, self.lons)
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(self.outlets[int(self.ids[i])], float(distances[i])) for i in order]
+
+    def overlap_pairs(self, radius_m=DEFAULT_RADIUS_M):
+        """
+        Returns [(id_a, id_b, distance_m)] for every outlet pair within `radius_m` of each other.
+        Pairs are computed once per radius and cached on the index.
+        """
+        if radius_m in self._overlap_cache:
+            return self._overlap_cache[radius_m]
+
+        pairs = []
+        for row in range(len(self.ids)):
+            lat, lon = self.lats[row], self.lons[row]
+            candidates = self._candidate_rows(lat, lon, radius_m)
+            candidates = candidates[self.ids[candidates] > self.ids[row]]  # ✅ Each pair only once, lower id first
+            if candidates.size == 0:
+                continue
+
+            distances = haversine_m(lat, lon, self.lats[candidates], self.lons[candidates])
+            for other, distance in zip(candidates[distances <= radius_m], distances[distances <= radius_m]):
+                pairs.append((int(self.ids[row]), int(self.ids[other]), float(distance)))
+
+        self._overlap_cache[radius_m] = pairs
+        return pairs
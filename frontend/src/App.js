@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import { MapContainer, TileLayer, Marker, Popup, Circle, Tooltip, useMap } from "react-leaflet";
+import { MapContainer, TileLayer, Marker, Popup, Circle, Tooltip, useMapEvents } from "react-leaflet";
 import L from "leaflet";
 import "leaflet/dist/leaflet.css";
 import "./App.css"; // ✅ Import CSS
@@ -7,6 +7,7 @@ import "./App.css"; // ✅ Import CSS
 // Default map center (Kuala Lumpur)
 const CENTER = [3.140853, 101.693207];
 const RADIUS = 5000; // 5KM in meters
+const PAGE_SIZE = 1000; // Markers per /outlets page
 
 // ✅ Custom Subway Icon
 const subwayIcon = new L.Icon({
@@ -16,54 +17,89 @@ const subwayIcon = new L.Icon({
   popupAnchor: [0, -35]
 });
 
-// ✅ Function to Auto-Adjust Map to Fit All Markers
-const FitBounds = ({ outlets }) => {
-  const map = useMap();
+// ✅ Fetch the markers inside the visible map area (keyset-paginated) whenever the map stops moving
+const fetchViewportMarkers = async (bounds, signal) => {
+  const params = new URLSearchParams({
+    fields: "marker",
+    south: bounds.getSouth(),
+    west: bounds.getWest(),
+    north: bounds.getNorth(),
+    east: bounds.getEast(),
+    limit: PAGE_SIZE
+  });
+  const markers = [];
+  let cursor = null;
+  do {
+    if (cursor) params.set("after", cursor);
+    const response = await fetch(`http://127.0.0.1:8000/outlets?${params}`, { signal });
+    if (!response.ok) throw new Error(`Outlet request failed (${response.status})`);
+    markers.push(...(await response.json()));
+    cursor = response.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return markers;
+};
+
+const ViewportOutlets = ({ onOutlets, onError }) => {
+  const [bounds, setBounds] = useState(null);
+  const map = useMapEvents({ moveend: () => setBounds(map.getBounds()) });
+
+  useEffect(() => setBounds(map.getBounds()), [map]);
+
   useEffect(() => {
-    if (outlets.length > 0) {
-      const bounds = L.latLngBounds(outlets.map(outlet => [outlet.latitude, outlet.longitude]));
-      map.fitBounds(bounds, { padding: [50, 50] });
-    }
-  }, [outlets, map]);
+    if (!bounds) return;
+    const controller = new AbortController(); // ✅ Drop stale responses when the map moves again
+    fetchViewportMarkers(bounds.pad(0.2), controller.signal)
+      .then(onOutlets)
+      .catch(error => {
+        if (error.name === "AbortError") return;
+        console.error("Error fetching outlets:", error);
+        onError("Failed to load Subway outlets.");
+      });
+    return () => controller.abort();
+  }, [bounds, onOutlets, onError]);
   return null;
 };
 
+// ✅ Popup details (address, hours, Waze link) are loaded when a marker is opened
+const OutletDetails = ({ outlet }) => {
+  const [details, setDetails] = useState(null);
+  useEffect(() => {
+    fetch(`http://127.0.0.1:8000/outlets/${outlet.id}`)
+      .then(response => response.json())
+      .then(data => setDetails(data))
+      .catch(error => console.error("Error fetching outlet details:", error));
+  }, [outlet.id]);
+
+  if (!details) return <><strong>{outlet.name}</strong><br />Loading...</>;
+  return (
+    <>
+      <strong>{details.name}</strong><br />
+      {details.address}<br />
+      ⏰ {details.operating_hours} <br />
+      <a href={details.waze_link} target="_blank" rel="noopener noreferrer">🚗 Open in Waze</a>
+    </>
+  );
+};
+
 const App = () => {
   const [outlets, setOutlets] = useState([]);
+  const [highlightedIds, setHighlightedIds] = useState(new Set()); // ✅ Outlets with overlapping 5KM circles
   const [query, setQuery] = useState("");
   const [messages, setMessages] = useState([]); // ✅ Store full chat history
   const [loading, setLoading] = useState(false);
+  const [streaming, setStreaming] = useState(false); // ✅ True once the first answer chunk has arrived
   const [error, setError] = useState(null);
+  const [sessionId, setSessionId] = useState(null); // ✅ Server-side conversation session (enables follow-up questions)
 
-  // ✅ Fetch Subway Outlets from FastAPI
+  // ✅ Overlapping 5KM circles are precomputed by the backend spatial index
   useEffect(() => {
-    fetch("http://127.0.0.1:8000/outlets")
+    fetch(`http://127.0.0.1:8000/outlets/overlaps?radius=${RADIUS}`)
       .then(response => response.json())
-      .then(data => setOutlets(data))
-      .catch(error => {
-        console.error("Error fetching outlets:", error);
-        setError("Failed to load Subway outlets.");
-      });
+      .then(data => setHighlightedIds(new Set(data.highlighted_ids)))
+      .catch(error => console.error("Error fetching outlet overlaps:", error));
   }, []);
 
-  // ✅ Function to Check 5KM Intersection
-  const isIntersecting = (lat1, lon1, lat2, lon2) => {
-    if (!lat1 || !lon1 || !lat2 || !lon2) return false; // ✅ Prevent crashes if missing data
-
-    const toRad = (angle) => (Math.PI * angle) / 180;
-    const R = 6371000; // Earth radius in meters
-    const dLat = toRad(lat2 - lat1);
-    const dLon = toRad(lon2 - lon1);
-    const a =
-      Math.sin(dLat / 2) * Math.sin(dLat / 2) +
-      Math.cos(toRad(lat1)) * Math.cos(toRad(lat2)) *
-      Math.sin(dLon / 2) * Math.sin(dLon / 2);
-    const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1 - a));
-    const distance = R * c;
-    return distance <= RADIUS;
-  };
-
-  // ✅ Handle Chatbot Query
+  // ✅ Handle Chatbot Query (answer streams in chunk by chunk via Server-Sent Events)
   const handleChatbotQuery = async () => {
     if (!query.trim()) return;
     setLoading(true);
@@ -73,20 +109,52 @@ const App = () => {
     setMessages(newMessages);
     setQuery("");
 
+    let botText = "";
+    const showBotText = () => setMessages([...newMessages, { sender: "bot", text: botText }]); // ✅ Update bot response in place
+
     try {
-      const response = await fetch("http://127.0.0.1:8000/chatbot", {
+      const response = await fetch("http://127.0.0.1:8000/chatbot/stream", {
         method: "POST",
-        headers: { "Content-Type": "application/json", "Accept": "application/json" },
-        body: JSON.stringify({ query })
+        headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
+        body: JSON.stringify({ query, session_id: sessionId })
       });
-
-      const data = await response.json();
-      setMessages([...newMessages, { sender: "bot", text: data.response }]); // ✅ Append bot response
+      if (!response.ok) throw new Error(`Chatbot request failed (${response.status})`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // ✅ Events are separated by a blank line
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+
+        for (const rawEvent of events) {
+          const lines = rawEvent.split("\n");
+          const eventType = (lines.find(line => line.startsWith("event:")) || "event: message").slice(6).trim();
+          const dataLine = lines.find(line => line.startsWith("data:"));
+          if (!dataLine) continue;
+          const data = JSON.parse(dataLine.slice(5));
+
+          if (eventType === "error") throw new Error(data.message || data.error);
+          if (eventType === "done" && data.session_id) setSessionId(data.session_id);
+          if (data.delta) {
+            botText += data.delta;
+            setStreaming(true); // ✅ First chunk arrived: replace "Typing..." with the answer
+            showBotText();
+          }
+        }
+      }
     } catch (error) {
       console.error("Error fetching chatbot response:", error);
       setError(error.message);
     }
 
+    setStreaming(false);
     setLoading(false);
   };
 
@@ -102,26 +170,18 @@ const App = () => {
         <div className="map-wrapper">
           <MapContainer center={CENTER} zoom={12} className="map-container">
             <TileLayer url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png" attribution="&copy; OpenStreetMap contributors" />
-            <FitBounds outlets={outlets} />
-
-            {outlets.map((outlet, index) => {
-              let isHighlighted = outlets.some((otherOutlet, i) =>
-                i !== index && isIntersecting(
-                  outlet.latitude, outlet.longitude,
-                  otherOutlet.latitude, otherOutlet.longitude
-                )
-              );
+            <ViewportOutlets onOutlets={setOutlets} onError={setError} />
+
+            {outlets.map(outlet => {
+              const isHighlighted = highlightedIds.has(outlet.id);
 
               return (
-                <Marker key={index} position={[outlet.latitude, outlet.longitude]} icon={subwayIcon}>
+                <Marker key={outlet.id} position={[outlet.latitude, outlet.longitude]} icon={subwayIcon}>
                   <Tooltip direction="top" offset={[0, -25]} opacity={1} permanent={false}>
                     <strong>{outlet.name}</strong>
                   </Tooltip>
                   <Popup>
-                    <strong>{outlet.name}</strong><br />
-                    {outlet.address}<br />
-                    ⏰ {outlet.operating_hours} <br />
-                    <a href={outlet.waze_link} target="_blank" rel="noopener noreferrer">🚗 Open in Waze</a>
+                    <OutletDetails outlet={outlet} />
                   </Popup>
                   {/* ✅ Highlight Intersecting Outlets */}
                   <Circle 
@@ -153,7 +213,7 @@ const App = () => {
                 )}
               </div>
             ))}
-            {loading && <div className="loading-bubble">Typing...</div>} {/* ✅ Typing Animation */}
+            {loading && !streaming && <div className="loading-bubble">Typing...</div>} {/* ✅ Typing Animation */}
           </div>
 
           {/* ✅ Input Section */}